@@ -0,0 +1,92 @@
+"""
+Games on the Battlefield with the matrix fields and on the BitBattlefield with bitmasks.
+
+Plays the same games through the GameController with both implementations for
+every board size: places a fleet that grows with the board, then strikes random
+fields until all ships are sunk, like the server does for a SHOOT (bounds,
+already hit, strike, sunk and all sunk checks), and moves a ship every few turns
+like a MOVE (including the struck fields it moved to). Prints the time per game
+and checks that both implementations gave the same answers.
+"""
+import sys
+import time
+import random
+import argparse
+from typing import Any, List, Tuple
+from common.GameController import GameController, BATTLEFIELD_CLASSES
+from common.errorHandler.BattleshipError import BattleshipError
+from common.constants import Orientation, Direction
+from common.states import GameState
+
+
+def _fleet(length: int) -> Tuple[List[int], List[Tuple[int, int]]]:
+    """
+    Returns the ships table and the first positions of the ships (all EAST) in rows,
+    with an empty field between the ships and two rows between the rows of ships.
+    """
+    ships_table: List[int] = [max(1, (length - 4) // 6)] * 5
+    ship_lengths: List[int] = [ship_length for ship_length, number in zip([5, 5, 4, 3, 2], ships_table) for _ in range(number)]
+    positions: List[Tuple[int, int]] = []
+    x_pos: int = 0
+    y_pos: int = 0
+    for ship_length in ship_lengths:
+        if x_pos + ship_length > length:
+            x_pos = 0
+            y_pos += 3
+        positions.append((x_pos, y_pos))
+        x_pos += ship_length + 1
+    return ships_table, positions
+
+
+def _play(battlefield_class, length: int, seed: int) -> List[Any]:
+    GameController.battlefield_class = battlefield_class
+    rnd: random.Random = random.Random(seed)
+    ships_table, positions = _fleet(length)
+    ctrl: GameController = GameController(0, None, None)
+    ctrl.create_battlefield(length, ships_table)
+    for ship_id, (x_pos, y_pos) in enumerate(positions):
+        ctrl.place_ship(ship_id, x_pos, y_pos, Orientation.EAST)
+    ctrl.start_game()
+    ctrl.state = GameState.YOUR_TURN
+
+    answers: List[Any] = []
+    fields: List[Tuple[int, int]] = [(x_pos, y_pos) for x_pos in range(length) for y_pos in range(length)]
+    rnd.shuffle(fields)
+    for turn, (x_pos, y_pos) in enumerate(fields):
+        if turn % 5 == 0:
+            ship_id: int = rnd.randrange(len(positions))
+            try:
+                ctrl.move(ship_id, rnd.choice(list(Direction)))
+                answers.append(ctrl.get_moved_ship_hit_positions(ship_id))
+            except BattleshipError as e:
+                answers.append(e.error_code)
+        hit: bool = ctrl.strike(x_pos, y_pos)
+        answers.append(hit)
+        if hit:
+            answers.append(ctrl.ship_sunk_at_pos(x_pos, y_pos))
+            if ctrl.all_ships_sunk():
+                break
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sizes", help="comma separated board sizes", type=str, default="10,14,18,22,26")
+    parser.add_argument("-g", "--games", help="games per board size and implementation", type=int, default=200)
+    args = parser.parse_args()
+
+    for length in (int(size) for size in args.sizes.split(",")):
+        ships_table, _ = _fleet(length)
+        print("board size {}, {} ships".format(length, sum(ships_table)))
+        durations: List[float] = []
+        answers: List[List[Any]] = []
+        for name in ["lists", "bitboard"]:
+            start_time: float = time.perf_counter()
+            answers.append([_play(BATTLEFIELD_CLASSES[name], length, seed) for seed in range(args.games)])
+            durations.append(time.perf_counter() - start_time)
+            print("  {}: {:.2f} ms per game".format(name, 1e3 * durations[-1] / args.games))
+        print("  speedup: {:.1f}x, same answers: {}".format(durations[0] / durations[1], answers[0] == answers[1]))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Connection scaling benchmark for the two server transports.
+
+Starts server.py once per transport ("stream": StreamReader/StreamWriter and a
+task per client, "protocol": BattleshipProtocol) and opens many idle client
+connections to it, to measure the server's memory per connection. Then every
+connection sends a number of GET_GAMES messages without being logged in, each
+answered with an ERROR, to measure the messages handled per second.
+
+The memory is read from /proc, so this only works on Linux.
+"""
+import sys
+import os
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import subprocess
+from typing import List, Optional
+from common.protocol import ProtocolMessage, ProtocolMessageType
+from common.eventloop import add_event_loop_argument, create_event_loop
+
+
+class _CountingProtocol(asyncio.Protocol):
+
+    def __init__(self, counter: "_Counter") -> None:
+        self.counter = counter
+        self.transport = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        self.counter.received(len(data))
+
+
+class _Counter:
+
+    def __init__(self, loop) -> None:
+        self.loop = loop
+        self.num_bytes: int = 0
+        self.expected_bytes: int = 0
+        self.done: Optional[asyncio.Future] = None
+
+    def expect(self, num_bytes: int) -> asyncio.Future:
+        self.num_bytes = 0
+        self.expected_bytes = num_bytes
+        self.done = self.loop.create_future()
+        return self.done
+
+    def received(self, num_bytes: int) -> None:
+        self.num_bytes += num_bytes
+        if self.done is not None and not self.done.done() and self.num_bytes >= self.expected_bytes:
+            self.done.set_result(None)
+
+
+def _rss_kib(pid: int) -> int:
+    with open("/proc/{}/status".format(pid)) as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("no VmRSS for process {}".format(pid))
+
+
+def _wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline: float = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start listening on port {}".format(port))
+
+
+async def _run_clients(loop, port: int, num_connections: int, num_messages: int, server_pid: int) -> None:
+    counter: _Counter = _Counter(loop)
+    rss_before: int = _rss_kib(server_pid)
+
+    connections: List[_CountingProtocol] = []
+    # not more at once than fit into the listen backlog of the server
+    batch_size: int = 64
+    for start in range(0, num_connections, batch_size):
+        batch = [loop.create_connection(lambda: _CountingProtocol(counter), "127.0.0.1", port)
+                 for _ in range(min(batch_size, num_connections - start))]
+        connections.extend(protocol for _, protocol in await asyncio.gather(*batch))
+
+    # let the server finish setting up the connections
+    await asyncio.sleep(1)
+    rss_after: int = _rss_kib(server_pid)
+    print("  idle connections: {}, server RSS {:,} KiB -> {:,} KiB, {:.1f} KiB per connection".format(
+        num_connections, rss_before, rss_after, (rss_after - rss_before) / num_connections))
+
+    request: bytes = ProtocolMessage.create_single(ProtocolMessageType.GET_GAMES).to_bytes() * num_messages
+    # every request is answered with a 4 byte ERROR message
+    done: asyncio.Future = counter.expect(4 * num_messages * num_connections)
+    start_time: float = time.perf_counter()
+    for protocol in connections:
+        protocol.transport.write(request)
+    await done
+    duration: float = time.perf_counter() - start_time
+    print("  {:,} messages in {:.2f} s, {:,.0f} messages/s".format(
+        num_messages * num_connections, duration, num_messages * num_connections / duration))
+
+    for protocol in connections:
+        protocol.transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--connections", help="number of client connections", type=int, default=10000)
+    parser.add_argument("-m", "--messages", help="messages sent per connection", type=int, default=10)
+    parser.add_argument("-p", "--port", help="first port to use for the servers", type=int, default=4350)
+    parser.add_argument("-t", "--transport", help="only benchmark this transport", choices=["stream", "protocol"], action="append")
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+
+    # both the servers and this process need a file descriptor per connection
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < args.connections + 64:
+        print("The file descriptor limit {} is too low for {} connections".format(hard, args.connections))
+        return 1
+
+    server_py: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    for index, transport in enumerate(args.transport or ["stream", "protocol"]):
+        port: int = args.port + index
+        print("{} transport".format(transport))
+        server = subprocess.Popen([sys.executable, server_py, "-p", str(port), "-t", transport],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_port(port)
+            loop = create_event_loop(args.loop)
+            loop.run_until_complete(_run_clients(loop, port, args.connections, args.messages, server.pid))
+            loop.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Throughput and latency of the server with the asyncio and the uvloop event loop.
+
+Starts server.py once per event loop. For the latency, one connection sends
+GET_GAMES without being logged in and waits for the ERROR answer before it
+sends the next one. For the throughput, many connections send all their
+messages at once. The clients always use the asyncio event loop, so only the
+event loop of the server differs.
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import subprocess
+from importlib.util import find_spec
+from typing import List, Optional
+from common.eventloop import EVENT_LOOPS, create_event_loop
+from common.protocol import ProtocolMessage, ProtocolMessageType
+from bench_connections import _CountingProtocol, _Counter, _wait_for_port
+
+
+class _PingProtocol(asyncio.Protocol):
+
+    def __init__(self, loop) -> None:
+        self.loop = loop
+        self.transport = None
+        self.answer: Optional[asyncio.Future] = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        # one 4 byte ERROR message per request, which fits into one segment
+        if self.answer is not None and not self.answer.done():
+            self.answer.set_result(None)
+
+    async def ping(self, request: bytes) -> float:
+        self.answer = self.loop.create_future()
+        start_time: float = time.perf_counter()
+        self.transport.write(request)
+        await self.answer
+        return time.perf_counter() - start_time
+
+
+async def _run_clients(loop, port: int, num_pings: int, num_connections: int, num_messages: int) -> None:
+    request: bytes = ProtocolMessage.create_single(ProtocolMessageType.GET_GAMES).to_bytes()
+
+    _, pinger = await loop.create_connection(lambda: _PingProtocol(loop), "127.0.0.1", port)
+    latencies: List[float] = sorted([await pinger.ping(request) for _ in range(num_pings)])
+    pinger.transport.close()
+    print("  latency: median {:.0f} µs, p99 {:.0f} µs over {:,} round trips".format(
+        1e6 * latencies[len(latencies) // 2], 1e6 * latencies[int(len(latencies) * 0.99)], num_pings))
+
+    counter: _Counter = _Counter(loop)
+    connections: List[_CountingProtocol] = [
+        protocol for _, protocol in await asyncio.gather(
+            *[loop.create_connection(lambda: _CountingProtocol(counter), "127.0.0.1", port) for _ in range(num_connections)])]
+    done: asyncio.Future = counter.expect(4 * num_messages * num_connections)
+    start_time: float = time.perf_counter()
+    for protocol in connections:
+        protocol.transport.write(request * num_messages)
+    await done
+    duration: float = time.perf_counter() - start_time
+    print("  throughput: {:,.0f} messages/s with {} connections".format(num_messages * num_connections / duration, num_connections))
+    for protocol in connections:
+        protocol.transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--round-trips", help="number of round trips for the latency", type=int, default=5000)
+    parser.add_argument("-c", "--connections", help="number of connections for the throughput", type=int, default=50)
+    parser.add_argument("-m", "--messages", help="messages per connection for the throughput", type=int, default=2000)
+    parser.add_argument("-t", "--transport", help="server transport", choices=["stream", "protocol"], default="stream")
+    parser.add_argument("-p", "--port", help="first port to use for the servers", type=int, default=4370)
+    args = parser.parse_args()
+
+    server_py: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    for index, event_loop in enumerate(EVENT_LOOPS):
+        print("{} event loop, {} transport".format(event_loop, args.transport))
+        if event_loop != "asyncio" and find_spec(event_loop) is None:
+            print("  {} is not installed, skipped".format(event_loop))
+            continue
+
+        port: int = args.port + index
+        server = subprocess.Popen([sys.executable, server_py, "-p", str(port), "-t", args.transport, "--loop", event_loop],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_port(port)
+            # the clients always run on the asyncio event loop, only the one of the server is compared
+            loop = create_event_loop()
+            loop.run_until_complete(_run_clients(loop, port, args.round_trips, args.connections, args.messages))
+            loop.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Benchmark for the serialization of a GAMES message with many open lobby games.
+
+Compares ProtocolMessage.encode_frames, which encodes every game exactly once
+and packs the games into as many messages as needed, with the send_repeating of
+the protocol module of commit 6a0ecb8 ("before", loaded from the git history
+like in bench_protocol.py), which built every message with repeated bytes +=
+and called itself with a copy of the remaining games whenever a message was full.
+"""
+import sys
+import types
+import argparse
+from random import seed, randrange
+from timeit import timeit
+from typing import Any, Dict, List
+from common.constants import GameOptions
+from common.protocol import ProtocolMessage, ProtocolMessageType, NumShips
+from common.eventloop import add_event_loop_argument, create_event_loop
+from bench_protocol import add_baseline_argument, load_baseline
+
+
+class _Writer:
+    """
+    Collects what is written, never has to wait.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> None:
+        self.chunks.append(data)
+
+    async def drain(self) -> None:
+        pass
+
+
+def _baseline_send_repeating(loop, baseline: types.ModuleType, repeating_parameters: List[Dict[str, Any]]) -> List[bytes]:
+    writer: _Writer = _Writer()
+    msg = baseline.ProtocolMessage(baseline.ProtocolMessageType.GAMES, repeating_parameters)
+    loop.run_until_complete(msg.send_repeating(writer))
+    return writer.chunks
+
+
+def random_games(num_games: int) -> List[Dict[str, Any]]:
+    return [{"game_id": game_id, "username": "user{}".format(randrange(100000)),
+             "board_size": randrange(10, 27), "num_ships": NumShips.random(),
+             "round_time": 25 + 5*randrange(8), "options": GameOptions.PASSWORD if randrange(2) else 0}
+            for game_id in range(1, num_games+1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--games", help="number of open lobby games", type=int, default=10000)
+    parser.add_argument("-n", "--number", help="repetitions per variant", type=int, default=20)
+    add_baseline_argument(parser)
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+
+    try:
+        baseline: types.ModuleType = load_baseline(args.baseline)
+    except ValueError as e:
+        parser.error(str(e))
+    loop = create_event_loop(args.loop)
+    seed(42)
+    msg: ProtocolMessage = ProtocolMessage.create_repeating(ProtocolMessageType.GAMES, random_games(args.games))
+
+    before: List[bytes] = _baseline_send_repeating(loop, baseline, msg.repeating_parameters)
+    after: List[bytes] = msg.encode_frames()
+    if not b''.join(before) == b''.join(after):
+        raise RuntimeError("The two variants disagree on the wire format")
+
+    time_before: float = timeit(lambda: _baseline_send_repeating(loop, baseline, msg.repeating_parameters), number=args.number) / args.number
+    time_after: float = timeit(msg.encode_frames, number=args.number) / args.number
+
+    print("{} games, {} bytes in {} GAMES messages".format(args.games, len(b''.join(after)), len(before)))
+    print("before: {:8.2f} ms per GAMES listing".format(1000*time_before))
+    print("after:  {:8.2f} ms per GAMES listing".format(1000*time_after))
+    print("speedup: {:.2f}x".format(time_before/time_after))
+
+    loop.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
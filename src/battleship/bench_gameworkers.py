@@ -0,0 +1,121 @@
+"""
+Battle latency of the server with and without game workers while the lobby is busy.
+
+Starts server.py once per number of game workers. One pair of players plays
+games in which they take turns shooting at empty fields, and the time from a
+SHOOT to its FAIL is measured, first with an idle lobby and then while many
+other users flood the lobby with private chat messages. With game workers, the
+game doesn't share its process with the chat.
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import subprocess
+from typing import List, Tuple
+from common.protocol import ProtocolMessage, ProtocolMessageType, Position
+from common.eventloop import add_event_loop_argument, create_event_loop
+from bench_connections import _CountingProtocol, _Counter, _wait_for_port
+from bench_workers import _start_game
+
+
+async def _measure_shots(loop, port: int, num_shots: int) -> List[float]:
+    latencies: List[float] = []
+    game: int = 0
+    while len(latencies) < num_shots:
+        creator, joiner, shooter, other = await _start_game(loop, port, "latency{}".format(game))
+        game += 1
+        # the ship is at (0, 0) and (0, 1), every other field is a miss and passes the turn
+        targets: List[Position] = [Position(x, y) for x in range(10) for y in range(10) if x > 0]
+        for turn_counter in range(len(targets) * 2):
+            if len(latencies) == num_shots:
+                break
+            start_time: float = time.perf_counter()
+            shooter.send(ProtocolMessageType.SHOOT, {"turn_counter": turn_counter, "position": targets[turn_counter // 2]})
+            await shooter.expect(ProtocolMessageType.FAIL)
+            latencies.append(time.perf_counter() - start_time)
+            await other.expect(ProtocolMessageType.FAIL)
+            shooter, other = other, shooter
+        creator.transport.close()
+        joiner.transport.close()
+    return sorted(latencies)
+
+
+async def _flood_chat(loop, port: int, num_chatters: int, burst: int, running: asyncio.Event) -> Tuple[int, float]:
+    counter: _Counter = _Counter(loop)
+    chatters: List[_CountingProtocol] = [protocol for _, protocol in await asyncio.gather(
+        *[loop.create_connection(lambda: _CountingProtocol(counter), "127.0.0.1", port) for _ in range(num_chatters)])]
+    for index, chatter in enumerate(chatters):
+        chatter.transport.write(ProtocolMessage.create_single(ProtocolMessageType.LOGIN, {"username": "chatter{}".format(index)}).to_bytes())
+    await asyncio.sleep(0.5)
+
+    # every chatter sends bursts of private messages to the next one
+    bursts: List[bytes] = [ProtocolMessage.create_single(ProtocolMessageType.CHAT_SEND, {"username": "chatter{}".format((index + 1) % num_chatters),
+                                                                                         "text": "Are you still there?"}).to_bytes() * burst
+                           for index in range(num_chatters)]
+    received_size: int = len(ProtocolMessage.create_single(ProtocolMessageType.CHAT_RECV, {"sender": "chatter0", "recipient": "chatter1",
+                                                                                           "text": "Are you still there?"}).to_bytes())
+    num_messages: int = 0
+    start_time: float = time.perf_counter()
+    while running.is_set():
+        done: asyncio.Future = counter.expect(received_size * burst * num_chatters)
+        for chatter, data in zip(chatters, bursts):
+            chatter.transport.write(data)
+        await done
+        num_messages += burst * num_chatters
+    duration: float = time.perf_counter() - start_time
+    for chatter in chatters:
+        chatter.transport.close()
+    return num_messages, duration
+
+
+def _print_latencies(name: str, latencies: List[float]) -> None:
+    print("  {}: median {:.2f} ms, p99 {:.2f} ms over {} shots".format(
+        name, 1e3 * latencies[len(latencies) // 2], 1e3 * latencies[int(len(latencies) * 0.99)], len(latencies)))
+
+
+async def _run(loop, port: int, num_shots: int, num_chatters: int, burst: int) -> None:
+    _print_latencies("idle lobby", await _measure_shots(loop, port, num_shots))
+
+    running: asyncio.Event = asyncio.Event()
+    running.set()
+    flood = loop.create_task(_flood_chat(loop, port, num_chatters, burst, running))
+    # let the flood start
+    await asyncio.sleep(1)
+    _print_latencies("busy lobby", await _measure_shots(loop, port, num_shots))
+    running.clear()
+    num_messages, duration = await flood
+    print("  chat: {:,.0f} messages/s with {} users".format(num_messages / duration, num_chatters))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--game-workers", help="comma separated numbers of game workers, 0: games in the lobby process", type=str, default="0,2")
+    parser.add_argument("-s", "--shots", help="number of shots to measure", type=int, default=500)
+    parser.add_argument("-c", "--chatters", help="number of users flooding the chat", type=int, default=50)
+    parser.add_argument("-b", "--burst", help="chat messages per user and round", type=int, default=20)
+    parser.add_argument("-p", "--port", help="first port to use for the servers", type=int, default=4410)
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+
+    server_py: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    for index, num_game_workers in enumerate(int(game_workers) for game_workers in args.game_workers.split(",")):
+        port: int = args.port + index
+        print("{} game worker(s), {} CPUs".format(num_game_workers, os.cpu_count()))
+        server = subprocess.Popen([sys.executable, server_py, "-p", str(port), "-t", "protocol", "-g", str(num_game_workers)],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_port(port)
+            # the game workers connect to the lobby
+            time.sleep(0.5)
+            loop = create_event_loop(args.loop)
+            loop.run_until_complete(_run(loop, port, args.shots, args.chatters, args.burst))
+            loop.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
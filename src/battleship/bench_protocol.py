@@ -0,0 +1,173 @@
+"""
+Microbenchmark for the sending and parsing of protocol messages.
+
+For every message type, random messages are sent with ProtocolMessage.send and
+parsed from a stream with parse_from_stream, once with the precompiled
+ProtocolMessageCodec of the type and the ProtocolMessageDecoder ("after") and
+once with the code they replaced: the protocol module of commit 6a0ecb8 that
+walked ProtocolMessageParameters for every single message and read the stream
+field by field ("before"). It is loaded from the git history when the benchmark
+starts, so this needs to run in a clone of the repository that has the commit
+(or another one given with --baseline).
+The messages the server sends pre-encoded (see ProtocolConstantMessages) are
+sent as such "after", like the server does.
+"""
+import os
+import sys
+import types
+import asyncio
+import argparse
+import logging
+import subprocess
+from random import seed
+from timeit import repeat
+from typing import Any, List
+from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolConstantMessages, parse_from_stream
+from common.eventloop import add_event_loop_argument, create_event_loop
+
+# the full hash, an abbreviated one might become ambiguous
+BASELINE_COMMIT = "6a0ecb83f59703c85feaf3aab100fc3d65e49243"
+
+
+def add_baseline_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("-b", "--baseline", help="git revision with the protocol module to compare with (default: {})".format(
+        BASELINE_COMMIT[:7]), type=str, default=BASELINE_COMMIT)
+
+
+def load_baseline(revision: str) -> types.ModuleType:
+    """
+    Imports common/protocol.py as it was at the given git revision as the module common.protocol_baseline,
+    next to the current one, so that it uses the current common/constants.py.
+    Raises a ValueError if git can't show the module, e.g. in a shallow clone or outside of a clone.
+    """
+    try:
+        source: str = subprocess.check_output(["git", "show", "{}:src/battleship/common/protocol.py".format(revision)],
+                                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                                              stderr=subprocess.PIPE).decode()
+    except (OSError, subprocess.CalledProcessError) as e:
+        details: str = e.stderr.decode().strip() if isinstance(e, subprocess.CalledProcessError) else str(e)
+        raise ValueError("Can't load the protocol module of {} to compare with ({}), run the benchmark in a clone of "
+                         "the repository that has it, or pass another revision with --baseline".format(revision, details))
+    module: types.ModuleType = types.ModuleType("common.protocol_baseline")
+    module.__package__ = "common"
+    sys.modules[module.__name__] = module
+    exec(compile(source, "{}:common/protocol.py".format(revision), "exec"), module.__dict__)
+    return module
+
+
+class _Writer:
+    """
+    Collects what is written, never has to wait.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> None:
+        self.chunks.append(data)
+
+    async def drain(self) -> None:
+        pass
+
+
+async def _send_all(messages: List[Any]) -> bytes:
+    writer: _Writer = _Writer()
+    for msg in messages:
+        await msg.send(writer)
+    return b''.join(writer.chunks)
+
+
+async def _parse_all(parse, data: bytes) -> List[Any]:
+    messages: List[Any] = []
+
+    async def msg_callback(msg) -> None:
+        messages.append(msg)
+
+    reader: asyncio.StreamReader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    await parse(reader, _Writer(), msg_callback)
+    return messages
+
+
+def _as_sent_by_the_server(msg: ProtocolMessage) -> ProtocolMessage:
+    # the server never encodes these messages itself, it sends the ones of ProtocolConstantMessages
+    if msg.type in [ProtocolMessageType.PLACED, ProtocolMessageType.YOUSTART, ProtocolMessageType.WAIT, ProtocolMessageType.TIMEOUT]:
+        return ProtocolConstantMessages.get(msg.type)
+    elif msg.type == ProtocolMessageType.ENDGAME:
+        return ProtocolConstantMessages.endgame(msg.parameters["reason"])
+    elif msg.type == ProtocolMessageType.ERROR:
+        return ProtocolConstantMessages.error(msg.parameters["error_code"])
+    return msg
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", help="messages sent/parsed per message type and variant", type=int, default=20000)
+    parser.add_argument("-s", "--samples", help="number of different random messages per type", type=int, default=64)
+    parser.add_argument("-r", "--repeat", help="timing runs per variant, the fastest one counts", type=int, default=5)
+    add_baseline_argument(parser)
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        baseline: types.ModuleType = load_baseline(args.baseline)
+    except ValueError as e:
+        parser.error(str(e))
+    seed(42)
+    loop = create_event_loop(args.loop)
+
+    print("{:<12} {:>14} {:>14} {:>8} {:>14} {:>14} {:>8}".format(
+        "type", "send before/s", "send after/s", "speedup", "parse before/s", "parse after/s", "speedup"))
+
+    for msg_type in ProtocolMessageType:
+        # only the messages the baseline knows, with the fields it knows (e.g. GET_GAMES without a lobby_version)
+        if msg_type == ProtocolMessageType.NONE or msg_type not in list(baseline.ProtocolMessageType):
+            continue
+        baseline_type = baseline.ProtocolMessageType(msg_type)
+        field_names: List[str] = baseline.ProtocolMessageParametersFieldNames[baseline_type]
+
+        messages: List[ProtocolMessage] = [
+            ProtocolMessage.create_repeating(msg_type, [{name: value for name, value in parameters.items() if name in field_names}
+                                                        for parameters in ProtocolMessage.random_from_type(msg_type).repeating_parameters])
+            for _ in range(args.samples)]
+        messages = [_as_sent_by_the_server(msg) for msg in messages]
+        baseline_messages: List[Any] = [
+            baseline.ProtocolMessage(baseline_type, msg.repeating_parameters) for msg in messages]
+
+        # both variants must agree on the wire format and on what they parse from it
+        data: bytes = loop.run_until_complete(_send_all(messages))
+        if not loop.run_until_complete(_send_all(baseline_messages)) == data:
+            raise RuntimeError("The variants send different bytes for {}".format(msg_type.name))
+        parsed: List[ProtocolMessage] = loop.run_until_complete(_parse_all(parse_from_stream, data))
+        baseline_parsed: List[Any] = loop.run_until_complete(_parse_all(baseline.parse_from_stream, data))
+        if not [str(msg) for msg in parsed] == [str(msg) for msg in baseline_parsed] or not len(parsed) == len(messages):
+            raise RuntimeError("The variants parse different messages for {}".format(msg_type.name))
+
+        rounds: int = max(1, args.number // len(messages))
+        ops: int = rounds * len(messages)
+
+        def send_before():
+            loop.run_until_complete(_send_all(baseline_messages))
+
+        def send_after():
+            loop.run_until_complete(_send_all(messages))
+
+        def parse_before():
+            loop.run_until_complete(_parse_all(baseline.parse_from_stream, data))
+
+        def parse_after():
+            loop.run_until_complete(_parse_all(parse_from_stream, data))
+
+        results: List[float] = [ops / min(repeat(variant, number=rounds, repeat=args.repeat))
+                                for variant in [send_before, send_after, parse_before, parse_after]]
+
+        print("{:<12} {:>14,.0f} {:>14,.0f} {:>7.2f}x {:>14,.0f} {:>14,.0f} {:>7.2f}x".format(
+            msg_type.name, results[0], results[1], results[1]/results[0], results[2], results[3], results[3]/results[2]))
+
+    loop.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+Games per second of router.py with a growing number of backend servers.
+
+Starts router.py and N `server.py --router` backends for every N and lets a
+number of player pairs play short games for some seconds, like bench_workers.py.
+The lobby runs at the router, the games at the backends.
+
+The router, the backends and the clients need a CPU each to see the backends
+scale, otherwise they only take CPU time from each other.
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import subprocess
+from typing import List
+from common.eventloop import add_event_loop_argument, create_event_loop
+from bench_connections import _wait_for_port
+from bench_workers import _run_pairs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--backends", help="comma separated numbers of backends", type=str, default="1,2,4")
+    parser.add_argument("-n", "--pairs", help="number of player pairs playing at the same time", type=int, default=20)
+    parser.add_argument("-d", "--duration", help="seconds to play per number of backends", type=float, default=10)
+    parser.add_argument("-p", "--port", help="first port to use for the routers, the control ports are 100 above", type=int, default=4420)
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+
+    directory: str = os.path.dirname(os.path.abspath(__file__))
+    for index, num_backends in enumerate(int(backends) for backends in args.backends.split(",")):
+        port: int = args.port + index
+        control_port: int = port + 100
+        print("{} backend(s), {} CPUs".format(num_backends, os.cpu_count()))
+        processes: List[subprocess.Popen] = [subprocess.Popen(
+            [sys.executable, os.path.join(directory, "router.py"), "-p", str(port), "-c", str(control_port), "-t", "protocol"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+        try:
+            _wait_for_port(port)
+            for _ in range(num_backends):
+                processes.append(subprocess.Popen([sys.executable, os.path.join(directory, "server.py"), "-r", "127.0.0.1:{}".format(control_port)],
+                                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            # the backends connect to the router
+            time.sleep(1)
+            loop = create_event_loop(args.loop)
+            loop.run_until_complete(_run_pairs(loop, port, args.pairs, args.duration))
+            loop.close()
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Round timers with loop.call_later and with the TimerWheel of the server.
+
+Simulates many running games in this process: every turn cancels the round
+timer of the player who shot and arms the one of their opponent, with round
+times between 25 and 60 seconds, so no timer ever expires. Prints the time per
+turn and how many timer handles the event loop's heap holds afterwards.
+"""
+import sys
+import time
+import random
+import asyncio
+import argparse
+from typing import List
+from server.timerwheel import TimerWheel
+from common.eventloop import add_event_loop_argument, create_event_loop
+
+
+def _call_later_turns(loop, round_times: List[int], num_turns: int) -> float:
+    handles: List[asyncio.TimerHandle] = [loop.call_later(round_time, print) for round_time in round_times]
+    start_time: float = time.perf_counter()
+    for turn in range(num_turns):
+        game: int = turn % len(round_times)
+        handles[game].cancel()
+        handles[game] = loop.call_later(round_times[game], print)
+    duration: float = time.perf_counter() - start_time
+    # one pass of the event loop removes cancelled handles if they are the majority
+    loop.run_until_complete(asyncio.sleep(0))
+    print("  call_later: {:.2f} µs per turn, heap of the event loop: {:,} timers".format(1e6 * duration / num_turns, len(loop._scheduled)))
+    for handle in handles:
+        handle.cancel()
+    return duration
+
+
+def _timer_wheel_turns(loop, round_times: List[int], num_turns: int) -> float:
+    wheel: TimerWheel = TimerWheel(loop, print)
+    for game, round_time in enumerate(round_times):
+        wheel.arm(game, round_time)
+    start_time: float = time.perf_counter()
+    for turn in range(num_turns):
+        game: int = turn % len(round_times)
+        wheel.cancel(game)
+        wheel.arm(game, round_times[game])
+    duration: float = time.perf_counter() - start_time
+    loop.run_until_complete(asyncio.sleep(0))
+    print("  timer wheel: {:.2f} µs per turn, heap of the event loop: {:,} timers".format(1e6 * duration / num_turns, len(loop._scheduled)))
+    wheel.close()
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--games", help="comma separated numbers of running games", type=str, default="1000,10000,50000")
+    parser.add_argument("-t", "--turns", help="number of turns to simulate", type=int, default=1000000)
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+
+    for num_games in (int(games) for games in args.games.split(",")):
+        print("{:,} games".format(num_games))
+        round_times: List[int] = [random.randrange(25, 61, 5) for _ in range(num_games)]
+        loop = create_event_loop(args.loop)
+        call_later_duration: float = _call_later_turns(loop, round_times, args.turns)
+        timer_wheel_duration: float = _timer_wheel_turns(loop, round_times, args.turns)
+        print("  speedup: {:.1f}x".format(call_later_duration / timer_wheel_duration))
+        loop.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Games per second of the server with a growing number of worker processes.
+
+Starts `server.py --workers N` for every N and lets a number of player pairs
+play short games for some seconds. Every game uses two new connections, so
+with N workers the two players usually end up at different workers and the
+JOIN hands the joining player over to the worker of the game: the game is
+created, joined, placed and won with two hits, then both disconnect.
+
+The clients all run in this process, so they need a CPU for themselves to not
+be the bottleneck.
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import subprocess
+from typing import Dict, List, Any, Optional, Tuple
+from common.constants import Orientation
+from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolMessageDecoder, NumShips, Position, ShipPosition, ShipPositions
+from common.eventloop import add_event_loop_argument, create_event_loop
+from bench_connections import _wait_for_port
+
+
+class _Player(asyncio.Protocol):
+
+    def __init__(self) -> None:
+        self.transport = None
+        self.decoder: ProtocolMessageDecoder = ProtocolMessageDecoder()
+        self.messages: asyncio.Queue = asyncio.Queue()
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        for msg in self.decoder.feed(data):
+            self.messages.put_nowait(msg)
+
+    def send(self, msg_type: ProtocolMessageType, parameters: Optional[Dict[str, Any]] = None) -> None:
+        self.transport.write(ProtocolMessage.create_single(msg_type, parameters or {}).to_bytes())
+
+    async def expect(self, *msg_types: ProtocolMessageType) -> ProtocolMessage:
+        # skips everything else, e.g. the GAME and DELETE_GAME messages of the other games
+        while True:
+            msg: ProtocolMessage = await asyncio.wait_for(self.messages.get(), 10)
+            if msg.type in msg_types:
+                return msg
+            if msg.type == ProtocolMessageType.ERROR:
+                raise RuntimeError("unexpected {}".format(msg))
+
+
+async def _start_game(loop, port: int, name: str) -> Tuple[_Player, _Player, _Player, _Player]:
+    """
+    Logs in two new players, lets them create, join and place a game with one ship of length 2
+    at (0, 0) and (0, 1) and returns creator, joiner, the player whose turn it is and the other one.
+    """
+    creator: _Player
+    joiner: _Player
+    (_, creator), (_, joiner) = await asyncio.gather(loop.create_connection(_Player, "127.0.0.1", port),
+                                                     loop.create_connection(_Player, "127.0.0.1", port))
+    creator.send(ProtocolMessageType.LOGIN, {"username": name + "c"})
+    joiner.send(ProtocolMessageType.LOGIN, {"username": name + "j"})
+    await asyncio.gather(creator.expect(ProtocolMessageType.GAMES), joiner.expect(ProtocolMessageType.GAMES))
+
+    creator.send(ProtocolMessageType.CREATE_GAME, {"board_size": 10, "num_ships": NumShips([0, 0, 0, 0, 1]), "round_time": 25, "options": 0})
+    # the creator was in the game selection before, so it might get the GAME of other pairs first
+    game: ProtocolMessage = await creator.expect(ProtocolMessageType.GAME)
+    while not game.parameters["username"] == name + "c":
+        game = await creator.expect(ProtocolMessageType.GAME)
+    joiner.send(ProtocolMessageType.JOIN, {"game_id": game.parameters["game_id"]})
+    await asyncio.gather(creator.expect(ProtocolMessageType.STARTGAME), joiner.expect(ProtocolMessageType.STARTGAME))
+
+    ship_positions: ShipPositions = ShipPositions([ShipPosition(Position(0, 0), Orientation.EAST)])
+    creator.send(ProtocolMessageType.PLACE, {"ship_positions": ship_positions})
+    joiner.send(ProtocolMessageType.PLACE, {"ship_positions": ship_positions})
+    creator_starts: bool = (await creator.expect(ProtocolMessageType.YOUSTART, ProtocolMessageType.WAIT)).type == ProtocolMessageType.YOUSTART
+    await joiner.expect(ProtocolMessageType.YOUSTART, ProtocolMessageType.WAIT)
+    if creator_starts:
+        return creator, joiner, creator, joiner
+    return creator, joiner, joiner, creator
+
+
+async def _play_game(loop, port: int, name: str) -> None:
+    creator, joiner, shooter, _ = await _start_game(loop, port, name)
+    # a hit keeps the turn
+    shooter.send(ProtocolMessageType.SHOOT, {"turn_counter": 0, "position": Position(0, 0)})
+    await shooter.expect(ProtocolMessageType.HIT)
+    shooter.send(ProtocolMessageType.SHOOT, {"turn_counter": 1, "position": Position(0, 1)})
+    await asyncio.gather(creator.expect(ProtocolMessageType.ENDGAME), joiner.expect(ProtocolMessageType.ENDGAME))
+
+    creator.transport.close()
+    joiner.transport.close()
+
+
+async def _run_pairs(loop, port: int, num_pairs: int, duration: float) -> None:
+    num_games: List[int] = [0] * num_pairs
+    deadline: float = time.perf_counter() + duration
+
+    async def play(pair: int) -> None:
+        while time.perf_counter() < deadline:
+            await _play_game(loop, port, "p{}g{}".format(pair, num_games[pair]))
+            num_games[pair] += 1
+
+    start_time: float = time.perf_counter()
+    await asyncio.gather(*[play(pair) for pair in range(num_pairs)])
+    games_per_second: float = sum(num_games) / (time.perf_counter() - start_time)
+    print("  {:,} games with {} pairs, {:,.0f} games/s".format(sum(num_games), num_pairs, games_per_second))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-w", "--workers", help="comma separated numbers of worker processes", type=str, default="1,2,4")
+    parser.add_argument("-n", "--pairs", help="number of player pairs playing at the same time", type=int, default=20)
+    parser.add_argument("-d", "--duration", help="seconds to play per number of workers", type=float, default=10)
+    parser.add_argument("-p", "--port", help="first port to use for the servers", type=int, default=4390)
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+
+    server_py: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    for index, num_workers in enumerate(int(workers) for workers in args.workers.split(",")):
+        port: int = args.port + index
+        print("{} worker(s), {} CPUs".format(num_workers, os.cpu_count()))
+        server = subprocess.Popen([sys.executable, server_py, "-p", str(port), "-t", "protocol", "-w", str(num_workers)],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_port(port)
+            # the first worker listens, give the others a moment as well
+            time.sleep(0.5)
+            loop = create_event_loop(args.loop)
+            loop.run_until_complete(_run_pairs(loop, port, args.pairs, args.duration))
+            loop.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,6 +10,8 @@ from common.GameController import GameController
 from common.constants import Orientation, Direction, Constants, GameOptions
 from common.protocol import ProtocolMessage, ProtocolMessageType, ShipPositions, Position, Positions, ShipPosition, NumShips
 from common.network import BattleshipClient
+from common.eventloop import add_event_loop_argument, create_event_loop
+from common.errorHandler.BattleshipError import BattleshipError
 from frontend.welcome import Welcome
 from frontend.lobby.login import Login
 from frontend.lobby.lobby import Lobby
@@ -40,15 +42,19 @@ def main():
     parser.add_argument("-i", "--ip", help="server IP", type=str, default=Constants.SERVER_IP)
     parser.add_argument("-p", "--port", help="server port", type=int, default=Constants.SERVER_PORT)
     parser.add_argument("-l", "--logfile", help="file for logs", type=argparse.FileType('w'), default='client.log')
+    parser.add_argument("--lobby-versions", help="the server knows lobby versions, only sync the changes of the game list",
+                        action="store_true")
+    add_event_loop_argument(parser)
     args = parser.parse_args()
 
     # Initiat the IP, port and logger for the client as well
     Constants.SERVER_IP = args.ip
     Constants.SERVER_PORT = args.port
+    Constants.LOBBY_VERSIONS = args.lobby_versions
     logging.basicConfig(filename=args.logfile.name, level=logging.DEBUG)
 
-    # Get asyncio loop
-    loop = asyncio.get_event_loop()
+    # Get the event loop, asyncio's or uvloop
+    loop = create_event_loop(args.loop)
     # A flag to tell the client when to handle the CHAT messages
     in_lobby_or_battle = False
 
@@ -61,13 +67,15 @@ def main():
             lobby_controller.state = ClientConnectionState.CONNECTED
 
         if msg.type == ProtocolMessageType.ERROR:
-            pass
+            await lobby_controller.handle_error(msg)
         elif msg.type == ProtocolMessageType.GAMES:
             await lobby_controller.handle_games(msg)
         elif msg.type == ProtocolMessageType.GAME:
             await lobby_controller.handle_game(msg)
         elif msg.type == ProtocolMessageType.DELETE_GAME:
             await lobby_controller.handle_delete_game(msg)
+        elif msg.type == ProtocolMessageType.LOBBY_VERSION:
+            await lobby_controller.handle_lobby_version(msg)
         elif msg.type == ProtocolMessageType.CHAT_RECV:
             if in_lobby_or_battle is True:
                 await lobby_controller.handle_chat_recv(msg)
@@ -153,6 +161,12 @@ def main():
         game_controller.reset_for_client()
         lobby_controller.prepare_for_next()
 
+        # the game list might have changed while we were away
+        try:
+            loop.run_until_complete(lobby_controller.send_get_games())
+        except BattleshipError:
+            pass
+
         # TODO: CTRL+C should exit everything. Maybe a global QUIT_APP callback?
 
 if __name__ == '__main__':
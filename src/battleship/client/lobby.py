@@ -8,7 +8,7 @@ from common.states import ClientConnectionState
 from common.network import BattleshipClient
 from common.protocol import ProtocolMessage, ProtocolMessageType, Position, Positions, ProtocolConfig
 from common.errorHandler.BattleshipError import BattleshipError
-from common.constants import ErrorCode, EndGameReason
+from common.constants import ErrorCode, EndGameReason, Constants
 from common.game import GameLobbyData
 from common.GameController import GameController
 
@@ -60,6 +60,15 @@ class ClientLobbyController:
         self.is_cancelling_game = False
         self.received_cancel = False
         self.is_first_start = True
+        # lobby version of self.games for the delta synchronization of the game list, None if unknown
+        self.lobby_version: Optional[int] = None
+        # Servers without the extension of the RFC only know the plain GET_GAMES. The GET_GAMES with
+        # a lobby version is only sent to a server that sent a LOBBY_VERSION, or with --lobby-versions.
+        self.server_knows_lobby_versions: bool = Constants.LOBBY_VERSIONS
+        self.is_syncing_lobby = False
+        self.has_cleared_games = False
+        self.lobby_synced = asyncio.Event()
+        self.lobby_sync_failed = False
 
         self._callback_names: List[ProtocolMessageType] = [ProtocolMessageType.GAME,
                                 ProtocolMessageType.DELETE_GAME,
@@ -114,17 +123,57 @@ class ClientLobbyController:
             raise BattleshipError(self.client.last_error)
 
     async def send_get_games(self):
+        # While syncing, the game list is only updated in self.games, the lobby screen
+        # reads it when it is created. If we know a lobby version, the server only sends
+        # what changed since then and we keep our games.
+        self.is_syncing_lobby = True
+        self.has_cleared_games = False
+        synced = False
         try:
-            msg = ProtocolMessage.create_single(ProtocolMessageType.GET_GAMES)
-            self.games = {}
-            await self.client.send_and_wait_for_answer(msg)
+            if self.server_knows_lobby_versions:
+                # lobby version 0 is the empty lobby of a freshly started server
+                synced = await self._get_games_since(self.lobby_version if self.lobby_version is not None else 0)
+            if not synced:
+                # the server could not send the changes, start over with the whole list
+                synced = await self._get_all_games()
         except Exception as e:
             logging.debug("send_get_games-->".format(str(e)))
+        finally:
+            self.is_syncing_lobby = False
 
         # TODO: timeouts
-        if self.client.last_msg_was_error:
+        if not synced and self.client.last_msg_was_error:
             raise BattleshipError(self.client.last_error)
 
+    async def _get_all_games(self) -> bool:
+        # the plain GET_GAMES of the RFC, the first GAMES of the answer replaces our games (see handle_games)
+        self.has_cleared_games = False
+        self.lobby_version = None
+        msg = ProtocolMessage.create_single(ProtocolMessageType.GET_GAMES)
+        await self.client.send_and_wait_for_answer(msg)
+        return not self.client.last_msg_was_error
+
+    async def _get_games_since(self, lobby_version: int) -> bool:
+        # returns False if the server answered with an ERROR or not in time
+        msg = ProtocolMessage.create_single(ProtocolMessageType.GET_GAMES, {"lobby_version": lobby_version})
+        if self.lobby_version is None:
+            # the changes since 0 are the whole list
+            self.games = {}
+            self.has_cleared_games = True
+        self.lobby_synced.clear()
+        self.lobby_sync_failed = False
+        await self.client.send(msg)
+        try:
+            # the server sends LOBBY_VERSION after the changes, handle_error stops waiting as well
+            await asyncio.wait_for(self.lobby_synced.wait(), Constants.LOBBY_SYNC_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.debug("no LOBBY_VERSION after {} seconds".format(Constants.LOBBY_SYNC_TIMEOUT))
+            return False
+        finally:
+            # the changes were answers as well, the next request waits for its own
+            self.client.answer_received.clear()
+        return not self.lobby_sync_failed
+
     # the default value for the username means the message is sent to everyone
     async def send_chat(self, username, text):
         if len(text) > ProtocolConfig.CHAT_MAX_TEXT_LENGTH:
@@ -193,6 +242,11 @@ class ClientLobbyController:
         # this is now done directly in client.py
         # self.state = ClientConnectionState.CONNECTED
 
+        # a GAMES while syncing replaces the games we have
+        if self.is_syncing_lobby and not self.has_cleared_games:
+            self.games = {}
+            self.has_cleared_games = True
+
         # TODO: fix this. Why is the [{}] in an empty message?
         if not msg.repeating_parameters == [] or not msg.repeating_parameters == [{}]:
             all_games = {}
@@ -204,7 +258,8 @@ class ClientLobbyController:
                 self.games[params["game_id"]] = game
             try:
                 all_games[params["game_id"]] = {params["game_id"], params["username"], params["board_size"], params["round_time"], params["options"]}
-                await self.call_callback(ProtocolMessageType.GAMES)
+                if not self.is_syncing_lobby:
+                    await self.call_callback(ProtocolMessageType.GAMES)
             except Exception as e:
                 logging.debug("Lobbyclient{} -- {}".format(str(type(e)), str(e)))
 
@@ -212,23 +267,37 @@ class ClientLobbyController:
         # check if this is our game
         # TODO: we could check if we actually sent a game…
         params = msg.parameters
-        if params["username"] == self.username:
+        if params["username"] == self.username and not self.is_syncing_lobby:
             self.game_controller.game_id = params["game_id"]
         # if it's a game from someone else, add it to the list of games
         else:
             game = GameLobbyData(params["game_id"], params["username"], params["board_size"], params["num_ships"], params["round_time"], params["options"])
             self.games[params["game_id"]] = game
-            await self.call_callback(ProtocolMessageType.GAME, game)
+            if not self.is_syncing_lobby:
+                await self.call_callback(ProtocolMessageType.GAME, game)
 
     async def handle_delete_game(self, msg):
         params = msg.parameters
         try:
             del self.games[params["game_id"]]
-            await self.call_callback(ProtocolMessageType.DELETE_GAME, params["game_id"])
+            if not self.is_syncing_lobby:
+                await self.call_callback(ProtocolMessageType.DELETE_GAME, params["game_id"])
         except KeyError:
             # then the game did not exist, so what.
             pass
 
+    async def handle_error(self, msg):
+        # e.g. the rate limiter's answer to a GET_GAMES, don't wait for the LOBBY_VERSION
+        if self.is_syncing_lobby:
+            self.lobby_sync_failed = True
+            self.lobby_synced.set()
+
+    async def handle_lobby_version(self, msg):
+        # the game list is now the one of this lobby version
+        self.lobby_version = msg.parameters["lobby_version"]
+        self.server_knows_lobby_versions = True
+        self.lobby_synced.set()
+
     async def handle_youstart(self, msg):
         self.game_controller.run(msg)
         await self.call_callback(ProtocolMessageType.YOUSTART)
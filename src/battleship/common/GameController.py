@@ -1,8 +1,8 @@
 import time
 import logging
-import asyncio
-from typing import Callable
+from typing import Tuple
 from .battlefield.Battlefield import Battlefield
+from .battlefield.BitBattlefield import BitBattlefield
 from .battlefield.battleship.AircraftCarrier import AircraftCarrier
 from .battlefield.battleship.Battleship import Battleship
 from .battlefield.battleship.Cruiser import Cruiser
@@ -22,9 +22,15 @@ from common.states import GameState
     The interface consists of a simple command parser, which evaluates the incoming network messages.
 """
 
+# the Battlefield implementations, see GameController.battlefield_class
+BATTLEFIELD_CLASSES = {"lists": Battlefield, "bitboard": BitBattlefield}
+
 
 class GameController(GameLobbyData):
 
+    # the Battlefield of new games, e.g. the server's --battlefield
+    battlefield_class = Battlefield
+
     def __init__(self, game_id, client, loop):
         super().__init__(game_id)
         self.loop = loop
@@ -35,7 +41,6 @@ class GameController(GameLobbyData):
         self._opponent_name: str = ""
         self._password: str = ""
         self.timeout_counter: int = 0
-        self._timeout_handle: asyncio.Handle = None
         self._last_shot = (0, 0)
         self._my_shot = False
         self.client = client
@@ -223,7 +228,7 @@ class GameController(GameLobbyData):
                     elif i == 4:
                         ships.append(Submarine(identification, 0, 0, Orientation.EAST))
                     identification += 1
-            self._battlefield = Battlefield(length, ships, ships_table)
+            self._battlefield = self.battlefield_class(length, ships, ships_table)
             if length * length * 0.3 > self._battlefield.calc_filled():
                 return self._battlefield
             else:
@@ -288,20 +293,60 @@ class GameController(GameLobbyData):
 
     # strike at the coordinates on my own battlefield
     def strike(self, x_pos, y_pos):
+        return self.strike_ship(x_pos, y_pos) is not None
+
+    # strike at the coordinates on my own battlefield, returns the ship that was hit
+    def strike_ship(self, x_pos, y_pos):
         if self._game_started:
             if self._battlefield.no_border_crossing(x_pos, y_pos):
                 if self._battlefield.no_strike_at_place(x_pos, y_pos):
-                    if self._battlefield.strike(x_pos, y_pos):
+                    ship = self._battlefield.strike_at(x_pos, y_pos)
+                    if ship is not None:
                         self._last_shot = (x_pos, y_pos)
-                        return True
-                    else:
-                        return False
+                    return ship
                 else:
                     raise BattleshipError(ErrorCode.PARAMETER_ALREADY_HIT_POSITION)
             else:
                 raise BattleshipError(ErrorCode.PARAMETER_POSITION_OUT_OF_BOUNDS)
         else:
-            return False
+            return None
+
+    # the opponent's SHOOT at my battlefield on the server, like run with the SHOOT message
+    # followed by ship_sunk_at_pos and all_ships_sunk on a hit, but with a single strike
+    def resolve_shot(self, turn_counter, position: Position) -> Tuple[bool, bool, bool]:
+        if not self.state == GameState.OPPONENTS_TURN:
+            raise BattleshipError(ErrorCode.ILLEGAL_STATE_NOT_YOUR_TURN)
+        if not self.valid_turn_counter(turn_counter):
+            raise BattleshipError(ErrorCode.PARAMETER_INVALID_TURN_COUNT)
+        ship = self.strike_ship(position.horizontal, position.vertical)
+        if ship is None:
+            return False, False, False
+        sunk = ship.is_sunk()
+        return True, sunk, sunk and self._battlefield.all_ships_sunk()
+
+    # the SHOOT of shooter_ctrl at target_ctrl's battlefield, and the HIT or FAIL on both controllers
+    # (like run with the HIT or FAIL message), returns hit, sunk and game over
+    @staticmethod
+    def resolve_turn(shooter_ctrl, target_ctrl, turn_counter, position: Position) -> Tuple[bool, bool, bool]:
+        result = target_ctrl.resolve_shot(turn_counter, position)
+        shooter_ctrl.end_shot(result[0])
+        target_ctrl.end_shot(result[0])
+        return result
+
+    # the turn after a shot, the HIT or FAIL message
+    def end_shot(self, hit):
+        if not hit:
+            # the last shot was unsuccessful, the other player's turn
+            if self._state == GameState.YOUR_TURN:
+                self._state = GameState.OPPONENTS_TURN
+            else:
+                self._state = GameState.YOUR_TURN
+        self.start_round_time()
+        if not hit and self._my_shot:
+            self._my_shot = False
+            x_pos, y_pos = self._last_shot
+            self._battlefield.shot_missed(x_pos, y_pos)
+        self.increase_turn_counter()
 
     # shoot at enemy battlefield
     def shoot(self, x_pos, y_pos):
@@ -445,7 +490,6 @@ class GameController(GameLobbyData):
 
         # This message is sent to both clients
         elif msg.type == ProtocolMessageType.HIT:
-            self.start_round_time()
             sunk = msg.parameters["sunk"]
             position = msg.parameters["position"]
             # if self.state == GameState.OPPONENTS_TURN:
@@ -454,21 +498,12 @@ class GameController(GameLobbyData):
                 # self.strike(position.horizontal, position.vertical)
             # elif self.state == GameState.YOUR_TURN:
                 # self.shoot(position.horizontal, position.vertical)
-            self.increase_turn_counter()
+            self.end_shot(True)
 
         # The last shot was unsuccessful. This message is sent to both clients.
         elif msg.type == ProtocolMessageType.FAIL:
-            if self._state == GameState.YOUR_TURN:
-                self._state = GameState.OPPONENTS_TURN
-            else:
-                self._state = GameState.YOUR_TURN
-            self.start_round_time()
             position = msg.parameters["position"]
-            if self._my_shot:
-                self._my_shot = False
-                x_pos, y_pos = self._last_shot
-                self._battlefield.shot_missed(x_pos, y_pos)
-            self.increase_turn_counter()
+            self.end_shot(False)
 
         # A ship was moved. If the ship was moved to already shot fields, these fields are mentioned in the positions. This message is sent to both clients.
         elif msg.type == ProtocolMessageType.MOVED:
@@ -501,17 +536,6 @@ class GameController(GameLobbyData):
         else:
             raise BattleshipError(ErrorCode.UNKNOWN)
 
-    def start_timeout(self, callback: Callable):
-        self._timeout_handle = self.loop.call_later(self.round_time, callback, self.client)
-
-    def restart_timeout(self, callback: Callable):
-        self.cancel_timeout()
-        self.start_timeout(callback)
-
-    def cancel_timeout(self):
-        if self._timeout_handle is not None:
-            self._timeout_handle.cancel()
-
     def to_create_game_msg(self):
         params = {"board_size": self.length, "num_ships": NumShips(self.ships),
                   "round_time": self.round_time, "options": self.options}
@@ -1,11 +1,18 @@
-from typing import List, Optional, Any, Dict, Tuple
+from array import array
+from typing import List, Optional, Any, Dict, Set, Tuple
 from ..constants import Orientation, Direction, ErrorCode
 from .battleship import Ship
 """ class Battlefield
     The Battlefield is an abstract model of a battlefield for a single player.
     It contains of two matrix fields and the ship list of the responsible player.
+    An index of the ship at every cell answers which ship is at a location.
 """
 
+# the longest ship (the carrier) reaches this far beyond its first position
+MAX_SHIP_REACH = 4
+# no ship at a cell of the index
+NO_SHIP = -1
+
 
 class Battlefield:
 
@@ -14,28 +21,88 @@ class Battlefield:
         self._ships = ships
         self._ships_table: List[int] = ships_table
         self._ships_table_not_placed: List[int] = ships_table
+        self._create_matrix_fields()
+        # the id of the ship at cell (x, y) at index y * stride + x, the ids are the positions in the ship list
+        # and fit into a byte, as every ship covers two cells at least and they cover less than 30% of 26x26.
+        # Ships may stick out of the board on the right and at the bottom, the stride leaves room for that.
+        self._stride: int = length + MAX_SHIP_REACH + 1
+        self._ship_index = array('b', [NO_SHIP]) * (self._stride * self._stride)
+        # set once two ships covered the same cell (only the first position is checked when placing and moving)
+        self._ships_overlap: bool = False
+        # the cells struck without a hit (2 in _my_battlefield), a ship moving there reports them
+        self._missed_strikes: Set[Tuple[int, int]] = set()
+        # ships not sunk yet
+        self._ships_afloat: int = len(ships)
+
+    def _create_matrix_fields(self):
         self._my_battlefield = [[0 for x in range(self._length)] for y in range(self._length)]
         self._enemy_battlefield = [[0 for x in range(self._length)] for y in range(self._length)]
 
+    def _index_of(self, x_pos, y_pos):
+        # None for cells no ship can reach
+        if 0 <= x_pos < self._stride and 0 <= y_pos < self._stride:
+            return y_pos * self._stride + x_pos
+        return None
+
+    def _add_to_index(self, ship):
+        if not ship.is_placed():
+            return
+        ship_id = ship.get_ship_id()
+        for x_pos, y_pos in ship.get_ship_coordinates():
+            index = self._index_of(x_pos, y_pos)
+            if self._ship_index[index] == NO_SHIP:
+                self._ship_index[index] = ship_id
+            else:
+                # the first ship in the list wins, like when searching the list
+                self._ships_overlap = True
+                self._ship_index[index] = min(self._ship_index[index], ship_id)
+
+    def _remove_from_index(self, ship):
+        if not ship.is_placed():
+            return
+        ship_id = ship.get_ship_id()
+        for x_pos, y_pos in ship.get_ship_coordinates():
+            index = self._index_of(x_pos, y_pos)
+            if self._ship_index[index] == ship_id:
+                self._ship_index[index] = NO_SHIP
+                if self._ships_overlap:
+                    # another ship might be at this cell as well
+                    for other_ship in self._ships:
+                        if not other_ship is ship and other_ship.is_ship_at_location(x_pos, y_pos):
+                            self._ship_index[index] = other_ship.get_ship_id()
+                            break
+
     # move a ship one position further
     def move(self, ship_id, direction):
-        x_pos, y_pos = self.get_move_coordinate(ship_id, direction)
         ship = self.get_ship(ship_id)
-        if ship.move(direction):
-            return True
-        else:
-            return False
+        self._remove_from_index(ship)
+        moved = ship.move(direction)
+        self._add_to_index(ship)
+        return moved
 
     # enemy strike
     def strike(self, x_pos, y_pos):
+        return self.strike_at(x_pos, y_pos) is not None
+
+    # enemy strike, returns the ship that was hit
+    def strike_at(self, x_pos, y_pos):
         self._my_battlefield[x_pos][y_pos] = 2
-        for ship in self._ships:
-            if ship.is_ship_at_location(x_pos, y_pos):
-                if ship.strike(x_pos, y_pos):
-                    self._my_battlefield[x_pos][y_pos] = 1
-                    return True
+        ship = self.get_ship_from_location(x_pos, y_pos)
+        if ship is not None and self._strike_ship(ship, x_pos, y_pos):
+            self._my_battlefield[x_pos][y_pos] = 1
+            self._missed_strikes.discard((x_pos, y_pos))
+            return ship
         # no hit
-        return False
+        self._missed_strikes.add((x_pos, y_pos))
+        return None
+
+    def _strike_ship(self, ship, x_pos, y_pos):
+        was_sunk = ship.is_sunk()
+        if not ship.strike(x_pos, y_pos):
+            return False
+        if ship.is_sunk() and not was_sunk:
+            self._ships_afloat -= 1
+        return True
 
     # shoot at enemy battlefield
     def shoot(self, x_pos, y_pos):
@@ -48,7 +115,9 @@ class Battlefield:
     # place the ship
     def place(self, ship_id, x_pos, y_pos, orientation):
         ship = self.get_ship(ship_id)
+        self._remove_from_index(ship)
         if ship.place(x_pos, y_pos, orientation):
+            self._add_to_index(ship)
             ship_type = ship.get_ship_type()
             if ship_type == "carrier":
                 self._ships_table_not_placed[0] -= 1
@@ -61,6 +130,8 @@ class Battlefield:
             elif ship_type == "submarine":
                 self._ships_table_not_placed[4] -= 1
             return True
+        # still where it was, if it was placed before
+        self._add_to_index(ship)
         return False
 
     def no_ship_at_place(self, x_pos, y_pos):
@@ -171,14 +242,14 @@ class Battlefield:
         return self._ships_table_not_placed
 
     def get_ship_from_location(self, x_pos, y_pos):
-        for ship in self._ships:
-            if ship.is_ship_at_location(x_pos, y_pos):
-                return ship
+        index = self._index_of(x_pos, y_pos)
+        if index is not None and not self._ship_index[index] == NO_SHIP:
+            return self._ships[self._ship_index[index]]
 
     def get_ship_id_from_location(self, x_pos, y_pos):
-        for ship in self._ships:
-            if ship.is_ship_at_location(x_pos, y_pos):
-                return ship.get_ship_id()
+        index = self._index_of(x_pos, y_pos)
+        if index is not None and not self._ship_index[index] == NO_SHIP:
+            return self._ship_index[index]
 
     def get_next_ship_id_to_place(self):
         for ship in self._ships:
@@ -196,10 +267,7 @@ class Battlefield:
                 return ship.get_ship_type()
 
     def all_ships_sunk(self):
-        for ship in self._ships:
-            if not ship.is_sunk():
-                return False
-        return True
+        return self._ships_afloat == 0
 
     def get_all_ship_states(self):
         ship_states = []
@@ -230,15 +298,11 @@ class Battlefield:
         return ship_state_list
 
     def get_moved_ship_hit_positions(self, ship_id):
-        moved_to_hit_positions = []
-        for ship in self._ships:
-            if ship.get_ship_id() == ship_id:
-                for i in range(self._length):
-                    for j in range(self._length):
-                        if self._my_battlefield[i][j] == 2:
-                            if ship.is_ship_at_location(i, j):
-                                moved_to_hit_positions.append((i, j))
-        return moved_to_hit_positions
+        # the cells of the ship that were struck without a hit, ordered like the matrix field
+        ship = self.get_ship(ship_id)
+        if ship is None or not ship.is_placed():
+            return []
+        return sorted(position for position in ship.get_ship_coordinates() if position in self._missed_strikes)
 
     def shot_missed(self, x_pos, y_pos):
         self._enemy_battlefield[x_pos][y_pos] = 2
@@ -0,0 +1,142 @@
+from typing import List
+from ..constants import Direction
+from .Battlefield import Battlefield
+""" class BitBattlefield
+    A Battlefield that keeps the ships' footprints, the strikes, the hits and the shots
+    as int bitmasks instead of the two matrix fields, see GameController.battlefield_class.
+    The cell (x, y) is bit y * stride + x, like in the Battlefield's index of the ships. The
+    stride leaves room for the ships sticking out of the board on the right and at the bottom,
+    so every ship's footprint fits into the mask and moving a ship is a shift of its footprint.
+    It behaves exactly like the Battlefield, including its quirks: placing and moving only
+    check the surroundings of the ship's first position, so footprints can overlap.
+"""
+
+
+class BitBattlefield(Battlefield):
+
+    def __init__(self, length: int, ships, ships_table: List[int]):
+        super().__init__(length, ships, ships_table)
+        # footprints of the placed ships, indexed by ship id (the ids are the positions in the ship list)
+        self._footprints: List[int] = [0] * len(ships)
+        # union of the footprints
+        self._occupied: int = 0
+        # own battlefield: every cell the enemy struck, and the struck cells where a ship was hit
+        self._strikes: int = 0
+        self._hits: int = 0
+        # enemy battlefield: cells shot at, without the ones that missed
+        self._shots: int = 0
+
+    def _create_matrix_fields(self):
+        # the bitmasks replace the matrix fields, every method of the Battlefield that uses them is overridden below
+        pass
+
+    def _bit(self, x_pos, y_pos) -> int:
+        # 0 for cells outside of the masks
+        if 0 <= x_pos < self._stride and 0 <= y_pos < self._stride:
+            return 1 << (y_pos * self._stride + x_pos)
+        return 0
+
+    def _footprint(self, ship) -> int:
+        footprint: int = 0
+        for x_pos, y_pos in ship.get_ship_coordinates():
+            footprint |= self._bit(x_pos, y_pos)
+        return footprint
+
+    def _surroundings(self, x_pos, y_pos) -> int:
+        # the cell and its (up to) eight neighbours
+        row: int = 0b111 << (x_pos - 1) if x_pos > 0 else 0b11
+        rows: int = row | row << self._stride
+        if y_pos > 0:
+            return (rows | row << 2 * self._stride) << (y_pos - 1) * self._stride
+        return rows
+
+    def _set_footprint(self, ship_id, footprint):
+        # clear the cells the ship left and set the ones it covers now
+        old_footprint: int = self._footprints[ship_id]
+        self._footprints[ship_id] = footprint
+        self._occupied = (self._occupied & ~old_footprint) | footprint
+        if self._ships_overlap:
+            # another ship might still cover some of the cells
+            self._occupied |= self._covered_by_others(old_footprint, ship_id)
+
+    def _covered_by_others(self, cells, ship_id) -> int:
+        # only needed once ships overlapped, before that no cell of a ship is covered by another one
+        covered: int = 0
+        for other_id, footprint in enumerate(self._footprints):
+            if not other_id == ship_id:
+                covered |= footprint & cells
+        return covered
+
+    # move a ship one position further
+    def move(self, ship_id, direction):
+        if not super().move(ship_id, direction):
+            return False
+        # the first position stays on the board, so no cell leaves the mask
+        if direction == Direction.EAST:
+            self._set_footprint(ship_id, self._footprints[ship_id] << 1)
+        elif direction == Direction.WEST:
+            self._set_footprint(ship_id, self._footprints[ship_id] >> 1)
+        elif direction == Direction.SOUTH:
+            self._set_footprint(ship_id, self._footprints[ship_id] << self._stride)
+        elif direction == Direction.NORTH:
+            self._set_footprint(ship_id, self._footprints[ship_id] >> self._stride)
+        return True
+
+    # enemy strike, returns the ship that was hit
+    def strike_at(self, x_pos, y_pos):
+        bit: int = self._bit(x_pos, y_pos)
+        self._strikes |= bit
+        ship = self.get_ship_from_location(x_pos, y_pos)
+        if ship is not None and self._strike_ship(ship, x_pos, y_pos):
+            self._hits |= bit
+            return ship
+        # no hit
+        return None
+
+    # shoot at enemy battlefield
+    def shoot(self, x_pos, y_pos):
+        bit: int = self._bit(x_pos, y_pos)
+        if self._shots & bit:
+            return False
+        self._shots |= bit
+        return True
+
+    # place the ship
+    def place(self, ship_id, x_pos, y_pos, orientation):
+        if super().place(ship_id, x_pos, y_pos, orientation):
+            self._set_footprint(ship_id, self._footprint(self.get_ship(ship_id)))
+            return True
+        return False
+
+    def no_ship_at_place(self, x_pos, y_pos):
+        return not self._occupied & self._surroundings(x_pos, y_pos)
+
+    def no_ship_at_place_but(self, x_pos, y_pos, ship_id):
+        footprint: int = self._footprints[ship_id]
+        others: int = self._occupied & ~footprint
+        if self._ships_overlap:
+            others |= self._covered_by_others(footprint, ship_id)
+        return not others & self._surroundings(x_pos, y_pos)
+
+    def no_strike_at_place(self, x_pos, y_pos):
+        # a struck cell without a hit can be struck again, a ship might have moved there
+        return not self._hits & self._bit(x_pos, y_pos)
+
+    def no_hit_at_place(self, x_pos, y_pos):
+        return not self._shots & self._bit(x_pos, y_pos)
+
+    def get_moved_ship_hit_positions(self, ship_id):
+        # struck cells without a hit that the ship covers now, on the board and ordered like the matrix field
+        covered: int = self._footprints[ship_id] & self._strikes & ~self._hits
+        moved_to_hit_positions = []
+        while covered:
+            bit: int = covered & -covered
+            y_pos, x_pos = divmod(bit.bit_length() - 1, self._stride)
+            if x_pos < self._length and y_pos < self._length:
+                moved_to_hit_positions.append((x_pos, y_pos))
+            covered ^= bit
+        moved_to_hit_positions.sort()
+        return moved_to_hit_positions
+
+    def shot_missed(self, x_pos, y_pos):
+        self._shots &= ~self._bit(x_pos, y_pos)
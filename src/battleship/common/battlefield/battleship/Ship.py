@@ -19,6 +19,8 @@ class Ship:
         self._placed = False
         self._hit = False
         self._sunk = False
+        # cells not hit yet, the ship is sunk at 0
+        self._health = x_length * y_length
         self._ship_state = [[[] for _ in range(y_length)] for _ in range(x_length)]
         for i in range(self._x_length):
             for j in range(self._y_length):
@@ -81,6 +83,7 @@ class Ship:
         return False
 
     def rotate_ship(self):
+        self._health = self._x_length * self._y_length
         if self._orientation == Orientation.NORTH:
             for i in range(self._x_length):
                 for j in range(self._y_length):
@@ -100,6 +103,7 @@ class Ship:
         self._x_pos = x_pos
         self._y_pos = y_pos
         self._orientation = orientation
+        self._health = self._x_length * self._y_length
         if self._orientation == Orientation.NORTH:
             for i in range(self._x_length):
                 for j in range(self._y_length):
@@ -125,24 +129,18 @@ class Ship:
         return self._sunk
 
     def strike(self, x_pos, y_pos):
-        hit_counter = 0
-        damaged = False
         for i in range(self._x_length):
             for j in range(self._y_length):
                 [(x, y), state] = self._ship_state[i][j]
-                if state == 1:
-                    hit_counter += 1
                 if x == x_pos and y == y_pos:
+                    if state == 0:
+                        self._health -= 1
                     self._ship_state[i][j] = [(x, y), 1]
                     self._hit = True
-                    damaged = True
-                    hit_counter += 1
-        if hit_counter >= self._x_length * self._y_length:
-            self._sunk = True
-        if damaged:
-            return True
-        else:
-            return False
+                    if self._health == 0:
+                        self._sunk = True
+                    return True
+        return False
 
     def get_ship_length(self):
         return len(self._ship_state)
@@ -4,6 +4,49 @@ from enum import IntEnum, IntFlag
 class Constants:
     SERVER_PORT = 4242
     SERVER_IP = '127.0.0.1'
+    # ask for the changes of the game list with the lobby version from the start, not only once the
+    # server sent a LOBBY_VERSION (an extension of the RFC, see client.py --lobby-versions)
+    LOBBY_VERSIONS = False
+    # seconds the client waits for the changes of the game list before it asks for the whole list
+    LOBBY_SYNC_TIMEOUT = 5.0
+
+
+class OutboundPolicy(IntEnum):
+    # what happens to a client whose outbound queue exceeds the high watermark,
+    # DROP only drops the lobby messages, the game messages are queued up to the OUTBOUND_HARD_LIMIT
+    DROP = 0
+    DISCONNECT = 1
+
+
+class MessageClass(IntEnum):
+    # the message classes with their own rate limits, see server/ratelimit.py
+    CHAT = 0
+    LOBBY = 1
+    GAME = 2
+
+
+class ServerConfig:
+    # bytes not yet sent to a client after which the OUTBOUND_POLICY applies to new messages…
+    OUTBOUND_HIGH_WATERMARK = 4 * 1024 * 1024
+    # …until the client has received enough to be below this again
+    OUTBOUND_LOW_WATERMARK = 1024 * 1024
+    OUTBOUND_POLICY = OutboundPolicy.DISCONNECT
+    # bytes not yet sent to a client after which it is disconnected whatever the OUTBOUND_POLICY,
+    # with DROP the game messages of a client that doesn't read would be queued forever
+    OUTBOUND_HARD_LIMIT = 4 * OUTBOUND_HIGH_WATERMARK
+    # number of GAME/DELETE_GAME messages the server remembers for the delta synchronization of the game list
+    LOBBY_CHANGE_LOG_LENGTH = 1024
+    # events a running game queues before the clients sending to it have to wait, see server/gameactor.py
+    GAME_MAILBOX_SIZE = 64
+    # token buckets per client and message class: messages per second, burst size.
+    # Off unless the server is started with --rate-limit, clients of the RFC don't expect the errors.
+    RATE_LIMITING = False
+    RATE_LIMITS = {MessageClass.CHAT: (2, 10), MessageClass.LOBBY: (10, 50), MessageClass.GAME: (20, 50)}
+    # a message waits at most this many seconds for a token, otherwise it's answered with an error
+    RATE_LIMIT_MAX_DELAYS = {MessageClass.CHAT: 0.0, MessageClass.LOBBY: 1.0, MessageClass.GAME: 1.0}
+    # clients whose messages are rejected this many times within RATE_LIMIT_WINDOW seconds are disconnected
+    RATE_LIMIT_MAX_REJECTED = 20
+    RATE_LIMIT_WINDOW = 10.0
 
 
 class Orientation(IntEnum):
@@ -34,6 +77,8 @@ class ErrorCode(IntEnum):
     ILLEGAL_STATE_NOT_LOGGED_IN = 2
     ILLEGAL_STATE_NOT_IN_GAME = 3
     ILLEGAL_STATE_NOT_YOUR_TURN = 4
+    # not in the RFC: the message exceeded the rate limits of the server, see server/ratelimit.py
+    ILLEGAL_STATE_TOO_MANY_MESSAGES = 5
     ILLEGAL_STATE_GAME_ALREADY_STARTED = 8
     ILLEGAL_STATE_NUMBER_OF_GAMES_LIMIT_EXCEEDED = 9
     # Syntax Errors
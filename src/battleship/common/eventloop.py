@@ -0,0 +1,35 @@
+"""
+Selection of the event loop implementation.
+
+Everything that runs an event loop gets it from create_event_loop, so that
+uvloop can be used instead of the asyncio event loop with `--loop uvloop`.
+"""
+import asyncio
+import logging
+from argparse import ArgumentParser
+
+EVENT_LOOPS = ["asyncio", "uvloop"]
+
+
+def add_event_loop_argument(parser: ArgumentParser) -> None:
+    parser.add_argument("--loop", help="event loop implementation, uvloop falls back to asyncio if it is not installed",
+                        choices=EVENT_LOOPS, default="asyncio")
+
+
+def create_event_loop(name: str = "asyncio"):
+    if name == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            logging.warning("uvloop is not installed, using the asyncio event loop")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    # newer versions of uvloop don't create a loop in get_event_loop anymore
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def event_loop_name(loop) -> str:
+    # the module of the loop class, i.e. "asyncio" or "uvloop"
+    return type(loop).__module__.split(".")[0]
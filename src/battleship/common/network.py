@@ -1,9 +1,10 @@
-from typing import Tuple, Dict, List, Callable
+from typing import Tuple, Dict, List, Callable, Deque, Optional
+from collections import deque
 import logging
 import inspect
 import asyncio.streams
 from asyncio import Event, StreamReader, StreamWriter
-from .protocol import ProtocolMessage, ProtocolMessageType, parse_from_stream
+from .protocol import ProtocolMessage, ProtocolMessageType, ProtocolMessageDecoder, parse_from_stream
 from common.constants import ErrorCode
 
 
@@ -29,6 +30,10 @@ class BattleshipClient:
         self.connected = False
 
     async def _internal_msg_callback(self, msg):
+        # a LOBBY_VERSION only follows the answer to a GET_GAMES with a lobby version, it is no answer of its own
+        if msg.type == ProtocolMessageType.LOBBY_VERSION:
+            await self.msg_callback(msg)
+            return
         if msg.type == ProtocolMessageType.ERROR:
             self.last_msg_was_error = True
             self.last_error = msg.parameters["error_code"]
@@ -70,13 +75,163 @@ class BattleshipClient:
         # TODO: should we call the closed_callback here? No, because close is called from outside, they can decide this themselves.
 
 
+class ProtocolWriter:
+    """
+    The parts of a StreamWriter the server uses, for connections handled by BattleshipProtocol.
+    """
+
+    def __init__(self, transport, protocol) -> None:
+        self.transport = transport
+        self.protocol = protocol
+
+    def write(self, data: bytes) -> None:
+        self.transport.write(data)
+
+    def writelines(self, data: List[bytes]) -> None:
+        self.transport.writelines(data)
+
+    async def drain(self) -> None:
+        await self.protocol.wait_until_writable()
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class BattleshipProtocol(asyncio.Protocol):
+    """
+    Handles one client connection without a StreamReader and a task per connection:
+    the received data is fed directly into a ProtocolMessageDecoder and the messages
+    are passed to the callbacks from the client_connected_callback of BattleshipServer,
+    one after the other. A task only exists while there are messages to handle.
+    """
+
+    # stop reading from a client while this many of its messages wait to be handled
+    MAX_PENDING_MESSAGES = 256
+
+    def __init__(self, loop, client_connected_callback) -> None:
+        self.loop = loop
+        self.client_connected_callback = client_connected_callback
+        self.transport = None
+        self.writer: Optional[ProtocolWriter] = None
+        self.decoder: ProtocolMessageDecoder = ProtocolMessageDecoder()
+        self.pending: Deque[ProtocolMessage] = deque()
+        # the received bytes of the pending messages, for detach
+        self.pending_frames: Deque[bytes] = deque()
+        self.dispatching: Optional[asyncio.Task] = None
+        self.msg_callback = None
+        self.disconnected_callback = None
+        self.is_closed: bool = False
+        self.is_detached: bool = False
+        self.is_reading_paused: bool = False
+        # don't read before resume_reading, e.g. for a connection taken over from another process
+        self.start_paused: bool = False
+        # exists while the transport buffers more than its high watermark
+        self.writable_waiter: Optional[asyncio.Future] = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        self.writer = ProtocolWriter(transport, self)
+        self.msg_callback, self.disconnected_callback = self.client_connected_callback(None, self.writer)
+        if not inspect.iscoroutinefunction(self.msg_callback):
+            raise TypeError("msg_callback must be a coroutine")
+        if self.start_paused:
+            self.pause_reading()
+
+    def data_received(self, data: bytes) -> None:
+        if self.is_detached:
+            return
+        frames: List[bytes] = []
+        self.pending.extend(self.decoder.feed(data, frames))
+        self.pending_frames.extend(frames)
+        if len(self.pending) >= BattleshipProtocol.MAX_PENDING_MESSAGES:
+            self.pause_reading()
+        if len(self.pending) > 0 and self.dispatching is None:
+            self.dispatching = self.loop.create_task(self.dispatch())
+
+    async def dispatch(self) -> None:
+        try:
+            while len(self.pending) > 0 and not self.is_detached:
+                self.pending_frames.popleft()
+                await self.msg_callback(self.pending.popleft())
+                if len(self.pending) < BattleshipProtocol.MAX_PENDING_MESSAGES // 2 and self.writable_waiter is None:
+                    self.resume_reading()
+        except Exception as e:
+            # with streams this would end the task reading from the client
+            logging.info("Error while handling a message, closing the connection: {}".format(e))
+            self.pending.clear()
+            self.pending_frames.clear()
+            self.transport.close()
+        finally:
+            self.dispatching = None
+            if self.is_closed:
+                await self.disconnected_callback()
+
+    def detach(self) -> bytes:
+        """
+        Stops handling this connection, e.g. because another process takes it over.
+        Returns the received bytes that were not handled yet, as they were received,
+        what was not read from the socket yet stays there.
+        """
+        self.pause_reading()
+        self.is_detached = True
+        data: bytes = b''.join(self.pending_frames)
+        self.pending.clear()
+        self.pending_frames.clear()
+        return data + self.decoder.take_buffer()
+
+    def pause_reading(self) -> None:
+        if not self.is_reading_paused and not self.is_closed:
+            self.is_reading_paused = True
+            self.transport.pause_reading()
+
+    def resume_reading(self) -> None:
+        if self.is_reading_paused and not self.is_closed and not self.is_detached:
+            self.is_reading_paused = False
+            self.transport.resume_reading()
+
+    def pause_writing(self) -> None:
+        # like parse_from_stream, don't read from a client that doesn't read what we send
+        self.writable_waiter = self.loop.create_future()
+        self.pause_reading()
+
+    def resume_writing(self) -> None:
+        self.wake_writable_waiter()
+        if len(self.pending) < BattleshipProtocol.MAX_PENDING_MESSAGES:
+            self.resume_reading()
+
+    async def wait_until_writable(self) -> None:
+        if self.is_closed:
+            raise ConnectionResetError("Connection lost")
+        if self.writable_waiter is not None:
+            await self.writable_waiter
+
+    def wake_writable_waiter(self, exc: Optional[Exception] = None) -> None:
+        waiter, self.writable_waiter = self.writable_waiter, None
+        if waiter is not None and not waiter.done():
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.is_closed = True
+        self.wake_writable_waiter(ConnectionResetError("Connection lost"))
+        # the messages that were already received are still handled, then the client is removed
+        if self.dispatching is None:
+            self.loop.create_task(self.disconnected_callback())
+
+
 class BattleshipServer:
 
-    def __init__(self, ip: str, port: int, loop, client_connected_callback) -> None:
+    def __init__(self, ip: str, port: int, loop, client_connected_callback, transport: str="stream", reuse_port: bool=False) -> None:
         self.ip: str = ip
         self.port: int = port
         self.loop = loop
         self.client_connected_callback = client_connected_callback
+        # "stream": a task running parse_from_stream per client, "protocol": BattleshipProtocol
+        self.transport: str = transport
+        # several processes listen on the same port, see server.py --workers
+        self.reuse_port: bool = reuse_port
         self.server = None
         # TODO: what's the type of StreamReader and StreamWriter?
         self.clients: Dict[asyncio.Task, Tuple[StreamReader, StreamWriter]] = {}
@@ -108,6 +263,9 @@ class BattleshipServer:
 
         task.add_done_callback(internal_client_done)
 
+    def protocol_factory(self) -> BattleshipProtocol:
+        return BattleshipProtocol(self.loop, self.client_connected_callback)
+
     def start(self) -> None:
         """
         Starts the TCP server, so that it listens on the specified port.
@@ -115,10 +273,14 @@ class BattleshipServer:
         called.  This method runs the loop until the server sockets
         are ready to accept connections.
         """
-        self.server = self.loop.run_until_complete(
-            asyncio.streams.start_server(self._accept_client,
-                                         self.ip, self.port,
-                                         loop=self.loop))
+        if self.transport == "protocol":
+            self.server = self.loop.run_until_complete(
+                self.loop.create_server(self.protocol_factory, self.ip, self.port, reuse_port=self.reuse_port))
+        else:
+            self.server = self.loop.run_until_complete(
+                asyncio.streams.start_server(self._accept_client,
+                                             self.ip, self.port,
+                                             loop=self.loop, reuse_port=self.reuse_port))
 
     def stop(self) -> None:
         """
@@ -1,12 +1,15 @@
 """
 This file contains the classes and functions needed for creating, sending,
 receiving and parsing protocol messages. The main class is ProtocolMessage,
-which has a member function to send itself over the wire. The function
-parse_from_stream on the other hand listens on a stream and hands reconstructed
-ProtocolMessage objects to a callback. A ProtocolMessage object holds a type
-value of type ProtocolMessageType (an enum which holds the different command
-numbers defined by the RFC), and a dictionary of protocol fields which maps
-a string name to an arbitrary object (for example "username" to "benjamin").
+which has a member function to send itself over the wire. The class
+ProtocolMessageDecoder on the other hand is fed with arbitrary chunks of bytes
+and reconstructs ProtocolMessage objects from them, without doing any IO itself.
+The function parse_from_stream listens on a stream, feeds whatever it reads
+into such a decoder and hands the reconstructed messages to a callback.
+A ProtocolMessage object holds a type value of type ProtocolMessageType (an
+enum which holds the different command numbers defined by the RFC), and a
+dictionary of protocol fields which maps a string name to an arbitrary object
+(for example "username" to "benjamin").
 
 The protocol messages are configurable under certain assumptions. These are:
 - length fields for fields, if present, preceed the field directly
@@ -19,9 +22,13 @@ corresponds to the key in the dictionary of parameters in a ProtocolMessage obje
 and certain definitions about the length (fixed, implicit).
 
 The parsing and sending functions use the configured fields to read or send
-the fields in the right order and with the specified length fields. Thus, there
-is one generic sending function (ProtocolMessage.send) and one generic parsing
-function (parse_from_stream).
+the fields in the right order and with the specified length fields. To not walk
+the list of fields for every single message, a ProtocolMessageCodec is compiled
+for each message type when this module is imported: runs of fixed length fields
+are packed and unpacked with one struct.Struct, followed by length prefixed or
+implicit length fields. ProtocolMessage.send and ProtocolMessageDecoder (once the
+header and the whole payload of a message have been received) dispatch directly
+to the codec of the message type, see ProtocolMessageCodecs.
 
 For non-trivial protocol fields such as the position of ships or the numbers
 of ships in a game, custom classes have been created which contain functions
@@ -32,12 +39,16 @@ by the sending and parsing function and make them more readable.
 One special case is the GAMES message, which can contain an arbitrary number
 of games. This is implemented in ProtocolMessage as a so called "repeating
 message type": the paramaters list can contain multiple dictionaries. Each
-is sent one after another, using the configured protocol fields.
+is sent one after another, using the configured protocol fields. If they don't
+fit into one protocol message, ProtocolMessage.encode_frames splits them up
+into as many messages as needed.
 """
 
 import logging
+import struct
 from enum import Enum, IntEnum
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Callable
+from operator import itemgetter
 from .constants import Orientation, EndGameReason, Direction, ErrorCode, GameOptions
 from random import randrange, choice
 
@@ -49,11 +60,13 @@ class ProtocolConfig:
     BYTEORDER = 'big'
     STR_ENCODING = 'utf-8'
     PAYLOAD_LENGTH_BYTES = 2
+    PAYLOAD_MAX_LENGTH = 2**(8*PAYLOAD_LENGTH_BYTES) - 1
     USERNAME_MAX_LENGTH = 22
     CHAT_MAX_TEXT_LENGTH = 63
     BOARD_SIZE_MIN = 10
     BOARD_SIZE_MAX = 26
     ROUND_TIMES = [_ for _ in range(25, 65, 5)]
+    READ_CHUNK_SIZE = 65536
 
 
 class ProtocolMessageType(IntEnum):
@@ -63,6 +76,8 @@ class ProtocolMessageType(IntEnum):
     GAMES = 2
     GAME = 3
     DELETE_GAME = 4
+    # not in the RFC, see the comment above ProtocolMessageParameters
+    LOBBY_VERSION = 5
     # Lobby, Client messages
     LOGIN = 51
     LOGOUT = 52
@@ -127,6 +142,8 @@ class ProtocolField:
             value = randrange(0, 1+1)
         elif self.name == "ship_id":
             value = randrange(0, 255+1)
+        elif self.name == "lobby_version":
+            value = randrange(0, 2**32)
         elif self.type in [NumShips, Position, Positions, ShipPosition, ShipPositions]:
             value = self.type.random()
         elif self.type in [GameOptions, EndGameReason, Orientation, Direction, ErrorCode]:
@@ -178,10 +195,8 @@ class Positions:
     def from_bytes(cls, data: bytes):
         # TODO: raise Exception if len(data) is not a multiple of 2
         num_positions: int = int(len(data)/2)
-        positions: List[Position] = []
-        for i in range(num_positions):
-            positions.append(Position.from_bytes(data[2*i:2*i+2]))
-        return cls(positions)
+        return cls([Position(vertical, horizontal) for vertical, horizontal in
+                    _POSITION_STRUCT.iter_unpack(data[:2*num_positions])])
 
     @classmethod
     def random(cls):
@@ -203,10 +218,7 @@ class Positions:
         return len(self.positions)
 
     def to_bytes(self) -> bytes:
-        b: bytes = b''
-        for position in self.positions:
-            b += position.to_bytes()
-        return b
+        return b''.join([position.to_bytes() for position in self.positions])
 
     def __str__(self) -> str:
         s: str = "{"
@@ -256,10 +268,8 @@ class ShipPositions:
     # TODO: def from_bytes(cls, data: bytes) -> ShipPositions:
         # TODO: raise Exception if len(data) is not a multiple of 3
         num_ship_positions: int = int(len(data)/3)
-        positions: List[ShipPosition] = []
-        for i in range(num_ship_positions):
-            positions.append(ShipPosition.from_bytes(data[3*i:3*i+3]))
-        return cls(positions)
+        return cls([ShipPosition(Position(vertical, horizontal), Orientation(orientation)) for vertical, horizontal, orientation in
+                    _SHIP_POSITION_STRUCT.iter_unpack(data[:3*num_ship_positions])])
 
     @classmethod
     def random(cls):
@@ -282,10 +292,7 @@ class ShipPositions:
         return len(self.positions)
 
     def to_bytes(self) -> bytes:
-        b: bytes = b''
-        for position in self.positions:
-            b += position.to_bytes()
-        return b
+        return b''.join([position.to_bytes() for position in self.positions])
 
     def __str__(self) -> str:
         s: str = "{"
@@ -367,6 +374,8 @@ _field_round_time: ProtocolField = ProtocolField(name="round_time", field_type=i
 _field_options: ProtocolField = ProtocolField(name="options", field_type=GameOptions, fixed_length=True, length=1)
 _field_password: ProtocolField = ProtocolField(name="password", field_type=str, fixed_length=False, optional=True, implicit_length=True)
 _field_game_id: ProtocolField = ProtocolField(name="game_id", field_type=int, fixed_length=True, length=2)
+_field_lobby_version: ProtocolField = ProtocolField(name="lobby_version", field_type=int, fixed_length=True, length=4)
+_field_lobby_version_optional: ProtocolField = ProtocolField(name="lobby_version", field_type=int, fixed_length=True, length=4, optional=True)
 
 # Not yet defined parameters of Game messages
 _field_turn_counter: ProtocolField = ProtocolField(name="turn_counter", field_type=int, fixed_length=True, length=1)
@@ -385,6 +394,12 @@ _field_direction: ProtocolField = ProtocolField(name="direction", field_type=Dir
 _field_error_code: ProtocolField = ProtocolField(name="error_code", field_type=ErrorCode, fixed_length=True, length=1)
 
 
+# Extension of the RFC for the delta synchronization of the game list: a client may
+# send the last lobby version it has seen as an optional parameter of GET_GAMES.
+# The server then replies with the GAME and DELETE_GAME messages the client missed
+# since then (or with GAMES, if it is too far behind), followed by a LOBBY_VERSION
+# message with the current version. A GET_GAMES without parameter is answered
+# as specified by the RFC.
 # TODO: is it pythonic to declare it as a global dictionary?
 ProtocolMessageParameters: Dict[ProtocolMessageType, List[ProtocolField]] = {
     ProtocolMessageType.NONE: [],
@@ -395,6 +410,7 @@ ProtocolMessageParameters: Dict[ProtocolMessageType, List[ProtocolField]] = {
     ProtocolMessageType.GAME: [_field_game_id, _field_username_implicit_length, _field_board_size,
                                _field_num_ships, _field_round_time, _field_options],
     ProtocolMessageType.DELETE_GAME: [_field_game_id],
+    ProtocolMessageType.LOBBY_VERSION: [_field_lobby_version],
     # Lobby, Client messages
     ProtocolMessageType.LOGIN: [_field_username_implicit_length],
     ProtocolMessageType.LOGOUT: [],
@@ -403,7 +419,7 @@ ProtocolMessageParameters: Dict[ProtocolMessageType, List[ProtocolField]] = {
                                       _field_options, _field_password],
     ProtocolMessageType.CANCEL: [],
     ProtocolMessageType.JOIN: [_field_game_id, _field_password],
-    ProtocolMessageType.GET_GAMES: [],
+    ProtocolMessageType.GET_GAMES: [_field_lobby_version_optional],
     # Game, Server messages
     ProtocolMessageType.STARTGAME: [_field_board_size, _field_num_ships, _field_round_time, _field_opponent_name],
     ProtocolMessageType.PLACED: [],
@@ -428,6 +444,271 @@ ProtocolMessageParametersFieldNames: Dict[ProtocolMessageType, List[str]] = {msg
 ProtocolMessageRepeatingTypes: List[ProtocolMessageType] = [ProtocolMessageType.GAMES]
 
 
+# struct format characters of the values of fixed length fields, the order of the values
+# is the one of the bytes on the wire
+_STRUCT_BYTEORDER: str = ">" if ProtocolConfig.BYTEORDER == "big" else "<"
+_STRUCT_UINT_FORMATS: Dict[int, str] = {1: "B", 2: "H", 4: "I"}
+_STRUCT_CLASS_FORMATS: Dict[Any, str] = {NumShips: "5B", Position: "2B", ShipPosition: "3B"}
+_INT_FIELD_TYPES: List[Any] = [int, Orientation, EndGameReason, Direction, ErrorCode, GameOptions]
+
+_POSITION_STRUCT: struct.Struct = struct.Struct(_STRUCT_BYTEORDER + _STRUCT_CLASS_FORMATS[Position])
+_SHIP_POSITION_STRUCT: struct.Struct = struct.Struct(_STRUCT_BYTEORDER + _STRUCT_CLASS_FORMATS[ShipPosition])
+_HEADER_STRUCT: struct.Struct = struct.Struct(_STRUCT_BYTEORDER + "B" + _STRUCT_UINT_FORMATS[ProtocolConfig.PAYLOAD_LENGTH_BYTES])
+_FIELD_LENGTH_STRUCT: struct.Struct = struct.Struct(_STRUCT_BYTEORDER + "B")
+
+
+class _FixedFieldsRun:
+    """
+    A run of consecutive fixed length fields, which are packed and unpacked
+    with one precompiled struct.Struct.
+    """
+
+    def __init__(self, fields: List[ProtocolField]) -> None:
+        self.fields: List[ProtocolField] = fields
+        self.names: List[str] = [field.name for field in fields]
+        self.types: List[Any] = [field.type for field in fields]
+        struct_format: str = _STRUCT_BYTEORDER
+        for field in fields:
+            if field.type in _INT_FIELD_TYPES:
+                struct_format += _STRUCT_UINT_FORMATS[field.length]
+            else:
+                struct_format += _STRUCT_CLASS_FORMATS[field.type]
+        self.struct: struct.Struct = struct.Struct(struct_format)
+        if not self.struct.size == sum(field.length for field in fields):
+            raise ValueError("Struct format {} does not match the field lengths".format(struct_format))
+        # if all fields are plain integers, values can be packed and unpacked without conversion
+        self.only_ints: bool = all(field.type in _INT_FIELD_TYPES for field in fields)
+        self.optional: bool = any(field.optional for field in fields)
+        # the runs of a single optional field are the only ones which may be missing
+        if self.optional and len(fields) > 1:
+            raise ValueError("Optional fixed length fields must be in a run of their own")
+
+    def values_from_parameters(self, parameters: Dict[str, Any]) -> List[Any]:
+        if self.only_ints:
+            return [parameters[name] for name in self.names]
+        values: List[Any] = []
+        for name, field_type in zip(self.names, self.types):
+            value = parameters[name]
+            if field_type is Position:
+                values.append(value.vertical)
+                values.append(value.horizontal)
+            elif field_type is ShipPosition:
+                values.append(value.position.vertical)
+                values.append(value.position.horizontal)
+                values.append(value.orientation)
+            elif field_type is NumShips:
+                values.extend(value.numbers)
+            else:
+                values.append(value)
+        return values
+
+    def parameters_from_values(self, values: tuple, parameters: Dict[str, Any]) -> None:
+        if self.only_ints:
+            parameters.update(zip(self.names, values))
+            return
+        index: int = 0
+        for name, field_type in zip(self.names, self.types):
+            if field_type is Position:
+                parameters[name] = Position(values[index], values[index+1])
+                index += 2
+            elif field_type is ShipPosition:
+                parameters[name] = ShipPosition(Position(values[index], values[index+1]), Orientation(values[index+2]))
+                index += 3
+            elif field_type is NumShips:
+                parameters[name] = NumShips(list(values[index:index+5]))
+                index += 5
+            else:
+                parameters[name] = values[index]
+                index += 1
+
+
+class ProtocolMessageCodec:
+    """
+    Specialized encoder and decoder for the payload of one ProtocolMessageType.
+    The codecs are compiled once from ProtocolMessageParameters when this module
+    is imported: runs of fixed length fields become one struct.Struct each,
+    variable length fields are either prefixed by a length field or take the
+    remaining bytes (implicit length).
+    """
+
+    def __init__(self, msg_type: ProtocolMessageType, fields: List[ProtocolField]) -> None:
+        self.type: ProtocolMessageType = msg_type
+        self.repeating: bool = msg_type in ProtocolMessageRepeatingTypes
+        # each segment is either a _FixedFieldsRun or a variable length ProtocolField
+        self.segments: List[Any] = []
+        # for implicit length fields: the number of fixed length bytes that follow them
+        self.trailing_lengths: Dict[str, int] = {}
+
+        run: List[ProtocolField] = []
+        for field_index, field in enumerate(fields):
+            if field.fixed_length and not field.optional:
+                run.append(field)
+                continue
+            if run:
+                self.segments.append(_FixedFieldsRun(run))
+                run = []
+            if field.fixed_length:
+                self.segments.append(_FixedFieldsRun([field]))
+            else:
+                if field.implicit_length:
+                    self.trailing_lengths[field.name] = sum(other_field.length for other_field in fields[field_index+1:])
+                self.segments.append(field)
+        if run:
+            self.segments.append(_FixedFieldsRun(run))
+
+        self._encode: Callable[[Dict[str, Any]], bytes] = self._compile_encoder()
+        # messages which consist of exactly one run of fixed length fields can be decoded in one step
+        self._fixed_run: Optional[_FixedFieldsRun] = None
+        if len(self.segments) == 1 and isinstance(self.segments[0], _FixedFieldsRun) and not self.repeating:
+            self._fixed_run = self.segments[0]
+
+    def _compile_encoder(self) -> Callable[[Dict[str, Any]], bytes]:
+        steps: List[Callable[[Dict[str, Any]], bytes]] = [self._compile_segment_encoder(segment) for segment in self.segments]
+        if len(steps) == 0:
+            return lambda parameters: b''
+        elif len(steps) == 1:
+            return steps[0]
+        elif len(steps) == 2:
+            # e.g. CHAT_SEND and JOIN, concatenating is cheaper than joining a list
+            first, second = steps
+            return lambda parameters: first(parameters) + second(parameters)
+        else:
+            return lambda parameters: b''.join([step(parameters) for step in steps])
+
+    def _compile_segment_encoder(self, segment: Any) -> Callable[[Dict[str, Any]], bytes]:
+        if isinstance(segment, _FixedFieldsRun):
+            pack = segment.struct.pack
+            if segment.optional and segment.only_ints:
+                name: str = segment.names[0]
+                return lambda parameters: pack(parameters[name]) if name in parameters else b''
+            elif segment.optional:
+                name = segment.names[0]
+                return lambda parameters: pack(*segment.values_from_parameters(parameters)) if name in parameters else b''
+            elif segment.only_ints and len(segment.names) == 1:
+                name = segment.names[0]
+                return lambda parameters: pack(parameters[name])
+            elif segment.only_ints:
+                getter = itemgetter(*segment.names)
+                return lambda parameters: pack(*getter(parameters))
+            else:
+                return lambda parameters: pack(*segment.values_from_parameters(parameters))
+
+        field: ProtocolField = segment
+        name = field.name
+        is_str: bool = field.type is str
+        encoding: str = ProtocolConfig.STR_ENCODING
+        pack_length = _FIELD_LENGTH_STRUCT.pack
+
+        if not field.optional and is_str and field.implicit_length:
+            return lambda parameters: parameters[name].encode(encoding)
+        elif not field.optional and is_str:
+            def encode_str_with_length(parameters: Dict[str, Any]) -> bytes:
+                parameter_bytes: bytes = parameters[name].encode(encoding)
+                # We have a length field for this field. And it has length 1 by definition
+                return pack_length(len(parameter_bytes)) + parameter_bytes
+            return encode_str_with_length
+        elif is_str and field.implicit_length and not self.type == ProtocolMessageType.CREATE_GAME:
+            # e.g. the password of a JOIN, we don't know at this layer if one is needed
+            return lambda parameters: parameters[name].encode(encoding) if name in parameters else b''
+
+        def encode_field(parameters: Dict[str, Any]) -> bytes:
+            if name not in parameters:
+                if not field.optional:
+                    raise KeyError(name)
+                # Now handle the different cases in the protocol.
+                if self.type == ProtocolMessageType.CREATE_GAME and (parameters["options"] & GameOptions.PASSWORD):
+                    raise AttributeError("Send ProtocolMessage: missing password, but options say there shoud be one.")
+                # In case of JOIN_GAME, we simply don't know at this layer, if a password is needed.
+                # So just don't send one.
+                return b''
+            parameter_bytes: bytes = parameters[name].encode(encoding) if is_str else parameters[name].to_bytes()
+            if field.implicit_length:
+                return parameter_bytes
+            # We have a length field for this field. And it has length 1 by definition
+            return pack_length(len(parameter_bytes)) + parameter_bytes
+
+        return encode_field
+
+    def encode(self, parameters: Dict[str, Any]) -> bytes:
+        try:
+            return self._encode(parameters)
+        except KeyError as e:
+            raise AttributeError("Send ProtocolMessage: missing parameter {} for type {}".format(e.args[0], self.type))
+        except struct.error as e:
+            # keep the exception type of int.to_bytes for values that don't fit into their field
+            raise OverflowError("Send ProtocolMessage: {} for type {}".format(e, self.type))
+
+    def decode(self, payload: bytes) -> List[Dict[str, Any]]:
+        payload_length: int = len(payload)
+        # for example an empty GAMES message
+        if payload_length == 0:
+            return [{}]
+
+        parameters: Dict[str, Any]
+        if self._fixed_run is not None and payload_length == self._fixed_run.struct.size:
+            parameters = {}
+            self._fixed_run.parameters_from_values(self._fixed_run.struct.unpack(payload), parameters)
+            return [parameters]
+
+        repeating_parameters: List[Dict[str, Any]] = []
+        offset: int = 0
+
+        while True:
+            parameters = {}
+            start_offset: int = offset
+
+            for segment in self.segments:
+                remaining: int = payload_length - offset
+                if remaining <= 0:
+                    break
+
+                if isinstance(segment, _FixedFieldsRun):
+                    if remaining < segment.struct.size:
+                        # truncated message, the missing parameters are detected by check_parameters
+                        offset = payload_length
+                        break
+                    segment.parameters_from_values(segment.struct.unpack_from(payload, offset), parameters)
+                    offset += segment.struct.size
+                    continue
+
+                field_length: int
+                if not segment.implicit_length:
+                    field_length = payload[offset]
+                    offset += 1
+                    # we have an empty parameter
+                    if field_length == 0:
+                        if segment.type is str:
+                            parameters[segment.name] = ""
+                        else:
+                            logging.error("ERROR(decode): empty parameter for type: {}".format(segment.type))
+                        continue
+                else:
+                    # all the remaining bytes belong to this field, except for the fixed length fields after it
+                    field_length = remaining - self.trailing_lengths[segment.name]
+                    # If there are no bytes left for it, the field is not present.
+                    # This can be the case when no password is set.
+                    if field_length <= 0:
+                        continue
+
+                field_bytes: bytes = payload[offset:offset+field_length]
+                if segment.type is str:
+                    parameters[segment.name] = field_bytes.decode(encoding=ProtocolConfig.STR_ENCODING)
+                else:
+                    parameters[segment.name] = segment.type.from_bytes(field_bytes)
+                offset += field_length
+
+            repeating_parameters.append(parameters)
+
+            # check if we have a repeating message type and there is more to come
+            if not self.repeating or offset >= payload_length or offset == start_offset:
+                break
+
+        return repeating_parameters
+
+
+ProtocolMessageCodecs: Dict[ProtocolMessageType, ProtocolMessageCodec] = {msg_type: ProtocolMessageCodec(msg_type, fields) for msg_type, fields in ProtocolMessageParameters.items()}
+
+
 class ProtocolMessage:
 
     def __init__(self, msg_type: ProtocolMessageType=ProtocolMessageType.NONE, repeating_parameters: Optional[List[Dict[str, Any]]]=None) -> None:
@@ -548,139 +829,164 @@ class ProtocolMessage:
                 return
 
     async def send_repeating(self, writer) -> None:
-        try:
-            await self.send(writer)
-        except ProtocolRepeatingMessageError as e:
-            # construct new msg with the remaining. And there _are_ remaining, otherwise the error would not have been raised
-            new_msg: ProtocolMessage = ProtocolMessage.create_repeating(self.type, self.repeating_parameters[e.last_index+1:])
-            await new_msg.send_repeating(writer)
+        writer.writelines(self.encode_frames())
+        await writer.drain()
 
-    async def send(self, writer) -> None:
+    def encode_frames(self) -> List[bytes]:
+        """
+        Encodes all of the repeating parameters, each of them exactly once, into
+        as many protocol messages as needed. Returns the chunks of bytes of all
+        messages, to be written with one call to writelines.
+        """
+        codec: ProtocolMessageCodec = ProtocolMessageCodecs[self.type]
+        return frame_payloads(self.type, [codec.encode(parameters) for parameters in self.repeating_parameters])
+
+    def encode_frame(self) -> Tuple[bytes, int]:
+        """
+        Encodes as many of the repeating parameters as fit into one protocol
+        message. Returns the bytes of the message and the number of
+        encoded parameter dictionaries.
+        """
+        codec: ProtocolMessageCodec = ProtocolMessageCodecs[self.type]
+        payload_parts: List[bytes] = []
+        payload_length: int = 0
+        num_encoded: int = 0
 
-        msg_bytes_type: bytes = self.type.to_bytes(1, byteorder=ProtocolConfig.BYTEORDER, signed=False)
-        # initialize with 0
-        msg_bytes_length: bytes = _bytes_from_int(0, length=ProtocolConfig.PAYLOAD_LENGTH_BYTES)
-        msg_bytes_payload: bytes = b''
-        msg_bytes_payload_length: int = 0
+        for parameters in self.repeating_parameters:
+            params_bytes_payload: bytes = codec.encode(parameters)
+            # after each parameter list, test if the payload would still fit
+            if payload_length + len(params_bytes_payload) > ProtocolConfig.PAYLOAD_MAX_LENGTH:
+                break
+            payload_parts.append(params_bytes_payload)
+            payload_length += len(params_bytes_payload)
+            num_encoded += 1
 
-        overflow: bool = False
+        # check if we had an overflow directly during the first parameters, thus nothing can be sent
+        if num_encoded == 0 and len(self.repeating_parameters) > 0:
+            raise OverflowError()
 
-        # append type
+        return _HEADER_STRUCT.pack(self.type, payload_length) + b''.join(payload_parts), num_encoded
 
-        # logging.debug("> msg_type={}, ".format(self.type.name), end="")
+    def to_bytes(self) -> bytes:
+        msg_bytes, num_encoded = self.encode_frame()
+        if num_encoded < len(self.repeating_parameters):
+            raise OverflowError("The parameters don't fit into a single protocol message")
+        return msg_bytes
 
-        num_fields: int = len(ProtocolMessageParameters[self.type])
+    async def send(self, writer) -> None:
+        if len(self.repeating_parameters) == 1:
+            # the common case of a single parameter dictionary, without the bookkeeping of encode_frame
+            payload: bytes = ProtocolMessageCodecs[self.type].encode(self.repeating_parameters[0])
+            if len(payload) > ProtocolConfig.PAYLOAD_MAX_LENGTH:
+                raise OverflowError()
+            writer.write(_HEADER_STRUCT.pack(self.type, len(payload)) + payload)
+            await writer.drain()
+            return
 
-        for parameters_index, parameters in enumerate(self.repeating_parameters):
-            params_bytes_payload: bytes = b''
+        msg_bytes, num_encoded = self.encode_frame()
 
-            # send each parameter with length and value in the defined order
-            for num_field, protocol_field in enumerate(ProtocolMessageParameters[self.type]):
-                #last_field = (num_field == num_fields-1)
+        writer.write(msg_bytes)
+        # logging.debug("send: {}".format(msg_bytes))
 
-                try:
-                    parameter_value = parameters[protocol_field.name]
-                except KeyError:
-                    if protocol_field.optional:
-                        # Now handle the different cases in the protocol.
-                        if self.type == ProtocolMessageType.CREATE_GAME and (parameters["options"] & GameOptions.PASSWORD):
-                            raise AttributeError("Send ProtocolMessage: missing password, but options say there shoud be one.")
-                        # In case of JOIN_GAME, we simply don't know at this layer, if a password is needed.
-                        # So just don't send one.
-                        else:
-                            continue
-                    else:
-                        raise AttributeError("Send ProtocolMessage: missing parameter {} for type {}".format(protocol_field.name, self.type))
-
-                # TODO: can this be done the pythonic way without checking the type? See https://stackoverflow.com/a/154156
-                if protocol_field.type is str:
-                    parameter_bytes = parameter_value.encode(encoding=ProtocolConfig.STR_ENCODING)
-                elif protocol_field.type in [int, Orientation, EndGameReason, Direction, ErrorCode, GameOptions]:
-                    parameter_bytes = _bytes_from_int(int(parameter_value), length=protocol_field.length)
-                elif protocol_field.type in [NumShips, Position, Positions, ShipPosition, ShipPositions]:
-                    parameter_bytes = parameter_value.to_bytes()
-                else:
-                    logging.error("ERROR(send): unimplemented parameter type: {}".format(type(parameter_value)))
+        await writer.drain()
 
-                # length field?
-                # if not last_field and not protocol_field.fixed_length:
-                if not protocol_field.fixed_length and not protocol_field.implicit_length:
-                    # We have a length field for this field. And it has length 1 by definition
-                    parameter_bytes_length = len(parameter_bytes)
-                    params_bytes_payload += _bytes_from_int(parameter_bytes_length)
+        # inform the caller, that not all of the repeating parameters have been sent
+        if num_encoded < len(self.repeating_parameters):
+            raise ProtocolRepeatingMessageError(num_encoded-1)
 
-                # data
-                params_bytes_payload += parameter_bytes
 
-            # after each parameter list, test if the payload would still fit
-            tmp_msg_bytes_payload_length: int = msg_bytes_payload_length + len(params_bytes_payload)
-            try:
-                # this raises OverflowError if the payload is too long
-                tmp_msg_bytes_length = _bytes_from_int(tmp_msg_bytes_payload_length, length=ProtocolConfig.PAYLOAD_LENGTH_BYTES)
-                # no OverflowError, thus we can append the stuff
-                msg_bytes_payload += params_bytes_payload
-                msg_bytes_payload_length = tmp_msg_bytes_payload_length
-                msg_bytes_length = tmp_msg_bytes_length
-            except OverflowError:
-                # in this case, don't add the payload bytes, quit the loop, and at the end of the function, raise an exception
-                overflow = True
-                last_index = parameters_index-1
-                break
+def frame_payloads(msg_type: ProtocolMessageType, payloads: List[bytes]) -> List[bytes]:
+    """
+    Packs already encoded parameters of a repeating message type into as many
+    protocol messages as needed. Returns the chunks of bytes of all messages.
+    """
+    chunks: List[bytes] = []
+    frame_parts: List[bytes] = []
+    frame_payload_length: int = 0
 
-        # check if we had an overflow directly during the first parameters, thus nothing can be sent
-        if overflow and last_index < 0:
+    for params_bytes_payload in payloads:
+        if len(params_bytes_payload) > ProtocolConfig.PAYLOAD_MAX_LENGTH:
             raise OverflowError()
+        # start a new message if the parameters don't fit into the current one anymore
+        if frame_payload_length + len(params_bytes_payload) > ProtocolConfig.PAYLOAD_MAX_LENGTH:
+            chunks.append(_HEADER_STRUCT.pack(msg_type, frame_payload_length))
+            chunks.extend(frame_parts)
+            frame_parts = []
+            frame_payload_length = 0
+        frame_parts.append(params_bytes_payload)
+        frame_payload_length += len(params_bytes_payload)
+
+    # the last (or only, possibly empty) message
+    chunks.append(_HEADER_STRUCT.pack(msg_type, frame_payload_length))
+    chunks.extend(frame_parts)
+    return chunks
+
+
+class ProtocolMessageDecoder:
+    """
+    Incremental, IO-free decoder for protocol messages. Arbitrary chunks of
+    bytes are fed into it, and it returns all protocol messages that are
+    complete so far. Incomplete messages stay in the internal buffer until
+    the next call to feed.
+    """
+
+    HEADER_LENGTH: int = 1 + ProtocolConfig.PAYLOAD_LENGTH_BYTES
+
+    def __init__(self) -> None:
+        self._buffer: bytearray = bytearray()
+
+    def __len__(self) -> int:
+        # number of buffered bytes that do not yet form a complete message
+        return len(self._buffer)
+
+    def take_buffer(self) -> bytes:
+        # removes the bytes of the incomplete message from the buffer and returns them
+        data: bytes = bytes(self._buffer)
+        self._buffer = bytearray()
+        return data
+
+    def feed(self, data: bytes, frames: Optional[List[bytes]] = None) -> List[ProtocolMessage]:
+        # if frames is given, the bytes of every returned message are appended to it
+        self._buffer += data
+        messages: List[ProtocolMessage] = []
+        buffer_length: int = len(self._buffer)
+        offset: int = 0
+
+        while buffer_length - offset >= ProtocolMessageDecoder.HEADER_LENGTH:
+            payload_start: int = offset + ProtocolMessageDecoder.HEADER_LENGTH
+            payload_length: int = _int_from_bytes(self._buffer[offset+1:payload_start])
+            payload_end: int = payload_start + payload_length
+            if payload_end > buffer_length:
+                # wait for the rest of the payload
+                break
+            msg_type: ProtocolMessageType = _msg_type_from_bytes(self._buffer[offset:offset+1])
+            msg: ProtocolMessage = ProtocolMessage(msg_type)
+            # skip over the payload of unknown message types without parsing it
+            if msg_type == ProtocolMessageType.NONE:
+                msg.append_parameters({})
+            else:
+                for parameters in ProtocolMessageCodecs[msg_type].decode(bytes(self._buffer[payload_start:payload_end])):
+                    msg.append_parameters(parameters)
+            messages.append(msg)
+            if frames is not None:
+                frames.append(bytes(self._buffer[offset:payload_end]))
+            offset = payload_end
 
-        writer.write(msg_bytes_type + msg_bytes_length + msg_bytes_payload)
-        # logging.debug("send: type({}) length({}) payload({})".format(msg_bytes_type, msg_bytes_length, msg_bytes_payload))
-
-        await writer.drain()
+        if offset > 0:
+            del self._buffer[:offset]
 
-        # inform the caller, that not all of the repeating parameters have been sent
-        if overflow:
-            raise ProtocolRepeatingMessageError(last_index)
+        return messages
 
 
 async def parse_from_stream(client_reader, client_writer, msg_callback):
 
-    waiting_for_msg_type: bool = True
-    bytes_to_read_next: int = 1
-    msg: ProtocolMessage
-    msg_payload_bytes: int = 0
-    msg_remaining_payload_bytes: int = 0
-    parameter_index: int = -1
-    parameter_count: int = 0
-    parameter: ProtocolField
-    parameters: dict = {}
-    waiting_for_field_length: bool = False
-    waiting_for_payload_length: bool = False
-    waiting_for_garbage: bool = False
-
-    async def finalize_msg_and_prepare_for_next():
-        nonlocal waiting_for_msg_type, parameter_index, bytes_to_read_next, parameters, waiting_for_garbage
-        waiting_for_msg_type = True
-        waiting_for_garbage = False
-        parameter_index = -1
-        msg.append_parameters(parameters)
-        parameters = {}
-        bytes_to_read_next = 1
-        await msg_callback(msg)
-
-    def get_implicit_length():
-        # calculate it with parameter_index and remaining bytes
-        accumulated_length_of_remaining_params: int = 0
-        for other_param in ProtocolMessageParameters[msg_type][parameter_index+1:]:
-            try:
-                accumulated_length_of_remaining_params += other_param.length
-            except:
-                # TODO: if length is not defined for the parameter, this is not a valid protocol message type
-                pass
-        return msg_remaining_payload_bytes - accumulated_length_of_remaining_params
+    decoder: ProtocolMessageDecoder = ProtocolMessageDecoder()
 
     while True:
 
         try:
-            data = await client_reader.read(bytes_to_read_next)
+            # read whatever is available, i.e. typically one TCP segment, and let the decoder split it up
+            data = await client_reader.read(ProtocolConfig.READ_CHUNK_SIZE)
             if not data:
                 # this means the client disconnected(?)
                 break
@@ -691,128 +997,9 @@ async def parse_from_stream(client_reader, client_writer, msg_callback):
         except Exception as e:
             logging.info("Some other error while reading, stop reading from this stream")
             break
-        # logging.debug("recv: " + str(data))
-
-        # parse data
-        if waiting_for_msg_type:
-            msg_type = _msg_type_from_bytes(data)
-            # TODO: handle NONE: read the length field, and then skip over the stuff without parsing it (to prevent some strange encoding bugs)
-            msg = ProtocolMessage(msg_type)
-            # logging.debug("start parsing type {}".format(msg_type))
-            parameter_count = len(ProtocolMessageParameters[msg_type])
-
-        elif waiting_for_garbage:
-            # don't even look at it
-            pass
-
-        elif waiting_for_payload_length:
-            msg_payload_bytes = _int_from_bytes(data)
-            msg_remaining_payload_bytes = msg_payload_bytes
-
-        elif waiting_for_field_length:
-            msg_remaining_payload_bytes -= bytes_to_read_next
-            bytes_to_read_next = _int_from_bytes(data)
-
-            # we have an empty parameter
-            if bytes_to_read_next == 0:
-                if parameter.type is str:
-                    parameters[parameter.name] = ""
-                else:
-                    logging.error("ERROR(parse_from_stream): empty parameter for type: {}".format(parameter.type))
-
-        else:
-            msg_remaining_payload_bytes -= bytes_to_read_next
-
-            if parameter.type is str:
-                # try:
-                parameters[parameter.name] = _str_from_bytes(data)
-                # except UnicodeDecodeError as e:
-                #     logging.error("UnicodeDecodeError while decoding parameter {} in type {}, parameters until now: {}".format(parameter.name, msg_type, parameters))
-            elif parameter.type in [int, Orientation, EndGameReason, Direction, ErrorCode, GameOptions]:
-                parameters[parameter.name] = _int_from_bytes(data)
-            elif parameter.type in [NumShips, Position, Positions, ShipPosition, ShipPositions]:
-                parameters[parameter.name] = parameter.type.from_bytes(data)
-            else:
-                logging.error("ERROR(parse_from_stream): unimplemented parameter type: {}".format(parameter.type))
-
-        # prepare the next loop
-        if waiting_for_msg_type:
-            # Now we always have a payload length field
-            # # Check if this message type has payload.
-            # # If so, there will be a global length field
-
-            # if len(ProtocolMessageParameters[msg_type]) > 0:
-            waiting_for_payload_length = True
-            waiting_for_msg_type = False
-            bytes_to_read_next = ProtocolConfig.PAYLOAD_LENGTH_BYTES
-            # # If not, the message is already complete
-            # else:
-            #    await finalize_msg_and_prepare_for_next()
-
-        elif waiting_for_garbage:
-            await finalize_msg_and_prepare_for_next()
-
-        elif waiting_for_payload_length or not waiting_for_field_length or (waiting_for_field_length and bytes_to_read_next == 0):
-            waiting_for_payload_length = False
-
-            if msg_payload_bytes == 0:
-                # for example empty GAMES message
-                await finalize_msg_and_prepare_for_next()
-            elif msg_type == ProtocolMessageType.NONE:
-                # read everything in case of an invalid message type
-                bytes_to_read_next = msg_payload_bytes
-                waiting_for_garbage = True
-            else:
-
-                # the next thing to do is read the length field of a parameter,
-                # or the content of a parameter
-                parameter_index += 1
-
-                # check if we have a repeating message type and
-                # if we are currently at the end, and there is more to come
-                if msg_type in ProtocolMessageRepeatingTypes:
-                    if parameter_index == parameter_count:
-                        if msg_remaining_payload_bytes > 0:
-                            parameter_index = 0
-                            msg.append_parameters(parameters)
-                            parameters = {}
-
-                # Is there is a next parameter?
-                if parameter_index < parameter_count:
-
-                    waiting_for_msg_type = False
-
-                    parameter = ProtocolMessageParameters[msg_type][parameter_index]
-
-                    # If it's fixed length, we read the payload as a next step.
-                    if parameter.fixed_length:
-                        waiting_for_field_length = False
-                        bytes_to_read_next = parameter.length
-
-                    # If it's variable length, we might have a length field to read.
-                    # We have a length field if it's _not_ the last parameter
-                    # elif parameter_index < parameter_count-1:
-                    elif not parameter.implicit_length:
-                        waiting_for_field_length = True
-                        bytes_to_read_next = parameter.length_bytes
-
-                    # If it's variable length _and_ the last field, all the remaining
-                    # bytes belong to this field
-                    else:
-                        waiting_for_field_length = False
-                        bytes_to_read_next = get_implicit_length()
-                        # If there are no more bytes, apparently the message is finished.
-                        # This can be the case when no password is set.
-                        if bytes_to_read_next == 0:
-                            await finalize_msg_and_prepare_for_next()
-
-                # there is no next parameter, so prepare for the next protocol message
-                else:
-                    await finalize_msg_and_prepare_for_next()
 
-        elif waiting_for_field_length:
-            # next is to read the actual data
-            waiting_for_field_length = False
+        for msg in decoder.feed(data):
+            await msg_callback(msg)
 
         try:
             # This enables us to have flow control in our connection.
@@ -825,6 +1012,7 @@ async def parse_from_stream(client_reader, client_writer, msg_callback):
             logging.info("Some other error while draining, stop reading from this stream")
             break
 
+
 def _msg_type_from_bytes(data) -> ProtocolMessageType:
     msg_type: ProtocolMessageType
     try:
@@ -861,3 +1049,66 @@ class ProtocolRepeatingMessageError(Exception):
 
     def __str__(self):
         return "Last sent index was {}".format(self.last_index)
+
+
+class PreEncodedMessage(ProtocolMessage):
+    """
+    A protocol message which is encoded only once, when it is created. It must
+    not be modified afterwards, so that the same object (and thus the same bytes)
+    can be sent again and again.
+    """
+
+    def __init__(self, msg_type: ProtocolMessageType, parameters: Optional[Dict[str, Any]]=None) -> None:
+        super().__init__(msg_type, [parameters if parameters is not None else {}])
+        msg_bytes, _ = super().encode_frame()
+        self._bytes: bytes = msg_bytes
+        self._str: str = super().__str__()
+
+    def encode_frame(self) -> Tuple[bytes, int]:
+        return self._bytes, len(self.repeating_parameters)
+
+    def to_bytes(self) -> bytes:
+        return self._bytes
+
+    async def send(self, writer) -> None:
+        writer.write(self._bytes)
+        await writer.drain()
+
+    def __str__(self) -> str:
+        return self._str
+
+
+class ConstantMessageCache:
+    """
+    Table of the ready-made server messages which have a small, closed set of
+    possible wire forms: messages without parameters, and messages with only
+    one enum parameter (ENDGAME and ERROR). It is built once at startup.
+    """
+
+    def __init__(self) -> None:
+        self._messages: Dict[Tuple[ProtocolMessageType, Optional[int]], PreEncodedMessage] = {}
+        for msg_type in [ProtocolMessageType.PLACED, ProtocolMessageType.YOUSTART,
+                         ProtocolMessageType.WAIT, ProtocolMessageType.TIMEOUT]:
+            self._messages[(msg_type, None)] = PreEncodedMessage(msg_type)
+        for reason in EndGameReason:
+            self._messages[(ProtocolMessageType.ENDGAME, reason)] = PreEncodedMessage(ProtocolMessageType.ENDGAME, {"reason": reason})
+        for error_code in ErrorCode:
+            self._messages[(ProtocolMessageType.ERROR, error_code)] = PreEncodedMessage(ProtocolMessageType.ERROR, {"error_code": error_code})
+
+    def get(self, msg_type: ProtocolMessageType) -> PreEncodedMessage:
+        return self._messages[(msg_type, None)]
+
+    def endgame(self, reason: EndGameReason) -> ProtocolMessage:
+        try:
+            return self._messages[(ProtocolMessageType.ENDGAME, reason)]
+        except KeyError:
+            return ProtocolMessage.create_single(ProtocolMessageType.ENDGAME, {"reason": reason})
+
+    def error(self, error_code: ErrorCode) -> ProtocolMessage:
+        try:
+            return self._messages[(ProtocolMessageType.ERROR, error_code)]
+        except KeyError:
+            return ProtocolMessage.create_error(error_code)
+
+
+ProtocolConstantMessages: ConstantMessageCache = ConstantMessageCache()
@@ -1,4 +1,5 @@
 import sys
+import argparse
 import asyncio
 import asyncio.streams
 from typing import Dict, List
@@ -6,12 +7,17 @@ from common.constants import Constants
 from common.protocol import ProtocolMessage, ProtocolMessageType, NumShips
 from common.constants import Orientation, Direction, EndGameReason, ErrorCode, GameOptions
 from common.network import BattleshipClient
+from common.eventloop import add_event_loop_argument, create_event_loop
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+
     print("Connecting to server {}:{}".format(Constants.SERVER_IP, Constants.SERVER_PORT))
 
-    loop = asyncio.get_event_loop()
+    loop = create_event_loop(args.loop)
 
     do_join = asyncio.Event()
     finished = asyncio.Event()
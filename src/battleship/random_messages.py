@@ -1,10 +1,12 @@
 from typing import Optional, List
 import sys
+import argparse
 import asyncio
 import asyncio.streams
 from asyncio import Event
 from common.constants import Constants, ErrorCode
 from common.network import BattleshipServer, BattleshipClient
+from common.eventloop import add_event_loop_argument, create_event_loop
 from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolConfig
 from common.states import ClientConnectionState, GameState
 from server.lobby import ServerLobbyController
@@ -12,7 +14,11 @@ from server.client import Client
 
 
 def main():
-    loop = asyncio.get_event_loop()
+    parser = argparse.ArgumentParser()
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+
+    loop = create_event_loop(args.loop)
 
     messages: List[ProtocolMessage] = []
     test_msg: ProtocolMessage = None
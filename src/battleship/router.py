@@ -0,0 +1,67 @@
+"""
+Front router for several backend servers, see server/backends.py.
+
+The router accepts the client connections and handles the lobby like server.py,
+but the games run at the backends, `server.py --router HOST:PORT`, each one at
+the backend with the least load. Backends can connect at any time, also from
+other hosts. Without backends, the router runs the games itself.
+"""
+import logging
+import sys
+import argparse
+from common.constants import Constants, ServerConfig
+from common.network import BattleshipServer
+from common.GameController import GameController, BATTLEFIELD_CLASSES
+from common.eventloop import add_event_loop_argument, create_event_loop, event_loop_name
+from server.lobby import ServerLobbyController
+from server.client import create_client_connected
+from server.backends import BackendPool
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--ip", help="IP to listen on for client connections", type=str, default=Constants.SERVER_IP)
+    parser.add_argument("-p", "--port", help="Port to listen on for client connections", type=int, default=Constants.SERVER_PORT)
+    parser.add_argument("-t", "--transport", help="stream: StreamReader/StreamWriter and a task per client, protocol: asyncio.Protocol",
+                        choices=["stream", "protocol"], default="stream")
+    parser.add_argument("--control-ip", help="IP to listen on for the backends, only they may reach it", type=str, default="127.0.0.1")
+    parser.add_argument("-c", "--control-port", help="Port to listen on for the backends", type=int, default=4299)
+    parser.add_argument("--battlefield", help="the board implementation of the games the router runs itself", choices=sorted(BATTLEFIELD_CLASSES), default="lists")
+    parser.add_argument("--rate-limit", help="limit the messages per client, see ServerConfig.RATE_LIMITS", action="store_true")
+    add_event_loop_argument(parser)
+    args = parser.parse_args()
+    if args.rate_limit:
+        ServerConfig.RATE_LIMITING = True
+    GameController.battlefield_class = BATTLEFIELD_CLASSES[args.battlefield]
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    loop = create_event_loop(args.loop)
+    lobby_ctrl = ServerLobbyController(loop)
+    server = BattleshipServer(args.ip, args.port, loop, create_client_connected(loop, lobby_ctrl), transport=args.transport)
+
+    backend_pool: BackendPool = BackendPool(loop, lobby_ctrl)
+    backend_pool.start(args.control_ip, args.control_port)
+    lobby_ctrl.backend_pool = backend_pool
+    print("Waiting for backends on {}:{}".format(args.control_ip, args.control_port))
+
+    print("Starting router on {}:{} ({} transport, {} event loop)".format(args.ip, args.port, args.transport, event_loop_name(loop)))
+    server.start()
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        print("\nReceived SIGINT, terminating …")
+        pass
+
+    lobby_ctrl.print_stats()
+
+    server.stop()
+    backend_pool.close()
+    loop.close()
+    print("Bye.")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,28 @@
-from typing import Optional
+from typing import Optional, List
 import logging
 import sys
+import os
+import time
+import signal
+import shutil
+import tempfile
+import multiprocessing
 import asyncio
 import asyncio.streams
 import argparse
-from common.constants import Constants, ErrorCode
-from common.network import BattleshipServer
+from common.constants import Constants, ErrorCode, ServerConfig
+from common.network import BattleshipServer, BattleshipProtocol
+from common.eventloop import add_event_loop_argument, create_event_loop, event_loop_name
 from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolConfig
 from common.states import ClientConnectionState, GameState
+from common.GameController import GameController, BATTLEFIELD_CLASSES
 from server.lobby import ServerLobbyController
-from server.client import Client
+from server.client import Client, create_client_connected
+from server.cluster import ClusterConfig, WorkerCluster, run_broker
+from server.gamepool import GamePoolConfig, GamePool, GameWorker
+from server.backends import RouterLink
+from server.dispatch import HandlerTimes
+from server.handover import stop_on_sigterm_only
 
 
 def main():
@@ -17,61 +30,190 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--ip", help="IP to listen on for client connections", type=str, default=Constants.SERVER_IP)
     parser.add_argument("-p", "--port", help="Port to listen on for client connections", type=int, default=Constants.SERVER_PORT)
+    parser.add_argument("-t", "--transport", help="stream: StreamReader/StreamWriter and a task per client, protocol: asyncio.Protocol",
+                        choices=["stream", "protocol"], default="stream")
+    parser.add_argument("-w", "--workers", help="number of worker processes sharing the port, with a lobby broker process between them",
+                        type=int, default=1)
+    parser.add_argument("-g", "--game-workers", help="number of processes running the games, the lobby stays in this process",
+                        type=int, default=0)
+    parser.add_argument("-r", "--router", help="run the games of the router.py at HOST:PORT (its control port) instead of accepting clients",
+                        type=str, metavar="HOST:PORT")
+    parser.add_argument("--battlefield", help="the board implementation of the games", choices=sorted(BATTLEFIELD_CLASSES), default="lists")
+    parser.add_argument("--rate-limit", help="limit the messages per client, see ServerConfig.RATE_LIMITS", action="store_true")
+    parser.add_argument("--handler-times", help="measure the message handlers and print their times when stopping", action="store_true")
+    add_event_loop_argument(parser)
     args = parser.parse_args()
+    if args.workers > 1 and args.game_workers > 0:
+        parser.error("--workers and --game-workers can't be combined")
+    if args.router is not None and (args.workers > 1 or args.game_workers > 0):
+        parser.error("--router can't be combined with --workers or --game-workers")
 
     Constants.SERVER_IP = args.ip
     Constants.SERVER_PORT = args.port
+    if args.rate_limit:
+        ServerConfig.RATE_LIMITING = True
+    GameController.battlefield_class = BATTLEFIELD_CLASSES[args.battlefield]
     logging.basicConfig(level=logging.DEBUG)
 
-    loop = asyncio.get_event_loop()
+    if args.router is not None:
+        run_backend(args)
+    elif args.workers > 1:
+        run_workers(args)
+    elif args.game_workers > 0:
+        run_with_game_workers(args)
+    else:
+        run_server(args)
+
+
+def use_protocol_transport(args):
+    # the connections are handed over between the processes, which only works with BattleshipProtocol
+    if not args.transport == "protocol":
+        print("Using the protocol transport, the processes need it to hand over connections")
+        args.transport = "protocol"
+
+
+def stop_processes(processes: List[multiprocessing.Process]):
+    # in reverse order of starting them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    for process in reversed(processes):
+        process.terminate()
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+
+
+def run_workers(args):
+    use_protocol_transport(args)
+
+    directory: str = tempfile.mkdtemp(prefix="battleship-")
+    broker_config: ClusterConfig = ClusterConfig(directory, args.workers)
+    broker = multiprocessing.Process(target=run_broker, args=(broker_config, args.loop), name="broker")
+    broker.start()
+    while not os.path.exists(broker_config.broker_path) and broker.is_alive():
+        time.sleep(0.01)
+
+    processes: List[multiprocessing.Process] = [broker]
+    for worker_index in range(args.workers):
+        worker = multiprocessing.Process(target=run_server, args=(args, ClusterConfig(directory, args.workers, worker_index)),
+                                         name="worker{}".format(worker_index))
+        worker.start()
+        processes.append(worker)
+
+    # terminating this process stops the workers and the broker as well
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+
+    # the workers first, so the broker doesn't tell them about each other leaving
+    stop_processes(processes)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_with_game_workers(args):
+    use_protocol_transport(args)
+
+    config: GamePoolConfig = GamePoolConfig(tempfile.mkdtemp(prefix="battleship-"), args.game_workers)
+    # started before this process creates its event loop, they wait for the lobby
+    processes: List[multiprocessing.Process] = []
+    for worker_index in range(args.game_workers):
+        process = multiprocessing.Process(target=run_game_worker, args=(args, config, worker_index), name="game-worker{}".format(worker_index))
+        process.start()
+        processes.append(process)
 
+    # terminating this process stops the game workers as well
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        run_server(args, game_pool_config=config)
+    finally:
+        stop_processes(processes)
+        shutil.rmtree(config.directory, ignore_errors=True)
+
+
+def run_game_worker(args, config: GamePoolConfig, worker_index: int):
+    stop_on_sigterm_only()
+    loop = create_event_loop(args.loop)
     lobby_ctrl = ServerLobbyController(loop)
+    client_connected = create_client_connected(loop, lobby_ctrl)
+
+    # the client ids are only printed, but should be unique among the processes anyway
+    Client.next_client_id = (worker_index + 1) * 1000000
+    game_worker: GameWorker = GameWorker(loop, config, worker_index, lobby_ctrl, lambda: BattleshipProtocol(loop, client_connected))
+    lobby_ctrl.game_worker = game_worker
+    loop.run_until_complete(game_worker.connect())
+    print("Game worker {} of {}, {} event loop".format(worker_index, config.num_workers, event_loop_name(loop)))
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
 
-    msgs_for_lobby_controller = [ProtocolMessageType.LOGIN, ProtocolMessageType.LOGOUT, ProtocolMessageType.CHAT_SEND,
-                                 ProtocolMessageType.GET_GAMES, ProtocolMessageType.CREATE_GAME, ProtocolMessageType.CANCEL,
-                                 ProtocolMessageType.PLACE, ProtocolMessageType.ABORT, ProtocolMessageType.MOVE,
-                                 ProtocolMessageType.SHOOT, ProtocolMessageType.JOIN]
+    lobby_ctrl.print_stats()
+    game_worker.close()
+    loop.close()
 
-    # This gets called whenever a new client connects. The parameter `client`
-    # is of type BattleshipServerClient and holds a unique id, the reader and the writer.
-    # and it has a send method that sends a ProtocolMessage
-    # This callback has to return two other callbacks, one for messages and one for the
-    # event that the client disconnects.
-    # The idea is that these two callbacks are defined inside the client_connected function,
-    # because then they implicitly have access to objects created inside client_connected,
-    # for example a GameController.
-    def client_connected(client_reader, client_writer):
 
-        client = Client(reader=client_reader, writer=client_writer)
-        lobby_ctrl.add_client(client)
+def run_backend(args):
+    host, port = args.router.rsplit(":", 1)
+    loop = create_event_loop(args.loop)
+    lobby_ctrl = ServerLobbyController(loop)
 
-        async def client_disconnected():
-            print("< [{}] client disconnected".format(client.id))
-            await lobby_ctrl.remove_client(client)
+    router_link: RouterLink = RouterLink(loop, host, int(port), lobby_ctrl)
+    lobby_ctrl.router_link = router_link
+    loop.run_until_complete(router_link.connect())
+    print("Running games for the router at {}:{} ({} event loop)".format(host, port, event_loop_name(loop)))
 
-        async def msg_callback(msg: ProtocolMessage):
-            nonlocal client
-            print("< [{}] {}".format(client.id, msg))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        print("\nReceived SIGINT, terminating …")
+        pass
 
-            answer: Optional[ProtocolMessage] = None
+    lobby_ctrl.print_stats()
+    router_link.close()
+    loop.close()
+    print("Bye.")
 
-            if msg.type in msgs_for_lobby_controller:
-                await lobby_ctrl.handle_msg(client, msg)
 
-            if msg.type == ProtocolMessageType.NONE:
-                err: ProtocolMessage = ProtocolMessage.create_error(ErrorCode.UNKNOWN)
-                await client.send(err)
+def run_server(args, cluster_config: Optional[ClusterConfig] = None, game_pool_config: Optional[GamePoolConfig] = None):
 
-            # If we have a direct answer, send it here
-            if answer is not None:
-                await client.send(answer)
+    if cluster_config is not None:
+        stop_on_sigterm_only()
 
-        print("< [{}] client connected".format(client.id))
-        return msg_callback, client_disconnected
+    loop = create_event_loop(args.loop)
 
-    server = BattleshipServer(Constants.SERVER_IP, Constants.SERVER_PORT, loop, client_connected)
+    lobby_ctrl = ServerLobbyController(loop)
 
-    print("Starting server on {}:{}".format(Constants.SERVER_IP, Constants.SERVER_PORT))
+    client_connected = create_client_connected(loop, lobby_ctrl)
+
+    handler_times: Optional[HandlerTimes] = None
+    if args.handler_times:
+        handler_times = HandlerTimes()
+        lobby_ctrl.dispatcher.use(handler_times)
+
+    server = BattleshipServer(Constants.SERVER_IP, Constants.SERVER_PORT, loop, client_connected, transport=args.transport,
+                              reuse_port=cluster_config is not None)
+
+    cluster: Optional[WorkerCluster] = None
+    if cluster_config is not None:
+        # the client ids are only printed, but should be unique among the workers anyway
+        Client.next_client_id = cluster_config.worker_index * 1000000
+        cluster = WorkerCluster(loop, cluster_config, lobby_ctrl, server.protocol_factory)
+        loop.run_until_complete(cluster.connect())
+        lobby_ctrl.attach_cluster(cluster)
+        print("Worker {} of {}".format(cluster_config.worker_index, cluster_config.num_workers))
+
+    game_pool: Optional[GamePool] = None
+    if game_pool_config is not None:
+        game_pool = GamePool(loop, game_pool_config, lobby_ctrl, server.protocol_factory)
+        game_pool.start()
+        lobby_ctrl.game_pool = game_pool
+        print("Games run in {} game worker processes".format(game_pool_config.num_workers))
+
+    print("Starting server on {}:{} ({} transport, {} event loop)".format(Constants.SERVER_IP, Constants.SERVER_PORT, args.transport, event_loop_name(loop)))
     server.start()
 
     try:
@@ -82,8 +224,14 @@ def main():
 
     # print some stats
     lobby_ctrl.print_stats()
+    if handler_times is not None:
+        handler_times.print_stats()
 
     server.stop()
+    if cluster is not None:
+        cluster.close()
+    if game_pool is not None:
+        game_pool.close()
     loop.close()
     print("Bye.")
 
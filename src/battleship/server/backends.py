@@ -0,0 +1,273 @@
+"""
+Running the games on backend servers behind a router, see router.py and server.py --router.
+
+The router accepts all client connections and handles the lobby: LOGIN, GAMES,
+CHAT and so on. When a JOIN pairs two players, BackendPool starts the game at
+the backend with the least load, and from then on forwards the players' game
+messages (PLACE, ABORT, MOVE, SHOOT) to it and its answers back to the players.
+The connections stay at the router, so the players stay logged in and receive
+chat messages while they play. At ENDGAME the backend tells the router, which
+puts the players back into the game selection.
+
+The backends connect to the router's control port with RouterLink and run the
+games with RoutedClients in place of the players. Every second they report their
+load: the number of games and how late their event loop is. The frames are the
+ones between the processes of one server (see handover.py): the kind and the
+arguments are JSON, the protocol messages they carry are sent as they are.
+"""
+import os
+import socket
+import asyncio
+import asyncio.streams
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+from .client import Client, OutboundLane
+from .gamepool import GameSettings, game_settings, create_game_controller
+from .handover import read_frame, write_frame
+from common.constants import EndGameReason, ErrorCode
+from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolMessageDecoder, ProtocolConstantMessages
+from common.states import ClientConnectionState
+from common.GameController import GameController
+
+# seconds between two load reports of a backend
+LOAD_REPORT_INTERVAL = 1.0
+# a backend whose event loop is later than this only gets new games if all are
+MAX_LOOP_LAG = 0.05
+
+
+class Backend:
+    """
+    The router's view of one backend.
+    """
+
+    def __init__(self, backend_id: int, name: str, writer) -> None:
+        self.id: int = backend_id
+        self.name: str = name
+        self.writer = writer
+        # as reported, plus the games started and ended since
+        self.num_games: int = 0
+        # seconds the backend's event loop was late at the last report
+        self.loop_lag: float = 0.0
+
+    def load(self) -> Tuple[bool, int, float]:
+        return self.loop_lag > MAX_LOOP_LAG, self.num_games, self.loop_lag
+
+
+class BackendPool:
+    """
+    The router's side: starts the games at the backends and forwards the game messages.
+    """
+
+    # handled by the backend of the game, everything else by the router
+    GAME_MESSAGES = [ProtocolMessageType.PLACE, ProtocolMessageType.ABORT, ProtocolMessageType.MOVE, ProtocolMessageType.SHOOT]
+
+    def __init__(self, loop, lobby_ctrl) -> None:
+        self.loop = loop
+        self.lobby_ctrl = lobby_ctrl
+        # backends: backend id -> backend, for the backends that are connected
+        self.backends: Dict[int, Backend] = {}
+        # sessions: client id -> backend running the client's game
+        self.sessions: Dict[int, Backend] = {}
+        self.backend_ids = count()
+        self.server = None
+
+    def start(self, ip: str, port: int) -> None:
+        self.server = self.loop.run_until_complete(
+            asyncio.streams.start_server(self.handle_backend, ip, port, loop=self.loop))
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+    def has_backends(self) -> bool:
+        return len(self.backends) > 0
+
+    def is_routed(self, client: Client) -> bool:
+        return client.id in self.sessions
+
+    async def start_game(self, game_controller1: GameController, client: Client) -> None:
+        """
+        Starts the game of the game's creator and the joining client at the backend
+        with the least load, which sends them STARTGAME.
+        """
+        backend: Backend = min(self.backends.values(), key=Backend.load)
+        clients: List[Client] = [game_controller1.client, client]
+        for c in clients:
+            print("  [{}] Playing game {} at backend {} ({})".format(c.id, game_controller1.game_id, backend.id, backend.name))
+            self.sessions[c.id] = backend
+        backend.num_games += 1
+        write_frame(backend.writer, "start_game", game_settings(game_controller1), [(c.id, c.username) for c in clients])
+
+    def forward(self, client: Client, msg: ProtocolMessage) -> None:
+        write_frame(self.sessions[client.id].writer, "msg", client.id, msg.to_bytes())
+
+    def logout(self, client: Client) -> None:
+        # the backend ends the game like for a user logging out of a local game
+        backend: Optional[Backend] = self.sessions.pop(client.id, None)
+        if backend is not None:
+            write_frame(backend.writer, "logout", client.id)
+
+    def end_session(self, client_id: int, backend: Backend) -> Optional[Client]:
+        # the client is back in the game selection, unless it logged out or disconnected meanwhile
+        if self.sessions.get(client_id) is not backend:
+            return None
+        del self.sessions[client_id]
+        client: Optional[Client] = self.lobby_ctrl.clients.get(client_id)
+        if client is None or not client.state == ClientConnectionState.PLAYING:
+            return None
+        self.lobby_ctrl.set_client_state(client, ClientConnectionState.GAME_SELECTION)
+        return client
+
+    async def handle_backend(self, reader, writer) -> None:
+        backend: Optional[Backend] = None
+        try:
+            while True:
+                frame: Tuple = await read_frame(reader)
+                kind: str = frame[0]
+
+                if kind == "hello":
+                    backend = Backend(next(self.backend_ids), frame[1], writer)
+                    self.backends[backend.id] = backend
+                    print("< [backend {}] {} connected".format(backend.id, backend.name))
+
+                # a backend says hello first, like an invalid frame
+                elif backend is None:
+                    raise ValueError("{} before hello".format(kind))
+
+                elif kind == "load":
+                    _, backend.num_games, backend.loop_lag = frame
+
+                # the backend's answers are sent as they are, also the ENDGAME after a LOGOUT
+                elif kind == "to_client":
+                    _, client_id, lane, data = frame
+                    if client_id in self.lobby_ctrl.clients:
+                        await self.lobby_ctrl.send_raw(self.lobby_ctrl.clients[client_id], data, lane)
+
+                elif kind == "game_over":
+                    _, game_id, client_ids = frame
+                    backend.num_games -= 1
+                    for client_id in client_ids:
+                        self.end_session(client_id, backend)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("< [backend {}] disconnected".format(backend.id if backend is not None else "?"))
+        except ValueError as e:
+            print("< [backend {}] sent an invalid frame, disconnecting: {}".format(backend.id if backend is not None else "?", e))
+            writer.close()
+
+        if backend is None:
+            return
+        del self.backends[backend.id]
+        # the games there are lost
+        for client_id in [client_id for client_id, session_backend in self.sessions.items() if session_backend is backend]:
+            client: Optional[Client] = self.end_session(client_id, backend)
+            if client is not None:
+                await self.lobby_ctrl.send(client, ProtocolConstantMessages.endgame(EndGameReason.SERVER_CLOSED_CONNECTION))
+
+
+class RoutedClient:
+    """
+    Takes the place of a client connected to the router in a game at a backend.
+    """
+
+    def __init__(self, client_id: int, username: str, link: "RouterLink") -> None:
+        # the id the client has at the router
+        self.id: int = client_id
+        self.username: str = username
+        self.state: ClientConnectionState = ClientConnectionState.NOT_CONNECTED
+        self.link: "RouterLink" = link
+
+    async def send(self, msg: ProtocolMessage, lane: Optional[OutboundLane] = None):
+        print("> [{}] {}".format(self.id, msg))
+        await self.send_raw(msg.to_bytes(), lane)
+
+    async def send_raw(self, data: bytes, lane: Optional[OutboundLane] = None):
+        self.link.send_to_client(self.id, data, lane)
+
+    def stop(self):
+        pass
+
+
+class RouterLink:
+    """
+    The backend's side: runs the games it gets from the router and reports its load.
+    """
+
+    def __init__(self, loop, host: str, port: int, lobby_ctrl) -> None:
+        self.loop = loop
+        self.host: str = host
+        self.port: int = port
+        self.lobby_ctrl = lobby_ctrl
+        self.reader = None
+        self.writer = None
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.streams.open_connection(self.host, self.port, loop=self.loop)
+        write_frame(self.writer, "hello", "{}:{}".format(socket.gethostname(), os.getpid()))
+        self.loop.create_task(self.read_from_router())
+        self.loop.create_task(self.report_load())
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+    def send_to_client(self, client_id: int, data: bytes, lane: Optional[OutboundLane] = None) -> None:
+        write_frame(self.writer, "to_client", client_id, lane, data)
+
+    async def report_load(self) -> None:
+        while True:
+            # the event loop is late by however long the sleep takes longer
+            start_time: float = self.loop.time()
+            await asyncio.sleep(LOAD_REPORT_INTERVAL)
+            loop_lag: float = max(0.0, self.loop.time() - start_time - LOAD_REPORT_INTERVAL)
+            write_frame(self.writer, "load", len(self.lobby_ctrl.games), loop_lag)
+
+    async def read_from_router(self) -> None:
+        decoder: ProtocolMessageDecoder = ProtocolMessageDecoder()
+        try:
+            while True:
+                frame: Tuple = await read_frame(self.reader)
+                kind: str = frame[0]
+
+                if kind == "start_game":
+                    await self.start_game(frame[1], frame[2])
+
+                elif kind == "msg":
+                    _, client_id, msg_bytes = frame
+                    client: Optional[RoutedClient] = self.lobby_ctrl.clients.get(client_id)
+                    for msg in decoder.feed(msg_bytes):
+                        if client is not None:
+                            await self.lobby_ctrl.handle_msg(client, msg)
+                        else:
+                            # the game ended while the message was on its way
+                            self.send_to_client(client_id, ProtocolConstantMessages.error(ErrorCode.ILLEGAL_STATE_NOT_IN_GAME).to_bytes(), OutboundLane.GAME)
+
+                elif kind == "logout":
+                    client = self.lobby_ctrl.clients.get(frame[1])
+                    if client is not None:
+                        await self.lobby_ctrl.remove_client(client)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("Lost the connection to the router, stopping")
+            self.loop.stop()
+
+    async def start_game(self, settings: GameSettings, players: List[Tuple[int, str]]) -> None:
+        clients: List[RoutedClient] = []
+        for client_id, username in players:
+            client: RoutedClient = RoutedClient(client_id, username, self)
+            self.lobby_ctrl.add_client(client)
+            self.lobby_ctrl.users[username] = client
+            clients.append(client)
+        game_controller1: GameController = create_game_controller(settings, clients[0], self.loop)
+        self.lobby_ctrl.add_game(game_controller1)
+        await self.lobby_ctrl.start_game(game_controller1, clients[1])
+
+    def game_over(self, clients: List[RoutedClient], game_id: int) -> None:
+        # the players go back to the router's lobby
+        for client in clients:
+            if self.lobby_ctrl.users.get(client.username) is client:
+                del self.lobby_ctrl.users[client.username]
+            self.lobby_ctrl.clients.pop(client.id, None)
+            self.lobby_ctrl.set_client_state(client, ClientConnectionState.NOT_CONNECTED)
+        write_frame(self.writer, "game_over", game_id, [client.id for client in clients])
@@ -1,13 +1,53 @@
+import asyncio
 from asyncio import StreamWriter, StreamReader
+from enum import IntEnum
+from collections import deque
+from typing import Deque, List, Optional
+from common.constants import ServerConfig, OutboundPolicy
 from common.states import ClientConnectionState
-from common.protocol import ProtocolMessage
+from common.protocol import ProtocolMessage, ProtocolMessageType
+
+
+class OutboundLane(IntEnum):
+    # the game messages go out before everything queued in the lanes after them
+    GAME = 0
+    LOBBY = 1
+
+
+# the lane of every message type, the first byte of every message on the wire (and every
+# pre-encoded chunk passed to send_raw starts with a message)
+_LANES: List[OutboundLane] = [OutboundLane.LOBBY] * 256
+for _msg_type in [ProtocolMessageType.STARTGAME, ProtocolMessageType.PLACED, ProtocolMessageType.YOUSTART,
+                  ProtocolMessageType.WAIT, ProtocolMessageType.HIT, ProtocolMessageType.FAIL,
+                  ProtocolMessageType.MOVED, ProtocolMessageType.TIMEOUT, ProtocolMessageType.ENDGAME]:
+    _LANES[_msg_type] = OutboundLane.GAME
+# an ERROR is sent in the lane of the request it answers, the lane passed to send (see answer_lane)
+
+_GAME_REQUESTS: List[ProtocolMessageType] = [ProtocolMessageType.PLACE, ProtocolMessageType.MOVE,
+                                             ProtocolMessageType.SHOOT, ProtocolMessageType.ABORT]
+
+
+def answer_lane(msg_type: ProtocolMessageType) -> OutboundLane:
+    # the lane of the answers to a message of the client, so an ERROR doesn't overtake the answers before it
+    return OutboundLane.GAME if msg_type in _GAME_REQUESTS else OutboundLane.LOBBY
+
+
+async def drain_above_high_watermark(writer) -> None:
+    """
+    Waits for the writer only if its transport buffers more than its high watermark,
+    otherwise the data is on its way already and there is nothing to wait for.
+    Only the writer task does this, ProtocolMessage.send still drains after every message.
+    """
+    transport = writer.transport
+    if transport.get_write_buffer_size() > transport.get_write_buffer_limits()[1]:
+        await writer.drain()
 
 
 class Client:
 
     next_client_id: int = 0
 
-    def __init__(self, username="", state=ClientConnectionState.NOT_CONNECTED, reader=None, writer=None):
+    def __init__(self, username="", state=ClientConnectionState.NOT_CONNECTED, reader=None, writer=None, loop=None):
         self.username: str = username
         self.game_id: int = 0
         self.state: ClientConnectionState = state
@@ -16,10 +56,197 @@ class Client:
         self.id: int = Client.next_client_id
         Client.next_client_id += 1
 
-    async def send(self, msg: ProtocolMessage):
+        # Messages are not written by the handlers, but put into the outbound queue.
+        # The writer task sends them, so a slow client only ever waits for itself.
+        # There is a queue per OutboundLane, the messages of one lane keep their order.
+        self.outbound: List[Deque[bytes]] = [deque() for _ in OutboundLane]
+        # bytes in the outbound queues
+        self.outbound_size: int = 0
+        self.outbound_ready: asyncio.Event = asyncio.Event()
+        # set while the outbound queues are empty, see flush
+        self.outbound_empty: asyncio.Event = asyncio.Event()
+        self.outbound_empty.set()
+        # set when the queue exceeds the high watermark, until it is below the low watermark again
+        self.is_congested: bool = False
+        self.num_dropped: int = 0
+        # while corked, queued messages are held back, see cork
+        self.is_corked: bool = False
+        self.is_closing: bool = False
+        self.writer_task: Optional[asyncio.Task] = None
+        if loop is not None and writer is not None:
+            self.writer_task = loop.create_task(self.write_outbound())
+
+    async def send(self, msg: ProtocolMessage, lane: Optional[OutboundLane] = None):
         print("> [{}] {}".format(self.id, msg))
-        await msg.send(self.writer)
+        # pre-encoded messages return their cached bytes here
+        await self.send_raw(msg.to_bytes(), lane)
+
+    async def send_raw(self, data: bytes, lane: Optional[OutboundLane] = None):
+        self.enqueue(data, lane)
 
     async def send_repeating(self, msg: ProtocolMessage):
         print("> [{}] {}".format(self.id, msg))
-        await msg.send_repeating(self.writer)
+        for frame in msg.encode_frames():
+            self.enqueue(frame)
+
+    def enqueue(self, data: bytes, lane: Optional[OutboundLane] = None):
+        # without a lane, the message goes into the one of its type
+        if self.is_closing:
+            return
+
+        if self.pending_size() + len(data) > ServerConfig.OUTBOUND_HARD_LIMIT:
+            print("  [{}] Client is too slow ({} bytes pending), disconnecting".format(self.id, self.pending_size()))
+            self.close()
+            return
+
+        if not self.is_congested and self.pending_size() + len(data) > ServerConfig.OUTBOUND_HIGH_WATERMARK:
+            self.is_congested = True
+            if ServerConfig.OUTBOUND_POLICY == OutboundPolicy.DISCONNECT:
+                print("  [{}] Client is too slow ({} bytes pending), disconnecting".format(self.id, self.pending_size()))
+                self.close()
+                return
+            print("  [{}] Client is too slow ({} bytes pending), dropping lobby messages".format(self.id, self.pending_size()))
+
+        if lane is None:
+            lane = _LANES[data[0]]
+        if self.is_congested and not lane == OutboundLane.GAME:
+            # only the lobby messages can be dropped, a game can't go on without its messages
+            self.num_dropped += 1
+            return
+
+        self.outbound[lane].append(data)
+        self.outbound_size += len(data)
+        self.outbound_empty.clear()
+        if not self.is_corked:
+            self.outbound_ready.set()
+
+    def has_outbound(self) -> bool:
+        return self.outbound_size > 0
+
+    def clear_outbound(self):
+        for lane in self.outbound:
+            lane.clear()
+        self.outbound_size = 0
+        self.outbound_empty.set()
+
+    def pending_size(self) -> int:
+        # queued, or written but still buffered by the transport
+        return self.outbound_size + self.writer.transport.get_write_buffer_size()
+
+    def cork(self):
+        # Everything sent until uncork is sent together, e.g. all answers to one message.
+        self.is_corked = True
+
+    def uncork(self):
+        self.is_corked = False
+        if self.has_outbound():
+            self.outbound_ready.set()
+
+    async def write_outbound(self):
+        try:
+            while True:
+                await self.outbound_ready.wait()
+                self.outbound_ready.clear()
+                if self.is_corked or not self.has_outbound():
+                    continue
+
+                self.writer.writelines(self.take_outbound())
+                if self.has_outbound():
+                    # the rest goes out with the next write
+                    self.outbound_ready.set()
+                else:
+                    self.outbound_empty.set()
+
+                # only wait if the transport can't keep up, meanwhile new messages are queued
+                await drain_above_high_watermark(self.writer)
+                if self.is_congested and self.pending_size() <= ServerConfig.OUTBOUND_LOW_WATERMARK:
+                    self.is_congested = False
+                    print("  [{}] Client caught up, {} messages dropped so far".format(self.id, self.num_dropped))
+        except ConnectionError:
+            # the reading side notices this as well and removes the client
+            self.clear_outbound()
+            self.is_closing = True
+
+    def take_outbound(self) -> List[bytes]:
+        """
+        Takes what the next write sends: everything queued in the game lane, and from the other
+        lanes only as much as fills the transport's buffer up to its high watermark (but at least
+        one message). Once something is in the transport's buffer, nothing can overtake it, so
+        game messages queued in the meantime only wait for that much.
+        """
+        transport = self.writer.transport
+        budget: int = transport.get_write_buffer_limits()[1] - transport.get_write_buffer_size()
+        chunks: List[bytes] = []
+        for lane in self.outbound:
+            while len(lane) > 0 and (lane is self.outbound[OutboundLane.GAME] or budget > 0 or len(chunks) == 0):
+                chunk: bytes = lane.popleft()
+                chunks.append(chunk)
+                budget -= len(chunk)
+                self.outbound_size -= len(chunk)
+        return chunks
+
+    async def flush(self, timeout: float) -> bool:
+        # waits until everything queued was passed to the operating system, False on timeout or error
+        self.uncork()
+        try:
+            await asyncio.wait_for(self.wait_until_flushed(), timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            return False
+        return not self.is_closing
+
+    async def wait_until_flushed(self):
+        # without a high watermark, the transport pauses writing until its buffer is empty
+        self.writer.transport.set_write_buffer_limits(0)
+        while self.has_outbound() or self.writer.transport.get_write_buffer_size() > 0:
+            if self.is_closing:
+                return
+            await self.outbound_empty.wait()
+            await self.writer.drain()
+
+    def close(self):
+        # the reading side gets EOF, which then removes the client
+        self.is_closing = True
+        self.clear_outbound()
+        self.writer.transport.abort()
+
+    def stop(self):
+        # stops sending, called after the client has been removed
+        self.is_closing = True
+        self.outbound_empty.set()
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+
+
+# the client_connected_callback of BattleshipServer in server.py and router.py
+def create_client_connected(loop, lobby_ctrl):
+
+    # This gets called whenever a new client connects. The parameter `client`
+    # is of type BattleshipServerClient and holds a unique id, the reader and the writer.
+    # and it has a send method that sends a ProtocolMessage
+    # This callback has to return two other callbacks, one for messages and one for the
+    # event that the client disconnects.
+    # The idea is that these two callbacks are defined inside the client_connected function,
+    # because then they implicitly have access to objects created inside client_connected,
+    # for example a GameController.
+    def client_connected(client_reader, client_writer):
+
+        client = Client(reader=client_reader, writer=client_writer, loop=loop)
+        lobby_ctrl.add_client(client)
+
+        async def client_disconnected():
+            print("< [{}] client disconnected".format(client.id))
+            await lobby_ctrl.remove_client(client)
+
+        async def msg_callback(msg: ProtocolMessage):
+            # all answers to this message are sent together, the lobby controller's
+            # dispatcher finds the handler (and ignores types the server doesn't handle)
+            client.cork()
+            try:
+                await lobby_ctrl.handle_msg(client, msg)
+            finally:
+                client.uncork()
+
+        print("< [{}] client connected".format(client.id))
+        return msg_callback, client_disconnected
+
+    return client_connected
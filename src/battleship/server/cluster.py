@@ -0,0 +1,251 @@
+"""
+Running the server in several worker processes, see server.py --workers.
+
+All workers listen on the same port (SO_REUSEPORT), so the kernel distributes
+the client connections among them. Each worker has its own ServerLobbyController
+with the clients connected to it and the games they created.
+
+The LobbyBroker process owns what all workers need to agree on: the usernames,
+the open games and the lobby version, and it routes the chat messages between
+the workers. The workers talk to it through a Unix socket with WorkerCluster.
+Every worker keeps a copy of the open games, which the broker updates in the
+same order everywhere, so GAMES and the lobby versions are the same on all workers.
+
+A JOIN for a game of another worker is handled by handing over the joining
+client's socket to that worker (SCM_RIGHTS over a Unix datagram socket), which
+then handles the JOIN as if the client had always been connected to it.
+"""
+import os
+import asyncio
+import asyncio.streams
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .client import Client
+from .handover import HandoverSocket, read_frame, write_frame, stop_on_sigterm_only
+from common.eventloop import create_event_loop
+
+
+class ClusterConfig:
+
+    def __init__(self, directory: str, num_workers: int, worker_index: int = -1) -> None:
+        # directory for the Unix sockets
+        self.directory: str = directory
+        self.num_workers: int = num_workers
+        self.worker_index: int = worker_index
+
+    @property
+    def broker_path(self) -> str:
+        return os.path.join(self.directory, "broker.sock")
+
+    def handover_path(self, worker_index: int) -> str:
+        return os.path.join(self.directory, "worker{}.sock".format(worker_index))
+
+    def owner_of_game(self, game_id: int) -> int:
+        # worker i creates the game ids i+1, i+1+num_workers, …
+        return (game_id - 1) % self.num_workers
+
+
+class LobbyBroker:
+
+    def __init__(self, loop, config: ClusterConfig) -> None:
+        self.loop = loop
+        self.config: ClusterConfig = config
+        # workers: worker index -> writer
+        self.workers: Dict[int, asyncio.StreamWriter] = {}
+        # users: username -> worker index
+        self.users: Dict[str, int] = {}
+        # lobby_games: game_id -> worker index, for all games that can be joined
+        self.lobby_games: Dict[int, int] = {}
+        self.lobby_version: int = 0
+        self.server = None
+
+    def start(self) -> None:
+        self.server = self.loop.run_until_complete(
+            asyncio.streams.start_unix_server(self.handle_worker, self.config.broker_path, loop=self.loop))
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.server = None
+
+    def send_to_all(self, *frame: Any, except_worker: int = -1) -> None:
+        for worker_index, writer in self.workers.items():
+            if not worker_index == except_worker:
+                write_frame(writer, *frame)
+
+    async def handle_worker(self, reader, writer) -> None:
+        worker_index: int = -1
+        try:
+            while True:
+                frame: Tuple = await read_frame(reader)
+                kind: str = frame[0]
+
+                if kind == "hello":
+                    worker_index = frame[1]
+                    self.workers[worker_index] = writer
+                    print("< [worker {}] connected".format(worker_index))
+
+                # a worker says hello first, like an invalid frame
+                elif worker_index == -1:
+                    raise ValueError("{} before hello".format(kind))
+
+                elif kind == "login":
+                    _, request_id, username = frame
+                    login_successful: bool = username not in self.users
+                    if login_successful:
+                        self.users[username] = worker_index
+                    write_frame(writer, "reply", request_id, login_successful)
+
+                elif kind == "logout":
+                    if self.users.get(frame[1]) == worker_index:
+                        del self.users[frame[1]]
+
+                elif kind == "move_user":
+                    _, username, new_worker_index = frame
+                    self.users[username] = new_worker_index
+
+                elif kind == "lobby_change":
+                    _, game_id, games_entry, msg_bytes = frame
+                    self.apply_lobby_change(worker_index, game_id, games_entry, msg_bytes)
+
+                elif kind == "chat_all":
+                    _, except_username, msg_bytes = frame
+                    self.send_to_all("chat_all", except_username, msg_bytes, except_worker=worker_index)
+
+                elif kind == "chat_to":
+                    _, request_id, username, msg_bytes = frame
+                    recipient_worker: Optional[int] = self.users.get(username)
+                    if recipient_worker is not None and recipient_worker in self.workers:
+                        write_frame(self.workers[recipient_worker], "chat_to", username, msg_bytes)
+                    write_frame(writer, "reply", request_id, recipient_worker is not None)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("< [worker {}] disconnected".format(worker_index))
+        except ValueError as e:
+            print("< [worker {}] sent an invalid frame, disconnecting: {}".format(worker_index, e))
+            writer.close()
+
+        # forget everything about the worker, the other workers delete its games
+        if self.workers.get(worker_index) is writer:
+            del self.workers[worker_index]
+        for username in [username for username, index in self.users.items() if index == worker_index]:
+            del self.users[username]
+        for game_id in [game_id for game_id, index in self.lobby_games.items() if index == worker_index]:
+            self.apply_lobby_change(worker_index, game_id, None, None)
+
+    def apply_lobby_change(self, worker_index: int, game_id: int, games_entry: Optional[bytes], msg_bytes: Optional[bytes]) -> None:
+        # games_entry is None for DELETE_GAME, the workers encode msg_bytes themselves if it is None
+        if games_entry is None:
+            if game_id not in self.lobby_games:
+                return
+            del self.lobby_games[game_id]
+        else:
+            self.lobby_games[game_id] = worker_index
+        self.lobby_version += 1
+        self.send_to_all("lobby_change", self.lobby_version, game_id, games_entry, msg_bytes)
+
+
+def run_broker(config: ClusterConfig, event_loop_name: str) -> None:
+    stop_on_sigterm_only()
+    loop = create_event_loop(event_loop_name)
+    broker: LobbyBroker = LobbyBroker(loop, config)
+    broker.start()
+    print("Lobby broker listening on {}".format(config.broker_path))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    broker.stop()
+    loop.close()
+
+
+class WorkerCluster:
+    """
+    The connection of a worker to the LobbyBroker and to the other workers.
+    """
+
+    def __init__(self, loop, config: ClusterConfig, lobby_ctrl, protocol_factory: Callable) -> None:
+        self.loop = loop
+        self.config: ClusterConfig = config
+        self.lobby_ctrl = lobby_ctrl
+        self.reader = None
+        self.writer = None
+        self.requests: Dict[int, asyncio.Future] = {}
+        self.request_ids = count()
+        # other workers hand over connections through this socket
+        self.handover_socket: HandoverSocket = HandoverSocket(loop, config.handover_path(config.worker_index), protocol_factory,
+                                                              self.adopt_connection)
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.streams.open_unix_connection(self.config.broker_path, loop=self.loop)
+        write_frame(self.writer, "hello", self.config.worker_index)
+        self.loop.create_task(self.read_from_broker())
+        self.handover_socket.open()
+
+    def is_remote_game(self, game_id: int) -> bool:
+        return game_id > 0 and not self.config.owner_of_game(game_id) == self.config.worker_index
+
+    async def request(self, *frame: Any) -> Any:
+        request_id: int = next(self.request_ids)
+        self.requests[request_id] = self.loop.create_future()
+        write_frame(self.writer, frame[0], request_id, *frame[1:])
+        try:
+            return await self.requests[request_id]
+        finally:
+            del self.requests[request_id]
+
+    async def login(self, username: str) -> bool:
+        return await self.request("login", username)
+
+    def logout(self, username: str) -> None:
+        write_frame(self.writer, "logout", username)
+
+    def lobby_change(self, game_id: int, games_entry: Optional[bytes], msg_bytes: bytes) -> None:
+        write_frame(self.writer, "lobby_change", game_id, games_entry, msg_bytes)
+
+    def chat_to_all(self, except_username: str, msg_bytes: bytes) -> None:
+        write_frame(self.writer, "chat_all", except_username, msg_bytes)
+
+    async def chat_to(self, username: str, msg_bytes: bytes) -> bool:
+        # False if there is no such user on any worker
+        return await self.request("chat_to", username, msg_bytes)
+
+    async def read_from_broker(self) -> None:
+        try:
+            while True:
+                frame: Tuple = await read_frame(self.reader)
+                kind: str = frame[0]
+                if kind == "reply":
+                    future: Optional[asyncio.Future] = self.requests.get(frame[1])
+                    if future is not None and not future.done():
+                        future.set_result(frame[2])
+                elif kind == "lobby_change":
+                    await self.lobby_ctrl.apply_lobby_change(*frame[1:])
+                elif kind == "chat_all":
+                    await self.lobby_ctrl.raw_to_all_but_one(frame[2], frame[1])
+                elif kind == "chat_to":
+                    if frame[1] in self.lobby_ctrl.users:
+                        await self.lobby_ctrl.send_raw(self.lobby_ctrl.users[frame[1]], frame[2])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("Lost the connection to the lobby broker, stopping")
+            self.loop.stop()
+
+    async def hand_over(self, client: Client, data: bytes, worker_index: int) -> bool:
+        """
+        Passes the connection of the client with the not yet handled bytes to another
+        worker. The client must not be used afterwards, if this fails it is disconnected.
+        """
+        write_frame(self.writer, "move_user", client.username, worker_index)
+        if await self.handover_socket.hand_over([client], client.username, self.config.handover_path(worker_index), [data]):
+            return True
+        write_frame(self.writer, "move_user", client.username, self.config.worker_index)
+        return False
+
+    async def adopt_connection(self, writers: List[Any], username: str) -> None:
+        await self.lobby_ctrl.adopt_client(writers[0], username)
+
+    def close(self) -> None:
+        self.handover_socket.close()
+        if self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,124 @@
+"""
+Dispatching the messages of the clients to their handlers, see ServerLobbyController.
+
+Every message type the server handles is registered with its handler and the
+state the client must be in for it. Before the handler, a message passes the
+middleware in the order it was added: a middleware gets the route, the client
+and the message, and decides whether and when the next one is called. Checking
+the preconditions is a middleware as well, so others can run before it (e.g.
+forwarding to another process) or after it. The chain of every route is built
+when something is registered, so dispatching a message is one dict lookup.
+"""
+import time
+from enum import IntEnum
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, DefaultDict, Dict, List, Optional
+from common.constants import ErrorCode
+from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolConstantMessages
+from common.states import ClientConnectionState
+from .client import answer_lane
+
+# handles a message of a client
+Handler = Callable[[Any, ProtocolMessage], Awaitable[None]]
+
+
+class Requires(IntEnum):
+    NOTHING = 0
+    LOGGED_IN = 1
+    # logged in and in a running game
+    PLAYING = 2
+
+
+class Route:
+
+    def __init__(self, msg_type: ProtocolMessageType, handler: Handler, requires: Requires) -> None:
+        self.msg_type: ProtocolMessageType = msg_type
+        self.handler: Handler = handler
+        self.requires: Requires = requires
+        # the middleware and then the handler
+        self.chain: Handler = handler
+
+
+# async def middleware(route, client, msg, call_next): … await call_next(client, msg) …
+Middleware = Callable[[Route, Any, ProtocolMessage, Handler], Awaitable[None]]
+
+
+class Dispatcher:
+
+    def __init__(self) -> None:
+        # routes: message type -> route, messages of other types are ignored
+        self.routes: Dict[ProtocolMessageType, Route] = {}
+        self.middleware: List[Middleware] = []
+
+    def register(self, msg_type: ProtocolMessageType, handler: Handler, requires: Requires = Requires.LOGGED_IN) -> None:
+        route: Route = Route(msg_type, handler, requires)
+        self.routes[msg_type] = route
+        self.build_chain(route)
+
+    def use(self, middleware: Middleware) -> None:
+        # runs after the middleware added before
+        self.middleware.append(middleware)
+        for route in self.routes.values():
+            self.build_chain(route)
+
+    def build_chain(self, route: Route) -> None:
+        chain: Handler = route.handler
+        for middleware in reversed(self.middleware):
+            chain = self.bind(middleware, route, chain)
+        route.chain = chain
+
+    @staticmethod
+    def bind(middleware: Middleware, route: Route, call_next: Handler) -> Handler:
+        async def call(client: Any, msg: ProtocolMessage) -> None:
+            await middleware(route, client, msg, call_next)
+        return call
+
+    async def dispatch(self, client: Any, msg: ProtocolMessage) -> None:
+        route: Optional[Route] = self.routes.get(msg.type)
+        if route is not None:
+            await route.chain(client, msg)
+
+
+async def check_preconditions(route: Route, client: Any, msg: ProtocolMessage, call_next: Handler) -> None:
+    # the errors the lobby controller answered with before any handler
+    if msg.missing_or_unkown_param:
+        await client.send(ProtocolConstantMessages.error(ErrorCode.SYNTAX_MISSING_OR_UNKNOWN_PARAMETER), answer_lane(route.msg_type))
+
+    # No other command is permitted if the client is not logged in
+    elif route.requires >= Requires.LOGGED_IN and client.state is ClientConnectionState.NOT_CONNECTED:
+        await client.send(ProtocolConstantMessages.error(ErrorCode.ILLEGAL_STATE_NOT_LOGGED_IN), answer_lane(route.msg_type))
+
+    elif route.requires == Requires.PLAYING and not client.state == ClientConnectionState.PLAYING:
+        await client.send(ProtocolConstantMessages.error(ErrorCode.ILLEGAL_STATE_NOT_IN_GAME), answer_lane(route.msg_type))
+
+    else:
+        await call_next(client, msg)
+
+
+async def trace(route: Route, client: Any, msg: ProtocolMessage, call_next: Handler) -> None:
+    print("< [{}] {}".format(client.id, msg))
+    await call_next(client, msg)
+
+
+class HandlerTimes:
+    """
+    Middleware that measures how long the handlers of each message type take, including the middleware after it.
+    """
+
+    def __init__(self) -> None:
+        self.num_calls: DefaultDict[ProtocolMessageType, int] = defaultdict(int)
+        self.seconds: DefaultDict[ProtocolMessageType, float] = defaultdict(float)
+
+    async def __call__(self, route: Route, client: Any, msg: ProtocolMessage, call_next: Handler) -> None:
+        start_time: float = time.perf_counter()
+        try:
+            await call_next(client, msg)
+        finally:
+            self.num_calls[route.msg_type] += 1
+            self.seconds[route.msg_type] += time.perf_counter() - start_time
+
+    def print_stats(self) -> None:
+        print("handler times:")
+        for msg_type in sorted(self.num_calls, key=lambda msg_type: self.seconds[msg_type], reverse=True):
+            print("  {}: {:,} calls, {:.1f} ms, {:.1f} µs per call".format(
+                msg_type.name, self.num_calls[msg_type], 1e3 * self.seconds[msg_type], 1e6 * self.seconds[msg_type] / self.num_calls[msg_type]))
@@ -0,0 +1,80 @@
+"""
+Every running game handles its messages in its own task, see ServerLobbyController.start_game.
+
+The lobby controller only routes PLACE, ABORT, MOVE and SHOOT, the expired round
+timers and the end of a game because a player logged out into the game's
+mailbox. The GameActor handles them strictly one after the other, so nothing
+else happens to the game while one of them is handled. The mailbox is bounded:
+a client sending faster than its game handles the messages waits for the game,
+and then isn't read anymore until the game caught up. If a handler raises, the
+game can't go on, the lobby controller ends it.
+"""
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Tuple
+from common.constants import ServerConfig
+
+
+class GameActor:
+
+    def __init__(self, loop, game_id: int, over_callback: Callable[["GameActor"], None],
+                 failed_callback: Callable[["GameActor"], Awaitable[None]]) -> None:
+        self.loop = loop
+        self.game_id: int = game_id
+        # called after the last event of the game was handled
+        self.over_callback: Callable[["GameActor"], None] = over_callback
+        # awaited by the game's task when a handler raised, must end the game
+        self.failed_callback: Callable[["GameActor"], Awaitable[None]] = failed_callback
+        # (handler, arguments, future set when handled), the handlers are coroutine functions
+        self.mailbox: asyncio.Queue = asyncio.Queue(maxsize=ServerConfig.GAME_MAILBOX_SIZE)
+        # increased whenever a round timer of the game is armed, an expired timer of an older round is ignored
+        self.round: int = 0
+        # CPU seconds spent handling the game's events, and their number
+        self.cpu_time: float = 0.0
+        self.num_events: int = 0
+        self.is_over: bool = False
+        self.task: asyncio.Task = loop.create_task(self.run())
+
+    async def post(self, handler: Callable[..., Awaitable[None]], *args: Any) -> asyncio.Future:
+        """
+        Queues handler(*args) for the game's task, waits while the mailbox is full.
+        Returns a future that is done when it was handled, or when the game ended before.
+        """
+        done: asyncio.Future = self.loop.create_future()
+        if not self.is_over:
+            await self.mailbox.put((handler, args, done))
+        # the game might have ended while waiting
+        if self.is_over and not done.done():
+            done.set_result(None)
+        return done
+
+    async def run(self) -> None:
+        while not self.is_over:
+            event: Tuple = await self.mailbox.get()
+            handler, args, done = event
+            if handler is not None and not self.is_over:
+                start_time: float = time.process_time()
+                try:
+                    await handler(*args)
+                except Exception:
+                    logging.exception("Error while handling an event of game {}, ending it".format(self.game_id))
+                    await self.failed_callback(self)
+                self.cpu_time += time.process_time() - start_time
+                self.num_events += 1
+            if not done.done():
+                done.set_result(None)
+
+        # the game ended, the rest is not handled anymore
+        while not self.mailbox.empty():
+            _, _, done = self.mailbox.get_nowait()
+            if not done.done():
+                done.set_result(None)
+        self.over_callback(self)
+
+    def stop(self) -> None:
+        # called when the game ended, also from one of its handlers
+        self.is_over = True
+        if self.mailbox.empty():
+            # wakes up the task if it waits for the next event
+            self.mailbox.put_nowait((None, (), self.loop.create_future()))
@@ -0,0 +1,274 @@
+"""
+Running the games in game worker processes, see server.py --game-workers.
+
+The lobby process accepts all connections and handles the lobby: LOGIN, GAMES,
+CHAT and so on. When a JOIN pairs two players, GamePool hands both connections
+over to the game worker with the fewest games, where a GameWorker runs the
+GameController pair with its round timers. A busy lobby then can't delay the
+battle messages, and a busy game worker doesn't delay the lobby.
+
+While a user plays, the lobby keeps a RemoteClient in their place, so they stay
+logged in and receive chat messages: whatever the lobby sends to it is forwarded
+to the game worker. Vice versa, the game worker forwards all messages that are
+not about the game to the lobby. At ENDGAME, the connections go back to the lobby.
+"""
+import os
+import asyncio
+import asyncio.streams
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .client import Client, OutboundLane
+from .handover import HandoverSocket, read_frame, write_frame
+from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolMessageDecoder
+from common.states import ClientConnectionState
+from common.GameController import GameController
+
+
+class GamePoolConfig:
+
+    def __init__(self, directory: str, num_workers: int) -> None:
+        # directory for the Unix sockets
+        self.directory: str = directory
+        self.num_workers: int = num_workers
+
+    @property
+    def lobby_path(self) -> str:
+        return os.path.join(self.directory, "lobby.sock")
+
+    @property
+    def lobby_handover_path(self) -> str:
+        return os.path.join(self.directory, "lobby-handover.sock")
+
+    def worker_handover_path(self, worker_index: int) -> str:
+        return os.path.join(self.directory, "game-worker{}.sock".format(worker_index))
+
+
+# what the game worker needs to know about a game, GameControllers can't be sent as JSON
+GameSettings = Tuple[int, str, int, List[int], int, int, str]
+
+
+def game_settings(game_controller: GameController) -> GameSettings:
+    return (game_controller.game_id, game_controller.username, game_controller.length, list(game_controller.ships),
+            game_controller.round_time, game_controller.options, game_controller.password)
+
+
+def create_game_controller(settings: GameSettings, client: Client, loop) -> GameController:
+    game_id, username, board_size, num_ships, round_time, options, password = settings
+    game_controller: GameController = GameController(game_id, client, loop)
+    game_controller.username = username
+    game_controller.round_time = round_time
+    game_controller.options = options
+    game_controller.password = password
+    game_controller.create_battlefield(board_size, num_ships)
+    return game_controller
+
+
+class RemoteClient:
+    """
+    Takes the place of a client in the lobby while it plays at a game worker.
+    """
+
+    def __init__(self, client: Client, pool: "GamePool", worker_index: int) -> None:
+        self.id: int = client.id
+        self.username: str = client.username
+        self.state: ClientConnectionState = ClientConnectionState.PLAYING
+        self.pool: "GamePool" = pool
+        self.worker_index: int = worker_index
+
+    async def send(self, msg: ProtocolMessage, lane: Optional[OutboundLane] = None):
+        print("> [{}] {}".format(self.id, msg))
+        await self.send_raw(msg.to_bytes(), lane)
+
+    async def send_raw(self, data: bytes, lane: Optional[OutboundLane] = None):
+        self.pool.send_to_user(self.worker_index, self.username, data, lane)
+
+    def stop(self):
+        pass
+
+
+class GamePool:
+    """
+    The lobby's side: starts the games at the game workers and handles what they forward.
+    """
+
+    def __init__(self, loop, config: GamePoolConfig, lobby_ctrl, protocol_factory: Callable) -> None:
+        self.loop = loop
+        self.config: GamePoolConfig = config
+        self.lobby_ctrl = lobby_ctrl
+        # workers: worker index -> writer, for the game workers that are connected
+        self.workers: Dict[int, asyncio.StreamWriter] = {}
+        # num_games: worker index -> number of games running there
+        self.num_games: Dict[int, int] = {}
+        self.server = None
+        # the game workers return the connections through this socket
+        self.handover_socket: HandoverSocket = HandoverSocket(loop, config.lobby_handover_path, protocol_factory, self.adopt_clients)
+
+    def start(self) -> None:
+        self.handover_socket.open()
+        self.server = self.loop.run_until_complete(
+            asyncio.streams.start_unix_server(self.handle_worker, self.config.lobby_path, loop=self.loop))
+
+    def close(self) -> None:
+        self.handover_socket.close()
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+    def has_workers(self) -> bool:
+        return len(self.workers) > 0
+
+    def send_to_user(self, worker_index: int, username: str, data: bytes, lane: Optional[OutboundLane] = None) -> None:
+        if worker_index in self.workers:
+            write_frame(self.workers[worker_index], "to_user", username, data, lane)
+
+    async def start_game(self, game_controller1: GameController, client: Client) -> bool:
+        """
+        Hands over the connections of the game's creator and of the joining client to the
+        game worker with the fewest games, which sends them STARTGAME.
+        """
+        worker_index: int = min(self.workers, key=lambda index: self.num_games[index])
+        clients: List[Client] = [game_controller1.client, client]
+        for c in clients:
+            print("  [{}] Handing over to game worker {} for game {}".format(c.id, worker_index, game_controller1.game_id))
+            self.lobby_ctrl.users[c.username] = RemoteClient(c, self, worker_index)
+            # remove_client then doesn't log out the user
+            self.lobby_ctrl.set_client_state(c, ClientConnectionState.NOT_CONNECTED)
+        self.num_games[worker_index] += 1
+
+        if await self.handover_socket.hand_over(clients, (game_settings(game_controller1), [c.username for c in clients]),
+                                                self.config.worker_handover_path(worker_index)):
+            return True
+
+        # the clients were disconnected
+        self.num_games[worker_index] -= 1
+        for c in clients:
+            await self.logout_remote_user(c.username)
+        return False
+
+    async def adopt_clients(self, writers: List[Any], info: List[Tuple[str, str]]) -> None:
+        # the clients of a game that ended with the names of their states, they replace their RemoteClients
+        for writer, (username, state) in zip(writers, info):
+            await self.lobby_ctrl.adopt_client(writer, username, ClientConnectionState[state])
+
+    async def logout_remote_user(self, username: str) -> None:
+        remote_client: Optional[RemoteClient] = self.lobby_ctrl.users.get(username)
+        if isinstance(remote_client, RemoteClient):
+            await self.lobby_ctrl.logout_user(remote_client)
+
+    async def handle_worker(self, reader, writer) -> None:
+        worker_index: int = -1
+        decoder: ProtocolMessageDecoder = ProtocolMessageDecoder()
+        try:
+            while True:
+                frame: Tuple = await read_frame(reader)
+                kind: str = frame[0]
+
+                if kind == "hello":
+                    worker_index = frame[1]
+                    self.workers[worker_index] = writer
+                    self.num_games[worker_index] = 0
+                    print("< [game worker {}] connected".format(worker_index))
+
+                # a message of a user at the game worker that is not about the game
+                elif kind == "msg":
+                    _, username, msg_bytes = frame
+                    remote_client: Optional[RemoteClient] = self.lobby_ctrl.users.get(username)
+                    for msg in decoder.feed(msg_bytes):
+                        if isinstance(remote_client, RemoteClient):
+                            await self.lobby_ctrl.handle_msg(remote_client, msg)
+
+                elif kind == "logout":
+                    await self.logout_remote_user(frame[1])
+
+                elif kind == "game_over":
+                    self.num_games[worker_index] -= 1
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("< [game worker {}] disconnected".format(worker_index))
+
+        # the connections of its users are gone with it
+        if self.workers.get(worker_index) is writer:
+            del self.workers[worker_index]
+            del self.num_games[worker_index]
+        for username, client in list(self.lobby_ctrl.users.items()):
+            if isinstance(client, RemoteClient) and client.worker_index == worker_index:
+                await self.lobby_ctrl.logout_user(client)
+
+
+class GameWorker:
+    """
+    The game worker's side: runs the games it gets from the lobby and returns the clients afterwards.
+    """
+
+    # handled by the game worker, everything else is forwarded to the lobby
+    GAME_MESSAGES = [ProtocolMessageType.PLACE, ProtocolMessageType.ABORT, ProtocolMessageType.MOVE,
+                     ProtocolMessageType.SHOOT, ProtocolMessageType.LOGOUT, ProtocolMessageType.NONE]
+
+    def __init__(self, loop, config: GamePoolConfig, worker_index: int, lobby_ctrl, protocol_factory: Callable) -> None:
+        self.loop = loop
+        self.config: GamePoolConfig = config
+        self.worker_index: int = worker_index
+        self.lobby_ctrl = lobby_ctrl
+        self.reader = None
+        self.writer = None
+        # the lobby hands over the clients of new games through this socket
+        self.handover_socket: HandoverSocket = HandoverSocket(loop, config.worker_handover_path(worker_index), protocol_factory, self.adopt_game)
+
+    async def connect(self) -> None:
+        self.handover_socket.open()
+        # the lobby process might still be starting
+        while not os.path.exists(self.config.lobby_path):
+            await asyncio.sleep(0.05)
+        self.reader, self.writer = await asyncio.streams.open_unix_connection(self.config.lobby_path, loop=self.loop)
+        write_frame(self.writer, "hello", self.worker_index)
+        self.loop.create_task(self.read_from_lobby())
+
+    def close(self) -> None:
+        self.handover_socket.close()
+        if self.writer is not None:
+            self.writer.close()
+
+    def forward(self, client: Client, msg: ProtocolMessage) -> None:
+        write_frame(self.writer, "msg", client.username, msg.to_bytes())
+
+    def logout(self, username: str) -> None:
+        write_frame(self.writer, "logout", username)
+
+    async def read_from_lobby(self) -> None:
+        try:
+            while True:
+                frame: Tuple = await read_frame(self.reader)
+                if frame[0] == "to_user" and frame[1] in self.lobby_ctrl.users:
+                    await self.lobby_ctrl.send_raw(self.lobby_ctrl.users[frame[1]], frame[2], frame[3])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("Lost the connection to the lobby, stopping")
+            self.loop.stop()
+
+    async def adopt_game(self, writers: List[Any], info: Tuple[GameSettings, List[str]]) -> None:
+        settings, usernames = info
+        clients: List[Client] = [await self.lobby_ctrl.adopt_client(writer, username) for writer, username in zip(writers, usernames)]
+        game_controller1: GameController = create_game_controller(settings, clients[0], self.loop)
+        self.lobby_ctrl.add_game(game_controller1)
+        await self.lobby_ctrl.start_game(game_controller1, clients[1])
+
+    async def return_clients(self, clients: List[Client], game_id: int) -> None:
+        """
+        Hands the clients of a game that ended back to the lobby, unless they are disconnected.
+        """
+        write_frame(self.writer, "game_over", game_id)
+        clients = [client for client in clients if client.id in self.lobby_ctrl.clients and not client.is_closing
+                   and not client.writer.transport.is_closing()]
+        if len(clients) == 0:
+            return
+        info: List[Tuple[str, str]] = [(client.username, client.state.name) for client in clients]
+        logged_in: List[str] = []
+        for client in clients:
+            # forget them here without logging them out
+            if self.lobby_ctrl.users.get(client.username) is client:
+                del self.lobby_ctrl.users[client.username]
+                logged_in.append(client.username)
+            self.lobby_ctrl.set_client_state(client, ClientConnectionState.NOT_CONNECTED)
+
+        if not await self.handover_socket.hand_over(clients, info, self.config.lobby_handover_path):
+            # they were disconnected
+            for username in logged_in:
+                self.logout(username)
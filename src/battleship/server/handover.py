@@ -0,0 +1,171 @@
+"""
+Passing client connections between server processes, see cluster.py and gamepool.py.
+
+The processes talk to each other through Unix stream sockets with frames of
+JSON and bytes, like the router and its backends. A connection is handed over
+through a Unix datagram socket: the file descriptor of the client's socket goes
+with SCM_RIGHTS, together with the bytes that were received from the client but
+not handled yet, so that the receiving process continues exactly where the
+sending process stopped.
+"""
+import os
+import json
+import array
+import signal
+import socket
+import struct
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from .client import Client
+
+# every frame between two processes: the lengths of both parts, then a JSON list with the
+# positions of the bytes arguments and the frame (kind, arguments…) with their lengths in
+# their place, and the bytes arguments one after the other
+_FRAME_HEADER_STRUCT = struct.Struct("!II")
+# a handover datagram starts with the length of its JSON part, the unhandled bytes follow it
+_HANDOVER_HEADER_STRUCT = struct.Struct("!I")
+# maximum size of a handover datagram: the information about the clients and their unhandled bytes
+_HANDOVER_MAX_LENGTH = 256 * 1024
+# at most this many connections are handed over at once
+_HANDOVER_MAX_FDS = 2
+
+# seconds to wait for a client's outgoing messages to be sent before handing it over
+HANDOVER_FLUSH_TIMEOUT = 5.0
+
+
+def stop_on_sigterm_only() -> None:
+    # for the processes started by server.py: the main process stops them with SIGTERM, also on Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+
+async def read_frame(reader) -> Tuple:
+    # raises ValueError if the frame is not one of write_frame
+    header: bytes = await reader.readexactly(_FRAME_HEADER_STRUCT.size)
+    json_length, data_length = _FRAME_HEADER_STRUCT.unpack(header)
+    frame: Any = json.loads((await reader.readexactly(json_length)).decode())
+    data: bytes = await reader.readexactly(data_length)
+    try:
+        positions, kind, *arguments = frame
+        frame = [kind] + arguments
+        offset: int = 0
+        for position in positions:
+            length: int = frame[position]
+            frame[position] = data[offset:offset + length]
+            offset += length
+    except (TypeError, IndexError) as e:
+        raise ValueError("invalid frame: {}".format(e))
+    return tuple(frame)
+
+
+def write_frame(writer, *frame: Any) -> None:
+    positions: List[int] = [position for position, argument in enumerate(frame) if isinstance(argument, bytes)]
+    data: bytes = b''.join(frame[position] for position in positions)
+    header: bytes = json.dumps([positions] + [len(argument) if isinstance(argument, bytes) else argument for argument in frame]).encode()
+    writer.write(_FRAME_HEADER_STRUCT.pack(len(header), len(data)) + header + data)
+
+
+class HandoverSocket:
+    """
+    Sends client connections to other processes and takes over the ones they send.
+    The connections must use BattleshipProtocol, it can't stop a StreamReader.
+    """
+
+    def __init__(self, loop, path: str, protocol_factory: Callable,
+                 adopt_callback: Callable[[List[Any], Any], Awaitable[None]]) -> None:
+        self.loop = loop
+        self.path: str = path
+        # creates a BattleshipProtocol for the connections we take over
+        self.protocol_factory: Callable = protocol_factory
+        # gets the writers of the taken over connections and the info sent with them,
+        # the connections only get their unhandled bytes after it returned
+        self.adopt_callback = adopt_callback
+        self.socket: Optional[socket.socket] = None
+
+    def open(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.path)
+        self.socket.setblocking(False)
+        self.loop.add_reader(self.socket.fileno(), self.receive)
+
+    def close(self) -> None:
+        if self.socket is not None:
+            self.loop.remove_reader(self.socket.fileno())
+            self.socket.close()
+            self.socket = None
+
+    async def hand_over(self, clients: List[Client], info: Any, target_path: str, prefixes: Optional[List[bytes]] = None) -> bool:
+        """
+        Passes the connections of the clients to the process listening on target_path, with
+        the bytes they sent that were not handled yet, after the prefixes (e.g. the message
+        that is being handled right now). The clients must not be used afterwards.
+        If this fails, the clients are disconnected.
+        """
+        if prefixes is None:
+            prefixes = [b''] * len(clients)
+        # stop handling their messages first, then wait until they got everything we sent them
+        unhandled: List[bytes] = [prefix + client.writer.protocol.detach() for client, prefix in zip(clients, prefixes)]
+        for client in clients:
+            if not await client.flush(HANDOVER_FLUSH_TIMEOUT):
+                return self.handover_failed(clients, "client {} did not receive everything".format(client.id))
+
+        sockets: List[socket.socket] = [client.writer.transport.get_extra_info("socket") for client in clients]
+        header: bytes = json.dumps([info, [sock.family for sock in sockets], [len(data) for data in unhandled]]).encode()
+        handover: bytes = b''.join([_HANDOVER_HEADER_STRUCT.pack(len(header)), header] + unhandled)
+        if len(handover) > _HANDOVER_MAX_LENGTH:
+            return self.handover_failed(clients, "too much unhandled data ({} bytes)".format(len(handover)))
+        try:
+            self.socket.sendmsg([handover], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [sock.fileno() for sock in sockets]))],
+                               0, target_path)
+        except OSError as e:
+            return self.handover_failed(clients, str(e))
+
+        # only closes our file descriptors, the connections stay open
+        for client in clients:
+            client.writer.transport.abort()
+        return True
+
+    def handover_failed(self, clients: List[Client], reason: str) -> bool:
+        for client in clients:
+            print("  [{}] Handing over the connection failed, disconnecting: {}".format(client.id, reason))
+            client.close()
+        return False
+
+    def receive(self) -> None:
+        while True:
+            try:
+                handover, ancdata, _, _ = self.socket.recvmsg(_HANDOVER_MAX_LENGTH, socket.CMSG_SPACE(_HANDOVER_MAX_FDS * array.array("i").itemsize))
+            except BlockingIOError:
+                return
+            fds: array.array = array.array("i")
+            for level, kind, fd_data in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    fds.frombytes(fd_data[:len(fd_data) - (len(fd_data) % fds.itemsize)])
+            self.loop.create_task(self.adopt(list(fds), handover))
+
+    async def adopt(self, fds: List[int], handover: bytes) -> None:
+        json_length: int = _HANDOVER_HEADER_STRUCT.unpack_from(handover)[0]
+        offset: int = _HANDOVER_HEADER_STRUCT.size + json_length
+        info, families, lengths = json.loads(handover[_HANDOVER_HEADER_STRUCT.size:offset].decode())
+        unhandled: List[bytes] = []
+        for length in lengths:
+            unhandled.append(handover[offset:offset + length])
+            offset += length
+        protocols: List[Any] = []
+        for fd, family in zip(fds, families):
+            sock: socket.socket = socket.socket(family, socket.SOCK_STREAM, fileno=fd)
+            _, protocol = await self.loop.connect_accepted_socket(self.create_paused_protocol, sock)
+            protocols.append(protocol)
+        await self.adopt_callback([protocol.writer for protocol in protocols], info)
+        # now whatever the clients sent in the meantime, first what the other process received
+        for protocol, data in zip(protocols, unhandled):
+            protocol.data_received(data)
+            if len(protocol.pending) < protocol.MAX_PENDING_MESSAGES:
+                protocol.resume_reading()
+
+    def create_paused_protocol(self):
+        # the connection must not be read before the adopt_callback
+        protocol = self.protocol_factory()
+        protocol.start_paused = True
+        return protocol
@@ -1,7 +1,14 @@
-from typing import Optional, Dict, List, Tuple, Any
-from .client import Client
-from common.constants import ErrorCode, GameOptions, EndGameReason
-from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolConfig, NumShips, Positions, Position, ShipPosition, ShipPositions
+import logging
+from collections import deque
+from itertools import islice
+from typing import Optional, Dict, List, Tuple, Any, Deque, Set
+from .client import Client, OutboundLane
+from .timerwheel import TimerWheel
+from .gameactor import GameActor
+from .dispatch import Dispatcher, Requires, Route, Handler, check_preconditions, trace
+from .ratelimit import RateLimiter
+from common.constants import ErrorCode, GameOptions, EndGameReason, ServerConfig
+from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolConfig, ProtocolConstantMessages, ProtocolMessageCodecs, frame_payloads, NumShips, Positions, Position, ShipPosition, ShipPositions
 from common.states import ClientConnectionState, GameState
 from common.GameController import GameController
 from random import randrange
@@ -12,6 +19,8 @@ class ServerLobbyController:
 
     # we base some tests on the fact that game_id 0 does never exist…
     next_game_id = 1
+    # with several workers, every worker creates every num_workers-th game_id
+    game_id_step = 1
 
     def __init__(self, loop):
         self.loop = loop
@@ -25,22 +34,90 @@ class ServerLobbyController:
         self.clients: Dict[int, Client] = {}
         # games: game_id -> [game_controller1, game_controller2]
         self.games: Dict[int, Tuple[GameController, Optional[GameController]]] = {}
+        # lobby_games: game_id -> encoded GAMES entry, for all games that can be joined
+        self.lobby_games: Dict[int, bytes] = {}
+        # increased whenever a game is added to or removed from lobby_games
+        self.lobby_version: int = 0
+        # pre-encoded GAMES message(s) of all lobby games, rebuilt on demand after a change
+        self._games_snapshot: Optional[bytes] = None
+        # lobby_subscribers: all clients in the game selection, the only ones who receive GAME and DELETE_GAME
+        self.lobby_subscribers: Set[Client] = set()
+        # lobby_changes: the encoded GAME/DELETE_GAME messages of the last lobby versions, oldest first
+        self.lobby_changes: Deque[bytes] = deque(maxlen=ServerConfig.LOBBY_CHANGE_LOG_LENGTH)
+        # the round timers of all games: game controller of the player whose turn it is -> timeout
+        self.round_timers: TimerWheel = TimerWheel(loop, self.handle_timeouts)
+        # game_actors: game_id -> the task handling the game's events, for all running games
+        self.game_actors: Dict[int, GameActor] = {}
+        # CPU seconds and number of events of the games that ended
+        self.game_cpu_time: float = 0.0
+        self.num_game_events: int = 0
+        # the WorkerCluster if this is one of several worker processes, see attach_cluster
+        self.cluster = None
+        # with game workers: the GamePool in the lobby process, the GameWorker in a game worker process
+        self.game_pool = None
+        self.game_worker = None
+        # behind a router: the BackendPool in the router, the RouterLink in a backend, see router.py
+        self.backend_pool = None
+        self.router_link = None
+
+        # the handlers of the client messages, see server/dispatch.py
+        self.dispatcher: Dispatcher = Dispatcher()
+        self.dispatcher.use(trace)
+        # before anything else happens to a message
+        self.rate_limiter: Optional[RateLimiter] = None
+        if ServerConfig.RATE_LIMITING:
+            self.rate_limiter = RateLimiter()
+            self.dispatcher.use(self.rate_limiter)
+        self.dispatcher.use(self.forward_to_other_process)
+        self.dispatcher.use(check_preconditions)
+        self.dispatcher.register(ProtocolMessageType.NONE, self.handle_unknown, Requires.NOTHING)
+        self.dispatcher.register(ProtocolMessageType.LOGIN, self.handle_login, Requires.NOTHING)
+        self.dispatcher.register(ProtocolMessageType.LOGOUT, self.handle_logout)
+        self.dispatcher.register(ProtocolMessageType.CHAT_SEND, self.handle_chat_send)
+        self.dispatcher.register(ProtocolMessageType.GET_GAMES, self.handle_get_games)
+        self.dispatcher.register(ProtocolMessageType.CREATE_GAME, self.handle_create_game)
+        # handle_cancel handles the case when the user has not created a game
+        self.dispatcher.register(ProtocolMessageType.CANCEL, self.handle_cancel)
+        # handle_join handles the case that they created a game themselves
+        self.dispatcher.register(ProtocolMessageType.JOIN, self.handle_join)
+        # the game's task handles these, in the order they arrive
+        self.dispatcher.register(ProtocolMessageType.PLACE, self.in_game(self.handle_place), Requires.PLAYING)
+        self.dispatcher.register(ProtocolMessageType.ABORT, self.in_game(self.handle_abort), Requires.PLAYING)
+        self.dispatcher.register(ProtocolMessageType.MOVE, self.in_game(self.handle_move), Requires.PLAYING)
+        self.dispatcher.register(ProtocolMessageType.SHOOT, self.in_game(self.handle_shoot), Requires.PLAYING)
+
+    def attach_cluster(self, cluster):
+        # usernames and lobby games are then managed by the LobbyBroker, the games only by their worker
+        self.cluster = cluster
+        ServerLobbyController.next_game_id = cluster.config.worker_index + 1
+        ServerLobbyController.game_id_step = cluster.config.num_workers
 
     def print_stats(self):
+        rate_limits: str = self.rate_limiter.stats() if self.rate_limiter is not None else "rate limits: off"
         stats = """
 #users: {}
 #clients: {}
 #games: {}
+#lobby games: {} (version {})
+#lobby subscribers: {}
 #user_gid: {}
 #user_game_ctrl: {}
+#game actors: {}
+game CPU time: {:.1f} ms for {} events of ended games
+{}
 
 users: {}
 games: {}
 """.format(len(self.users),
             len(self.clients),
             len(self.games),
+            len(self.lobby_games), self.lobby_version,
+            len(self.lobby_subscribers),
             len(self.user_gid),
             len(self.user_game_ctrl),
+            len(self.game_actors),
+            1e3 * self.game_cpu_time, self.num_game_events,
+            rate_limits,
             [username for username in self.users.keys()],
             ["{}: {} vs {}".format(game_id, game_ctrls[0].username if game_ctrls[0] is not None else "", game_ctrls[1].username if game_ctrls[1] is not None else "") for game_id, game_ctrls in self.games.items()])
 
@@ -55,15 +132,39 @@ games: {}
         # Might already have been removed by a concurrent call
         if client.id in self.clients:
             del self.clients[client.id]
+        client.stop()
 
         self.print_stats()
 
-    def login_user(self, username: str, client: Client) -> bool:
-        if username not in self.users:
-            self.users[username] = client
-            return True
-        else:
+    async def login_user(self, username: str, client: Client) -> bool:
+        if username in self.users:
             return False
+        # the user might be logged in at another worker
+        if self.cluster is not None and not await self.cluster.login(username):
+            return False
+        self.users[username] = client
+        return True
+
+    async def adopt_client(self, writer, username: str, state: ClientConnectionState = ClientConnectionState.GAME_SELECTION) -> Client:
+        # another process handed over the connection of the user, see hand_off_client and server/gamepool.py
+        client: Client = next(client for client in self.clients.values() if client.writer is writer)
+        client.username = username
+        if not state == ClientConnectionState.NOT_CONNECTED:
+            self.users[username] = client
+        self.set_client_state(client, state)
+        self.print_client(client, "Took over '{}' from another process".format(username))
+        return client
+
+    async def hand_off_client(self, client: Client, msg: ProtocolMessage, worker_index: int):
+        # the worker of the game handles the JOIN, the user stays logged in
+        self.print_client(client, "Handing over to worker {} for {}".format(worker_index, msg))
+        if not await self.cluster.hand_over(client, msg.to_bytes(), worker_index):
+            # it was disconnected and gets logged out in remove_client
+            return
+        # forget the user without logging them out, remove_client then only removes the client
+        if self.users.get(client.username) is client:
+            del self.users[client.username]
+        self.set_client_state(client, ClientConnectionState.NOT_CONNECTED)
 
     async def logout_user(self, client: Client):
 
@@ -72,12 +173,18 @@ games: {}
             return
 
         # Immediately set the client to not connected to stop a concurrent call to logout_user.
-        client.state == ClientConnectionState.NOT_CONNECTED
+        self.set_client_state(client, ClientConnectionState.NOT_CONNECTED)
 
         # We first delete the user, so they don't receive DELETE msgs and such.
         # But they might already have been removed by a concurrent call.
         if client.username in self.users:
             del self.users[client.username]
+            if self.cluster is not None:
+                self.cluster.logout(client.username)
+            if self.game_worker is not None:
+                self.game_worker.logout(client.username)
+            if self.backend_pool is not None:
+                self.backend_pool.logout(client)
 
         # End all games of the user, according to their state
         if client.username in self.user_game_ctrl:
@@ -90,12 +197,14 @@ games: {}
         game_id: int = our_ctrl.game_id
 
         if our_ctrl.state == GameState.IN_LOBBY:
-            await self.send_delete_game(game_id)
+            await self.remove_lobby_game(game_id)
 
         elif our_ctrl.state in [GameState.WAITING, GameState.PLACE_SHIPS, GameState.YOUR_TURN, GameState.OPPONENTS_TURN]:
             other_ctrl: GameController = self.user_game_ctrl[our_ctrl.opponent_name]
+            # the game ends after what it got before, or already ended with one of these
             # TODO: really send SERVER_CLOSED_CONNECTION?
-            await self.end_game_with_reason(our_ctrl, other_ctrl, EndGameReason.SERVER_CLOSED_CONNECTION, EndGameReason.SERVER_CLOSED_CONNECTION)
+            await (await self.game_actors[game_id].post(self.end_game_with_reason, our_ctrl, other_ctrl,
+                                                        EndGameReason.SERVER_CLOSED_CONNECTION, EndGameReason.SERVER_CLOSED_CONNECTION))
 
         else:
             self.print_client(client, "Problem while deleting game: GameController is in an end state and should no longer exist")
@@ -110,111 +219,154 @@ games: {}
         if client.username in self.user_game_ctrl:
             del self.user_game_ctrl[client.username]
 
+    def set_client_state(self, client: Client, state: ClientConnectionState):
+        client.state = state
+        if state == ClientConnectionState.GAME_SELECTION:
+            self.lobby_subscribers.add(client)
+        else:
+            self.lobby_subscribers.discard(client)
+
     def print_client(self, client: Client, text: str):
         print("  [{}] {}".format(client.id, text))
 
-    async def send(self, client, msg):
-        try:
-            await client.send(msg)
-        except ConnectionResetError:
-            # this client/user needs to be removed
-            await self.remove_client(client)
+    # The clients only queue the messages, if sending fails the client gets disconnected
+    # and removed via remove_client.
+    async def send(self, client, msg, lane: Optional[OutboundLane] = None):
+        await client.send(msg, lane)
 
-    async def send_repeating(self, client, msg):
-        try:
-            await client.send_repeating(msg)
-        except ConnectionResetError:
-            # this client/user needs to be removed
-            await self.remove_client(client)
+    async def send_raw(self, client, data: bytes, lane: Optional[OutboundLane] = None):
+        await client.send_raw(data, lane)
 
     async def msg_to_user(self, msg: ProtocolMessage, username: str):
         await self.send(self.users[username], msg)
 
     # send message to all logged in users
     async def msg_to_all(self, msg: ProtocolMessage):
-        usernames = list(self.users.keys())
-        for username in usernames:
-            # check if the user is still logged in, could have logged out in the meanwhile
-            if username in self.users:
-                await self.send(self.users[username], msg)
+        await self.broadcast(msg, list(self.users.values()))
 
     # send message to all logged in users but the one mentioned in the last parameter
     async def msg_to_all_but_one(self, msg: ProtocolMessage, except_username: str):
-        usernames = list(self.users.keys())
-        for username in usernames:
-            # check if the user is still logged in, could have logged out in the meanwhile
-            if not username == except_username and username in self.users:
-                await self.send(self.users[username], msg)
+        await self.broadcast(msg, [client for username, client in self.users.items() if not username == except_username])
+
+    # send message to all users in the game selection
+    async def msg_to_lobby(self, msg: ProtocolMessage, also_to: Optional[Client] = None):
+        clients: List[Client] = list(self.lobby_subscribers)
+        if also_to is not None and also_to not in self.lobby_subscribers:
+            clients.append(also_to)
+        await self.broadcast(msg, clients)
+
+    async def raw_to_all_but_one(self, data: bytes, except_username: str):
+        await self.broadcast_raw(data, [client for username, client in self.users.items() if not username == except_username])
+
+    async def raw_to_lobby(self, data: bytes):
+        await self.broadcast_raw(data, list(self.lobby_subscribers))
+
+    async def broadcast(self, msg: ProtocolMessage, clients: List[Client]):
+        # encode only once and queue the same bytes for every client
+        print("> [{} clients] {}".format(len(clients), msg))
+        await self.broadcast_raw(msg.to_bytes(), clients)
+
+    async def broadcast_raw(self, data: bytes, clients: List[Client]):
+        # send_raw only queues the bytes, nothing is awaited between the clients. Every client's
+        # writer task drains on its own, a slow one is disconnected (or doesn't get the lobby
+        # messages) once it is above the OUTBOUND_HIGH_WATERMARK, instead of a drain timeout.
+        for client in clients:
+            await client.send_raw(data)
+
+    async def add_lobby_game(self, game_controller: GameController):
+        game_msg: ProtocolMessage = game_controller.to_game_msg()
+        # GAME and GAMES have the same parameters, only the encoding of the username differs
+        games_entry: bytes = ProtocolMessageCodecs[ProtocolMessageType.GAMES].encode(game_msg.parameters)
+        if self.cluster is not None:
+            # the creator needs the game_id now, everybody else gets it with the broker's lobby version
+            await self.send(game_controller.client, game_msg)
+            self.cluster.lobby_change(game_controller.game_id, games_entry, game_msg.to_bytes())
+            return
+        self.lobby_games[game_controller.game_id] = games_entry
+        self.lobby_changed(game_msg)
+        # and send the game to all users in the game selection, and to its creator who needs the game_id
+        await self.msg_to_lobby(game_msg, also_to=game_controller.client)
 
-    async def send_delete_game(self, game_id: int):
+    async def remove_lobby_game(self, game_id: int):
         del_msg: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.DELETE_GAME, {"game_id": game_id})
-        await self.msg_to_all(del_msg)
+        if self.cluster is not None:
+            self.cluster.lobby_change(game_id, None, del_msg.to_bytes())
+            return
+        if game_id in self.lobby_games:
+            del self.lobby_games[game_id]
+            self.lobby_changed(del_msg)
+        await self.msg_to_lobby(del_msg)
+
+    def lobby_changed(self, change: ProtocolMessage):
+        self.lobby_version += 1
+        self._games_snapshot = None
+        # the change for version v is lobby_changes[-1 - (lobby_version - v)]
+        self.lobby_changes.append(change.to_bytes())
+
+    async def apply_lobby_change(self, lobby_version: int, game_id: int, games_entry: Optional[bytes], change: Optional[bytes]):
+        # a lobby change from the LobbyBroker, in the same order on all workers
+        if change is None:
+            change = ProtocolMessage.create_single(ProtocolMessageType.DELETE_GAME, {"game_id": game_id}).to_bytes()
+        if games_entry is None:
+            self.lobby_games.pop(game_id, None)
+        else:
+            self.lobby_games[game_id] = games_entry
+        self.lobby_version = lobby_version
+        self._games_snapshot = None
+        self.lobby_changes.append(change)
+        print("> [{} clients] lobby version {}: {} game {}".format(len(self.lobby_subscribers), lobby_version, "GAME" if games_entry is not None else "DELETE_GAME", game_id))
+        await self.raw_to_lobby(change)
+
+    def lobby_changes_since(self, lobby_version: int) -> Optional[List[bytes]]:
+        # None if the changes are not known anymore (or never were)
+        num_changes: int = self.lobby_version - lobby_version
+        if num_changes < 0 or num_changes > len(self.lobby_changes):
+            return None
+        return list(islice(self.lobby_changes, len(self.lobby_changes) - num_changes, None))
+
+    def games_snapshot(self) -> bytes:
+        if self._games_snapshot is None:
+            self._games_snapshot = b''.join(frame_payloads(ProtocolMessageType.GAMES, list(self.lobby_games.values())))
+        return self._games_snapshot
 
     async def handle_msg(self, client: Client, msg: ProtocolMessage):
+        await self.dispatcher.dispatch(client, msg)
 
-        if msg.missing_or_unkown_param:
-            answer: ProtocolMessage = ProtocolMessage.create_error(ErrorCode.SYNTAX_MISSING_OR_UNKNOWN_PARAMETER)
-            await self.send(client, answer)
-
-        # No other command is permitted if the client is not logged in
-        elif client.state is ClientConnectionState.NOT_CONNECTED and msg.type is not ProtocolMessageType.LOGIN:
-            answer = ProtocolMessage.create_error(ErrorCode.ILLEGAL_STATE_NOT_LOGGED_IN)
-            await self.send(client, answer)
-
-        elif msg.type == ProtocolMessageType.LOGIN:
-            await self.handle_login(client, msg)
-
-        elif msg.type == ProtocolMessageType.LOGOUT:
-            await self.handle_logout(client, msg)
-
-        elif msg.type == ProtocolMessageType.CHAT_SEND:
-            await self.handle_chat_send(client, msg)
-
-        elif msg.type == ProtocolMessageType.GET_GAMES:
-            await self.handle_get_games(client, msg)
-
-        elif msg.type == ProtocolMessageType.CREATE_GAME:
-            await self.handle_create_game(client, msg)
-
-        # handle_cancel handles the case when the user has not created a game
-        elif msg.type == ProtocolMessageType.CANCEL:
-            await self.handle_cancel(client, msg)
-
-        # handle_join handles the case that they created a game themselves
-        elif msg.type == ProtocolMessageType.JOIN:
-            await self.handle_join(client, msg)
-
-        # all the following messages are only valid when playing
-        elif not client.state == ClientConnectionState.PLAYING:
-            answer = ProtocolMessage.create_error(ErrorCode.ILLEGAL_STATE_NOT_IN_GAME)
-            await self.send(client, answer)
+    async def forward_to_other_process(self, route: Route, client: Client, msg: ProtocolMessage, call_next: Handler):
+        # a game worker only handles the games, the lobby the rest
+        if self.game_worker is not None and msg.type not in self.game_worker.GAME_MESSAGES:
+            self.game_worker.forward(client, msg)
 
-        elif msg.type == ProtocolMessageType.PLACE:
-            await self.handle_place(client, msg)
+        # the game runs at a backend, which answers the player directly
+        elif self.backend_pool is not None and msg.type in self.backend_pool.GAME_MESSAGES and self.backend_pool.is_routed(client):
+            self.backend_pool.forward(client, msg)
 
-        elif msg.type == ProtocolMessageType.ABORT:
-            await self.handle_abort(client, msg)
+        else:
+            await call_next(client, msg)
 
-        elif msg.type == ProtocolMessageType.MOVE:
-            await self.handle_move(client, msg)
+    def in_game(self, handler: Handler) -> Handler:
+        async def post_to_game(client: Client, msg: ProtocolMessage):
+            # waits while the game's mailbox is full, so the client isn't read meanwhile
+            await self.game_actors[self.user_gid[client.username]].post(handler, client, msg)
+        return post_to_game
 
-        elif msg.type == ProtocolMessageType.SHOOT:
-            await self.handle_shoot(client, msg)
+    async def handle_unknown(self, client: Client, msg: ProtocolMessage):
+        await self.send(client, ProtocolConstantMessages.error(ErrorCode.UNKNOWN))
 
     async def handle_login(self, client: Client, msg: ProtocolMessage):
         params: Dict[str, Any] = msg.parameters
         answer: Optional[ProtocolMessage] = None
 
         if client.state is not ClientConnectionState.NOT_CONNECTED:
-            answer = ProtocolMessage.create_error(ErrorCode.ILLEGAL_STATE_ALREADY_LOGGED_IN)
+            answer = ProtocolConstantMessages.error(ErrorCode.ILLEGAL_STATE_ALREADY_LOGGED_IN)
         elif len(params["username"]) > ProtocolConfig.USERNAME_MAX_LENGTH:
-            answer = ProtocolMessage.create_error(ErrorCode.SYNTAX_USERNAME_TOO_LONG)
+            answer = ProtocolConstantMessages.error(ErrorCode.SYNTAX_USERNAME_TOO_LONG)
         else:
-            login_successful: bool = self.login_user(params["username"], client)
+            login_successful: bool = await self.login_user(params["username"], client)
             if not login_successful:
-                answer = ProtocolMessage.create_error(ErrorCode.PARAMETER_USERNAME_ALREADY_EXISTS)
+                answer = ProtocolConstantMessages.error(ErrorCode.PARAMETER_USERNAME_ALREADY_EXISTS)
             else:
-                client.state = ClientConnectionState.GAME_SELECTION
+                self.set_client_state(client, ClientConnectionState.GAME_SELECTION)
                 #self.users[username].state = ClientConnectionState.GAME_SELECTION
                 client.username = params["username"]
                 self.users[client.username] = client
@@ -241,7 +393,7 @@ games: {}
         recipient: str = params["username"]
 
         if len(text) > ProtocolConfig.CHAT_MAX_TEXT_LENGTH:
-            answer = ProtocolMessage.create_error(ErrorCode.SYNTAX_MESSAGE_TEXT_TOO_LONG)
+            answer = ProtocolConstantMessages.error(ErrorCode.SYNTAX_MESSAGE_TEXT_TOO_LONG)
 
         # check if the message is for all users
         elif recipient == "":
@@ -249,10 +401,19 @@ games: {}
                                                     {"sender": client.username, "recipient": "",
                                                      "text": text})
             await self.msg_to_all_but_one(forward, client.username)
+            if self.cluster is not None:
+                self.cluster.chat_to_all(client.username, forward.to_bytes())
             self.print_client(client, "Forwarding chat message to all logged in users but {}".format(client.username))
 
         elif recipient not in self.users:
-            answer = ProtocolMessage.create_error(ErrorCode.PARAMETER_USERNAME_DOES_NOT_EXIST)
+            forward = ProtocolMessage.create_single(ProtocolMessageType.CHAT_RECV,
+                                                    {"sender": client.username, "recipient": recipient,
+                                                     "text": text})
+            # the recipient might be logged in at another worker
+            if self.cluster is not None and await self.cluster.chat_to(recipient, forward.to_bytes()):
+                self.print_client(client, "Forwarding chat message to '{}' at another worker".format(recipient))
+            else:
+                answer = ProtocolConstantMessages.error(ErrorCode.PARAMETER_USERNAME_DOES_NOT_EXIST)
 
         else:
             forward = ProtocolMessage.create_single(ProtocolMessageType.CHAT_RECV,
@@ -269,23 +430,18 @@ games: {}
         if client.state in [ClientConnectionState.GAME_CREATED, ClientConnectionState.PLAYING]:
             # TODO: in the case of GAME_CREATED, this is more or less in line with the RFC
             # TODO: in the case of PLAYING, a better error code would be nice
-            msg_error = ProtocolMessage.create_error(ErrorCode.ILLEGAL_STATE_NUMBER_OF_GAMES_LIMIT_EXCEEDED)
+            msg_error = ProtocolConstantMessages.error(ErrorCode.ILLEGAL_STATE_NUMBER_OF_GAMES_LIMIT_EXCEEDED)
             await self.send(client, msg_error)
             return
 
         game_id: int = ServerLobbyController.next_game_id
-        ServerLobbyController.next_game_id += 1
+        ServerLobbyController.next_game_id += ServerLobbyController.game_id_step
 
         game_controller: GameController = await GameController.create_from_msg(game_id, client, self.loop, msg, client.username)
 
         if game_controller is not None:
-            client.state = ClientConnectionState.GAME_CREATED
-            self.user_gid[client.username] = game_id
-            self.games[game_id] = (game_controller, None)
-            self.user_game_ctrl[client.username] = game_controller
-            # and send the game to all users
-            game_msg: ProtocolMessage = game_controller.to_game_msg()
-            await self.msg_to_all(game_msg)
+            self.add_game(game_controller)
+            await self.add_lobby_game(game_controller)
 
             self.print_stats()
         # the game controller already sends the error messages, so this is fine.
@@ -294,20 +450,30 @@ games: {}
             pass
             #print("Fail in Creation of Game Controller")
 
+    def add_game(self, game_controller: GameController):
+        client: Client = game_controller.client
+        self.set_client_state(client, ClientConnectionState.GAME_CREATED)
+        self.user_gid[client.username] = game_controller.game_id
+        self.games[game_controller.game_id] = (game_controller, None)
+        self.user_game_ctrl[client.username] = game_controller
+
     async def handle_cancel(self, client: Client, msg: ProtocolMessage):
         if client.state == ClientConnectionState.GAME_CREATED:
             game_id: int = self.user_gid[client.username]
             del self.user_gid[client.username]
             del self.user_game_ctrl[client.username]
             del self.games[game_id]
-            client.state = ClientConnectionState.GAME_SELECTION
-            await self.send_delete_game(game_id)
+            self.set_client_state(client, ClientConnectionState.GAME_SELECTION)
+            await self.remove_lobby_game(game_id)
         else:
-            msg_error: ProtocolMessage = ProtocolMessage.create_error(ErrorCode.PARAMETER_UNKNOWN_GAME_ID)
+            msg_error: ProtocolMessage = ProtocolConstantMessages.error(ErrorCode.PARAMETER_UNKNOWN_GAME_ID)
             await self.send(client, msg_error)
 
     async def handle_get_games(self, client: Client, msg: ProtocolMessage):
-        await self.send_games_to_user(client)
+        if "lobby_version" in msg.parameters:
+            await self.send_lobby_changes_to_user(client, msg.parameters["lobby_version"])
+        else:
+            await self.send_games_to_user(client)
 
     async def handle_join(self, client: Client, msg: ProtocolMessage):
         answer: Optional[ProtocolMessage] = None
@@ -316,62 +482,97 @@ games: {}
 
         if not client.state == ClientConnectionState.GAME_SELECTION:
             # TODO: this is not really the right error message, but… there is no other
-            answer = ProtocolMessage.create_error(ErrorCode.ILLEGAL_STATE_GAME_ALREADY_STARTED)
+            answer = ProtocolConstantMessages.error(ErrorCode.ILLEGAL_STATE_GAME_ALREADY_STARTED)
+
+        # the game belongs to another worker, which takes over the connection and handles the JOIN.
+        # lobby_games is not checked, the GAME might reach the user before the change reaches this worker.
+        elif not game_id in self.games.keys() and self.cluster is not None and self.cluster.is_remote_game(game_id):
+            await self.hand_off_client(client, msg, self.cluster.config.owner_of_game(game_id))
 
         # there is no available game with the specified game_ID (error code 104)
         elif not game_id in self.games.keys():
-            answer = ProtocolMessage.create_error(ErrorCode.PARAMETER_UNKNOWN_GAME_ID)
+            answer = ProtocolConstantMessages.error(ErrorCode.PARAMETER_UNKNOWN_GAME_ID)
 
         # the message lacks the password parameter although a password is required (error code 105)
         elif self.games[game_id][0].options == GameOptions.PASSWORD and not "password" in msg.parameters:
-            answer = ProtocolMessage.create_error(ErrorCode.PARAMETER_PASSWORD_REQUIRED)
+            answer = ProtocolConstantMessages.error(ErrorCode.PARAMETER_PASSWORD_REQUIRED)
 
         # a password is required for the game, but the given password is incorrect (error code 106)
         elif self.games[game_id][0].options == GameOptions.PASSWORD and not msg.parameters["password"] == self.games[game_id][0].password:
-            answer = ProtocolMessage.create_error(ErrorCode.PARAMETER_INVALID_PASSWORD)
+            answer = ProtocolConstantMessages.error(ErrorCode.PARAMETER_INVALID_PASSWORD)
 
         # the user wants to join his own game (error code 107)
         elif self.games[game_id][0].username == client.username:
-            answer = ProtocolMessage.create_error(ErrorCode.PARAMETER_ILLEGAL_JOIN)
+            answer = ProtocolConstantMessages.error(ErrorCode.PARAMETER_ILLEGAL_JOIN)
 
         # the game has already started (error code 8)
         elif not self.games[game_id][0].state == GameState.IN_LOBBY:
-            answer = ProtocolMessage.create_error(ErrorCode.ILLEGAL_STATE_GAME_ALREADY_STARTED)
+            answer = ProtocolConstantMessages.error(ErrorCode.ILLEGAL_STATE_GAME_ALREADY_STARTED)
+
+        # Everything ok, let them play at a game worker
+        elif self.game_pool is not None and self.game_pool.has_workers():
+            await self.start_game_at_worker(self.games[game_id][0], client, self.game_pool)
 
-        # Everything ok, let them play
+        # Everything ok, let them play at a backend
+        elif self.backend_pool is not None and self.backend_pool.has_backends():
+            await self.start_game_at_worker(self.games[game_id][0], client, self.backend_pool)
+
+        # Everything ok, let them play here
         else:
-            # setup a game_controller for the other one
-            game_controller1: GameController = self.games[game_id][0]
-            game_controller1.opponent_name = client.username
-            game_controller1.state = GameState.PLACE_SHIPS
+            await self.start_game(self.games[game_id][0], client)
+
+            # inform the other users the game is no longer available
+            await self.remove_lobby_game(game_id)
 
-            client1: Client = self.games[game_id][0].client
+            self.print_stats()
 
-            game_controller2: GameController = GameController.create_from_existing_for_opponent(game_controller1, client)
-            game_controller2.state = GameState.PLACE_SHIPS
+        if answer is not None:
+            await self.send(client, answer)
 
-            self.games[game_id] = (self.games[game_id][0], game_controller2)
+    async def start_game(self, game_controller1: GameController, client: Client):
+        game_id: int = game_controller1.game_id
 
-            self.user_gid[client.username] = game_id
-            # this is already done for the other user
+        # setup a game_controller for the other one
+        game_controller1.opponent_name = client.username
+        game_controller1.state = GameState.PLACE_SHIPS
 
-            self.user_game_ctrl[client.username] = game_controller2
+        client1: Client = game_controller1.client
 
-            # set client states
-            client.state = ClientConnectionState.PLAYING
-            client1.state = ClientConnectionState.PLAYING
+        game_controller2: GameController = GameController.create_from_existing_for_opponent(game_controller1, client)
+        game_controller2.state = GameState.PLACE_SHIPS
 
-            # send startgame messages
-            await self.send(client, game_controller2.to_start_game_msg())
-            await self.send(client1, game_controller1.to_start_game_msg())
+        self.games[game_id] = (game_controller1, game_controller2)
+        self.game_actors[game_id] = GameActor(self.loop, game_id, self.game_actor_over, self.game_actor_failed)
 
-            # inform the other users the game is no longer available
-            await self.send_delete_game(game_id)
+        self.user_gid[client.username] = game_id
+        # this is already done for the other user
 
-            self.print_stats()
+        self.user_game_ctrl[client.username] = game_controller2
 
-        if answer is not None:
-            await self.send(client, answer)
+        # set client states
+        self.set_client_state(client, ClientConnectionState.PLAYING)
+        self.set_client_state(client1, ClientConnectionState.PLAYING)
+
+        # send startgame messages
+        await self.send(client, game_controller2.to_start_game_msg())
+        await self.send(client1, game_controller1.to_start_game_msg())
+
+    async def start_game_at_worker(self, game_controller1: GameController, client: Client, pool):
+        # the game worker or backend (pool is the GamePool or BackendPool) gets the game's settings
+        # and both players, the lobby forgets the game
+        game_id: int = game_controller1.game_id
+        client1: Client = game_controller1.client
+        del self.games[game_id]
+        del self.user_gid[client1.username]
+        del self.user_game_ctrl[client1.username]
+
+        # the players don't get the DELETE_GAME, like in start_game
+        self.set_client_state(client, ClientConnectionState.PLAYING)
+        self.set_client_state(client1, ClientConnectionState.PLAYING)
+        await self.remove_lobby_game(game_id)
+
+        await pool.start_game(game_controller1, client)
+        self.print_stats()
 
     async def handle_place(self, client: Client, msg: ProtocolMessage):
         our_ctrl: GameController = self.user_game_ctrl[client.username]
@@ -381,14 +582,14 @@ games: {}
             our_ctrl.run(msg)
         except BattleshipError as e:
             # TODO: maybe check if it's not an internal error
-            answer: ProtocolMessage = ProtocolMessage.create_error(e.error_code)
-            await self.send(client, answer)
+            answer: ProtocolMessage = ProtocolConstantMessages.error(e.error_code)
+            await self.send(client, answer, OutboundLane.GAME)
             return
         except Exception as e:
             raise e
 
         # notify the other
-        msg_placed: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.PLACED)
+        msg_placed: ProtocolMessage = ProtocolConstantMessages.get(ProtocolMessageType.PLACED)
         await self.send(other_ctrl.client, msg_placed)
 
         # if both are on waiting, the game can start
@@ -398,13 +599,13 @@ games: {}
             waiting_ctrl: GameController
             (starting_ctrl, waiting_ctrl) = (our_ctrl, other_ctrl) if randrange(2) == 1 else (other_ctrl, our_ctrl)
 
-            youstart: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.YOUSTART)
+            youstart: ProtocolMessage = ProtocolConstantMessages.get(ProtocolMessageType.YOUSTART)
             await self.send(starting_ctrl.client, youstart)
             starting_ctrl.run(youstart)
             starting_ctrl.timeout_counter = 0
-            starting_ctrl.start_timeout(self.handle_timeout_wrapper)
+            self.start_round_timer(starting_ctrl)
 
-            youwait: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.WAIT)
+            youwait: ProtocolMessage = ProtocolConstantMessages.get(ProtocolMessageType.WAIT)
             await self.send(waiting_ctrl.client, youwait)
             waiting_ctrl.run(youwait)
 
@@ -418,8 +619,10 @@ games: {}
         await self.end_game_with_reason(our_ctrl, other_ctrl, EndGameReason.OTHER, EndGameReason.OPPONENT_ABORT)
 
     async def end_game_with_reason(self, our_ctrl: GameController, other_ctrl: GameController, our_reason: EndGameReason, other_reason: EndGameReason):
-        our_ctrl.cancel_timeout()
-        other_ctrl.cancel_timeout()
+        self.round_timers.cancel(our_ctrl)
+        self.round_timers.cancel(other_ctrl)
+
+        self.game_actors.pop(our_ctrl.game_id).stop()
 
         del self.games[our_ctrl.game_id]
         del self.user_game_ctrl[our_ctrl.username]
@@ -429,14 +632,20 @@ games: {}
 
         # if this was called from logout, the user no longer exists
         if our_ctrl.username in self.users:
-            self.users[our_ctrl.username].state = ClientConnectionState.GAME_SELECTION
+            self.set_client_state(self.users[our_ctrl.username], ClientConnectionState.GAME_SELECTION)
 
         # if this was called from logout, the user no longer exists
         if other_ctrl.username in self.users:
-            self.users[other_ctrl.username].state = ClientConnectionState.GAME_SELECTION
+            self.set_client_state(self.users[other_ctrl.username], ClientConnectionState.GAME_SELECTION)
+
+        await self.send(other_ctrl.client, ProtocolConstantMessages.endgame(other_reason))
+        await self.send(our_ctrl.client, ProtocolConstantMessages.endgame(our_reason))
 
-        await self.send(other_ctrl.client, ProtocolMessage.create_single(ProtocolMessageType.ENDGAME, {"reason": other_reason}))
-        await self.send(our_ctrl.client, ProtocolMessage.create_single(ProtocolMessageType.ENDGAME, {"reason": our_reason}))
+        # the players continue in the lobby
+        if self.game_worker is not None:
+            await self.game_worker.return_clients([our_ctrl.client, other_ctrl.client], our_ctrl.game_id)
+        if self.router_link is not None:
+            self.router_link.game_over([our_ctrl.client, other_ctrl.client], our_ctrl.game_id)
 
         self.print_stats()
 
@@ -447,14 +656,14 @@ games: {}
         try:
             positions: Positions = our_ctrl.run(msg)
         except BattleshipError as e:
-            answer: ProtocolMessage = ProtocolMessage.create_error(e.error_code)
-            await self.send(client, answer)
+            answer: ProtocolMessage = ProtocolConstantMessages.error(e.error_code)
+            await self.send(client, answer, OutboundLane.GAME)
             return
         except Exception as e:
             raise e
 
         our_ctrl.timeout_counter = 0
-        our_ctrl.cancel_timeout()
+        self.round_timers.cancel(our_ctrl)
 
         # notify
         params = {}
@@ -467,60 +676,87 @@ games: {}
         our_ctrl.run(msg_moved)
         other_ctrl.run(msg_moved)
 
-        other_ctrl.start_timeout(self.handle_timeout_wrapper)
+        self.start_round_timer(other_ctrl)
 
     async def handle_shoot(self, client: Client, msg: ProtocolMessage):
         our_ctrl: GameController = self.user_game_ctrl[client.username]
         other_ctrl: GameController = self.user_game_ctrl[our_ctrl.opponent_name]
 
+        position: Position = msg.parameters["position"]
         try:
-            hit: bool = other_ctrl.run(msg)
+            # the shot and the HIT or FAIL on both controllers
+            hit, sunk, game_over = GameController.resolve_turn(our_ctrl, other_ctrl, msg.parameters["turn_counter"], position)
         except BattleshipError as e:
-            answer = ProtocolMessage.create_error(e.error_code)
-            await self.send(client, answer)
+            answer = ProtocolConstantMessages.error(e.error_code)
+            await self.send(client, answer, OutboundLane.GAME)
             return
         except Exception as e:
             raise e
 
         our_ctrl.timeout_counter = 0
-        our_ctrl.cancel_timeout()
+        self.round_timers.cancel(our_ctrl)
 
         if hit:
-            sunk: bool = other_ctrl.ship_sunk_at_pos(msg.parameters["position"].horizontal, msg.parameters["position"].vertical)
-            msg_hit: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.HIT, {"sunk": sunk, "position": msg.parameters["position"]})
+            msg_hit: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.HIT, {"sunk": sunk, "position": position})
 
             await self.send(other_ctrl.client, msg_hit)
             await self.send(our_ctrl.client, msg_hit)
-            our_ctrl.run(msg_hit)
-            other_ctrl.run(msg_hit)
 
-            our_ctrl.start_timeout(self.handle_timeout_wrapper)
+            self.start_round_timer(our_ctrl)
 
-            if other_ctrl.all_ships_sunk():
+            if game_over:
                 await self.end_game_with_reason(our_ctrl, other_ctrl, EndGameReason.YOU_WON, EndGameReason.OPPONENT_WON)
 
         else:
-            msg_fail: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.FAIL, {"position": msg.parameters["position"]})
+            msg_fail: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.FAIL, {"position": position})
 
             await self.send(other_ctrl.client, msg_fail)
             await self.send(our_ctrl.client, msg_fail)
-            our_ctrl.run(msg_fail)
-            other_ctrl.run(msg_fail)
 
-            other_ctrl.start_timeout(self.handle_timeout_wrapper)
+            self.start_round_timer(other_ctrl)
 
-    def handle_timeout_wrapper(self, client: Client):
-        self.loop.create_task(self.handle_timeout(client))
+    def game_actor_over(self, game_actor: GameActor):
+        self.game_cpu_time += game_actor.cpu_time
+        self.num_game_events += game_actor.num_events
+        print("  Game {} handled {} events in {:.2f} ms CPU time".format(game_actor.game_id, game_actor.num_events, 1e3 * game_actor.cpu_time))
 
-    async def handle_timeout(self, client: Client):
-        if not client.username in self.user_game_ctrl:
-            # This happened once when a timeout came almost exactly when the game ended
+    async def game_actor_failed(self, game_actor: GameActor):
+        # a handler of the game raised, the players get an ENDGAME like for an ABORT
+        if game_actor.is_over:
             return
-
-        our_ctrl: GameController = self.user_game_ctrl[client.username]
-
-        if not our_ctrl.opponent_name in self.user_game_ctrl:
-            # This happened once when a timeout came almost exactly when the game ended
+        our_ctrl, other_ctrl = self.games[game_actor.game_id]
+        try:
+            await self.end_game_with_reason(our_ctrl, other_ctrl, EndGameReason.OTHER, EndGameReason.OTHER)
+        except Exception:
+            logging.exception("Error while ending game {}, disconnecting the players".format(game_actor.game_id))
+            # forget whatever end_game_with_reason did not, then the players are removed like without a game
+            self.game_actors.pop(game_actor.game_id, None)
+            game_actor.stop()
+            self.games.pop(game_actor.game_id, None)
+            for game_ctrl in [our_ctrl, other_ctrl]:
+                self.round_timers.cancel(game_ctrl)
+                self.user_game_ctrl.pop(game_ctrl.username, None)
+                self.user_gid.pop(game_ctrl.username, None)
+                if isinstance(game_ctrl.client, Client):
+                    game_ctrl.client.close()
+
+    def start_round_timer(self, game_ctrl: GameController):
+        self.game_actors[game_ctrl.game_id].round += 1
+        self.round_timers.arm(game_ctrl, game_ctrl.round_time)
+
+    def handle_timeouts(self, game_ctrls: List[GameController]):
+        # all round timers that expired in one tick of the timer wheel
+        self.loop.create_task(self.post_timeouts(game_ctrls))
+
+    async def post_timeouts(self, game_ctrls: List[GameController]):
+        for game_ctrl in game_ctrls:
+            game_actor: Optional[GameActor] = self.game_actors.get(game_ctrl.game_id)
+            if game_actor is not None:
+                await game_actor.post(self.handle_timeout, game_ctrl, game_actor.round)
+
+    async def handle_timeout(self, our_ctrl: GameController, timer_round: int):
+        if not timer_round == self.game_actors[our_ctrl.game_id].round:
+            # the turn ended before its timeout was handled
             return
 
         other_ctrl: GameController = self.user_game_ctrl[our_ctrl.opponent_name]
@@ -532,24 +768,30 @@ games: {}
             await self.end_game_with_reason(our_ctrl, other_ctrl, EndGameReason.OPPONENT_WON, EndGameReason.OPPONENT_TIMEOUT)
             return
 
-        msg_timeout: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.TIMEOUT)
+        msg_timeout: ProtocolMessage = ProtocolConstantMessages.get(ProtocolMessageType.TIMEOUT)
 
         await self.send(our_ctrl.client, msg_timeout)
         await self.send(other_ctrl.client, msg_timeout)
         our_ctrl.run(msg_timeout)
         other_ctrl.run(msg_timeout)
 
-        other_ctrl.start_timeout(self.handle_timeout_wrapper)
+        self.start_round_timer(other_ctrl)
 
     async def send_games_to_user(self, client: Client):
-        # TODO: the type annotation Any can be more exact
-        repeating_parameters: List[Any] = []
-        for game_id, (game_controller1, game_controller2) in self.games.items():
-            if game_controller1.state == GameState.IN_LOBBY:
-                parameters = {"game_id": game_id, "username": game_controller1.username, "board_size": game_controller1.length,
-                              "num_ships": NumShips(game_controller1.ships), "round_time": game_controller1.round_time,
-                              "options": game_controller1.options}
-                repeating_parameters.append(parameters)
-
-        msg: ProtocolMessage = ProtocolMessage.create_repeating(ProtocolMessageType.GAMES, repeating_parameters)
-        await self.send_repeating(client, msg)
+        # the GAMES message(s) are only encoded again if the lobby changed since the last time
+        print("> [{}] GAMES: {} games (lobby version {})".format(client.id, len(self.lobby_games), self.lobby_version))
+        await self.send_raw(client, self.games_snapshot())
+
+    async def send_lobby_changes_to_user(self, client: Client, lobby_version: int):
+        # the client already knows the lobby at lobby_version, send only what changed since then,
+        # unless the changes are not known anymore or the full list is shorter
+        changes: Optional[List[bytes]] = self.lobby_changes_since(lobby_version)
+        version_msg: ProtocolMessage = ProtocolMessage.create_single(ProtocolMessageType.LOBBY_VERSION, {"lobby_version": self.lobby_version})
+        if changes is None or len(changes) > len(self.lobby_games):
+            print("> [{}] GAMES: {} games (lobby version {}, client has {})".format(client.id, len(self.lobby_games), self.lobby_version, lobby_version))
+            changes = [self.games_snapshot()]
+        else:
+            print("> [{}] {} lobby changes since lobby version {}".format(client.id, len(changes), lobby_version))
+        print("> [{}] {}".format(client.id, version_msg))
+        changes.append(version_msg.to_bytes())
+        await self.send_raw(client, b''.join(changes))
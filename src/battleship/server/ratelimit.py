@@ -0,0 +1,122 @@
+"""
+Token buckets per client and message class, a middleware of the lobby controller's dispatcher.
+
+Every client has a bucket per message class (chat, lobby, game), which fills
+up with the configured rate up to its burst size, and every message takes a
+token. A message without a token waits until there is one, unless that takes
+longer than the class' maximum delay: then it's answered with the error
+ILLEGAL_STATE_TOO_MANY_MESSAGES, which is not in the RFC. As the
+messages of one client are handled one after the other, its connection isn't
+read while it waits. Clients with too many rejected messages are disconnected.
+
+Only clients connected to this process are limited: the messages another
+process forwards (see gamepool.py and backends.py) were limited there.
+"""
+import time
+import asyncio
+import weakref
+from collections import defaultdict
+from typing import DefaultDict, Dict
+from .client import Client, answer_lane
+from .dispatch import Route, Handler
+from common.constants import ErrorCode, MessageClass, ServerConfig
+from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolConstantMessages
+
+MESSAGE_CLASSES: Dict[ProtocolMessageType, MessageClass] = {
+    ProtocolMessageType.CHAT_SEND: MessageClass.CHAT,
+    ProtocolMessageType.PLACE: MessageClass.GAME,
+    ProtocolMessageType.ABORT: MessageClass.GAME,
+    ProtocolMessageType.MOVE: MessageClass.GAME,
+    ProtocolMessageType.SHOOT: MessageClass.GAME,
+    # everything else is MessageClass.LOBBY
+}
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, burst: int) -> None:
+        # tokens per second, and at most this many
+        self.rate: float = rate
+        self.burst: int = burst
+        # negative while messages wait for tokens
+        self.tokens: float = burst
+        self.last_time: float = time.monotonic()
+
+    def take(self, max_delay: float) -> float:
+        """
+        Takes a token and returns how many seconds to wait for it, or -1 if that is longer than max_delay.
+        """
+        now: float = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+        delay: float = max(0.0, (1 - self.tokens) / self.rate)
+        if delay > max_delay:
+            return -1
+        self.tokens -= 1
+        return delay
+
+
+class ClientLimits:
+
+    def __init__(self) -> None:
+        self.buckets: Dict[MessageClass, TokenBucket] = {
+            msg_class: TokenBucket(rate, burst) for msg_class, (rate, burst) in ServerConfig.RATE_LIMITS.items()}
+        # rejected messages in the current window of ServerConfig.RATE_LIMIT_WINDOW seconds
+        self.num_rejected: int = 0
+        self.window_start: float = time.monotonic()
+
+    def rejected(self) -> int:
+        now: float = time.monotonic()
+        if now - self.window_start > ServerConfig.RATE_LIMIT_WINDOW:
+            self.num_rejected = 0
+            self.window_start = now
+        self.num_rejected += 1
+        return self.num_rejected
+
+
+class RateLimiter:
+    """
+    The middleware, with counters for the monitoring.
+    """
+
+    def __init__(self) -> None:
+        # the limits of the connected clients, they go away with them
+        self.clients: "weakref.WeakKeyDictionary[Client, ClientLimits]" = weakref.WeakKeyDictionary()
+        self.num_delayed: DefaultDict[MessageClass, int] = defaultdict(int)
+        self.num_rejected: DefaultDict[MessageClass, int] = defaultdict(int)
+        self.num_disconnected: int = 0
+
+    async def __call__(self, route: Route, client, msg: ProtocolMessage, call_next: Handler) -> None:
+        if not isinstance(client, Client):
+            await call_next(client, msg)
+            return
+        if client.is_closing:
+            # the rest of what a disconnected client sent
+            return
+
+        limits: ClientLimits = self.clients.get(client)
+        if limits is None:
+            limits = self.clients[client] = ClientLimits()
+        msg_class: MessageClass = MESSAGE_CLASSES.get(msg.type, MessageClass.LOBBY)
+        delay: float = limits.buckets[msg_class].take(ServerConfig.RATE_LIMIT_MAX_DELAYS[msg_class])
+
+        if delay < 0:
+            self.num_rejected[msg_class] += 1
+            if limits.rejected() >= ServerConfig.RATE_LIMIT_MAX_REJECTED:
+                print("  [{}] Too many messages, disconnecting".format(client.id))
+                self.num_disconnected += 1
+                client.close()
+            else:
+                await client.send(ProtocolConstantMessages.error(ErrorCode.ILLEGAL_STATE_TOO_MANY_MESSAGES), answer_lane(msg.type))
+            return
+
+        if delay > 0:
+            self.num_delayed[msg_class] += 1
+            await asyncio.sleep(delay)
+        await call_next(client, msg)
+
+    def stats(self) -> str:
+        return "rate limits: {} delayed, {} rejected, {} clients disconnected".format(
+            ", ".join("{} {}".format(self.num_delayed[msg_class], msg_class.name.lower()) for msg_class in MessageClass),
+            ", ".join("{} {}".format(self.num_rejected[msg_class], msg_class.name.lower()) for msg_class in MessageClass),
+            self.num_disconnected)
@@ -0,0 +1,76 @@
+"""
+A hashed timer wheel for the round timers of the games.
+
+Every turn arms the round timer of the player whose turn it is and almost every
+turn ends before it expires. With loop.call_later, each of these timers is a
+handle in the event loop's heap, and cancelled handles stay there until they
+are due. The wheel instead keeps the timers in slots of one tick each: arming,
+cancelling and rearming only touch a dict, and a single call_later per tick
+fires all timers that expired in it together.
+"""
+import math
+from typing import Any, Callable, Dict, List
+
+
+class TimerWheel:
+    """
+    Timers for hashable keys (e.g. the GameController of the player whose turn it is),
+    with a resolution of one tick. A timer never fires early, but up to one tick late.
+    The wheel only ticks while timers are armed.
+    """
+
+    def __init__(self, loop, callback: Callable[[List[Any]], None], tick: float = 1.0, num_slots: int = 64) -> None:
+        self.loop = loop
+        # gets the keys of all timers that expired in a tick
+        self.callback: Callable[[List[Any]], None] = callback
+        # seconds per tick
+        self.tick_length: float = tick
+        # slots: for every tick modulo num_slots, key -> number of further turns of the wheel before it expires
+        self.slots: List[Dict[Any, int]] = [{} for _ in range(num_slots)]
+        # timers: key -> slot index, for all armed timers
+        self.timers: Dict[Any, int] = {}
+        # number of ticks so far
+        self.current_tick: int = 0
+        self.tick_handle = None
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def arm(self, key: Any, delay: float) -> None:
+        # replaces the timer of key, if there is one
+        self.cancel(key)
+        # the next tick comes within one tick_length, so this is not before delay
+        ticks: int = max(1, math.ceil(delay / self.tick_length)) + 1
+        slot_index: int = (self.current_tick + ticks) % len(self.slots)
+        self.slots[slot_index][key] = (ticks - 1) // len(self.slots)
+        self.timers[key] = slot_index
+        if self.tick_handle is None:
+            self.tick_handle = self.loop.call_later(self.tick_length, self.tick)
+
+    def cancel(self, key: Any) -> None:
+        slot_index = self.timers.pop(key, None)
+        if slot_index is not None:
+            del self.slots[slot_index][key]
+
+    def tick(self) -> None:
+        self.current_tick += 1
+        slot: Dict[Any, int] = self.slots[self.current_tick % len(self.slots)]
+        expired: List[Any] = []
+        for key, turns in list(slot.items()):
+            if turns == 0:
+                expired.append(key)
+                del slot[key]
+                del self.timers[key]
+            else:
+                slot[key] = turns - 1
+
+        self.tick_handle = None
+        if len(self.timers) > 0:
+            self.tick_handle = self.loop.call_later(self.tick_length, self.tick)
+        if len(expired) > 0:
+            self.callback(expired)
+
+    def close(self) -> None:
+        if self.tick_handle is not None:
+            self.tick_handle.cancel()
+            self.tick_handle = None
@@ -0,0 +1,16 @@
+# the modules import each other from src/battleship, like when running server.py there
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "battleship"))
+
+import pytest
+from common.eventloop import create_event_loop
+
+
+@pytest.fixture
+def loop():
+    # the event loop of a test, run coroutines with loop.run_until_complete (there is no asyncio.run in Python 3.6)
+    loop = create_event_loop()
+    yield loop
+    loop.close()
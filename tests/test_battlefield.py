@@ -0,0 +1,272 @@
+"""
+Both Battlefield implementations must behave like the original Battlefield with its matrix
+fields, quirks included: placing and moving only check the surroundings of a ship's first
+position, so ships can overlap and stick out of the board on the right and at the bottom.
+
+The replays play seeded random games through the GameController. Their digests were taken
+with the original Battlefield (and, for the shots, with the original SHOOT handling of the
+server: run with the SHOOT, ship_sunk_at_pos, all_ships_sunk and run with the HIT or FAIL).
+"""
+import random
+import hashlib
+import pytest
+from common.GameController import GameController, BATTLEFIELD_CLASSES
+from common.battlefield.BitBattlefield import BitBattlefield
+from common.errorHandler.BattleshipError import BattleshipError
+from common.constants import Orientation, Direction, ErrorCode
+from common.protocol import Position
+from common.states import GameState
+
+REPLAY_GAMES = 300
+# sha256 of the answers of replay_game for the seeds 0 to REPLAY_GAMES - 1 with the original Battlefield
+REPLAY_DIGEST = "399fea8d0d95d6a7ead09dc04166fd35378cdba8b6984a60d59cb0ed80e33c82"
+SHOTS_GAMES = 200
+# sha256 of the answers of replay_shots for the seeds 0 to SHOTS_GAMES - 1 with the original SHOOT handling
+SHOTS_DIGEST = "56bbd781031db53f4b878610f29f95c5722bfbcbc90db98cb2a2d5701b99039d"
+
+
+@pytest.fixture(params=sorted(BATTLEFIELD_CLASSES))
+def battlefield_class(request):
+    GameController.battlefield_class = BATTLEFIELD_CLASSES[request.param]
+    yield BATTLEFIELD_CLASSES[request.param]
+    GameController.battlefield_class = BATTLEFIELD_CLASSES["lists"]
+
+
+def _call(function, *args):
+    # the answer, or the error code like the server sends it
+    try:
+        return function(*args)
+    except BattleshipError as e:
+        return e.error_code
+
+
+def _controller(length, ships_table, placements=()):
+    ctrl = GameController(0, None, None)
+    ctrl.create_battlefield(length, ships_table)
+    for ship_id, (x_pos, y_pos, orientation) in enumerate(placements):
+        assert ctrl.place_ship(ship_id, x_pos, y_pos, orientation)
+    return ctrl
+
+
+def _start(ctrl, state=GameState.YOUR_TURN):
+    assert ctrl.start_game()
+    ctrl.state = state
+    return ctrl
+
+
+def _digest(answers):
+    return hashlib.sha256(repr(answers).encode()).hexdigest()
+
+
+def replay_game(seed):
+    rnd = random.Random(seed)
+    length = rnd.randint(10, 26)
+    ctrl = GameController(0, None, None)
+    created = _call(ctrl.create_battlefield, length, [rnd.randint(0, 2) for _ in range(5)])
+    if isinstance(created, ErrorCode):
+        return [created]
+    battlefield = ctrl._battlefield
+    num_ships = battlefield.count_ships()
+    answers = []
+    for ship_id in range(num_ships):
+        # random positions, also off the board, until one is taken
+        for _ in range(20):
+            answers.append(_call(ctrl.place_ship, ship_id, rnd.randint(-1, length), rnd.randint(-1, length), rnd.choice([0, 1])))
+            if answers[-1] is True:
+                break
+    answers.append(ctrl.start_game())
+    ctrl.state = GameState.YOUR_TURN
+    for _ in range(300):
+        action = rnd.random()
+        x_pos, y_pos = rnd.randint(-1, length), rnd.randint(-1, length)
+        if action < 0.4:
+            answers.append(_call(ctrl.strike, x_pos, y_pos))
+            if answers[-1] is True:
+                answers.append((ctrl.ship_sunk_at_pos(x_pos, y_pos), ctrl.all_ships_sunk()))
+        elif action < 0.7:
+            ship_id = rnd.randint(-1, num_ships)
+            answers.append(_call(ctrl.move, ship_id, rnd.choice(list(Direction))))
+            if answers[-1] is True:
+                answers.append(ctrl.get_moved_ship_hit_positions(ship_id))
+        elif action < 0.9:
+            answers.append(_call(ctrl.shoot, x_pos, y_pos))
+            if rnd.random() < 0.5:
+                battlefield.shot_missed(min(max(x_pos, 0), length - 1), min(max(y_pos, 0), length - 1))
+        else:
+            answers.append(battlefield.get_ship_id_from_location(x_pos, y_pos))
+    answers.append([(ship.get_ship_coordinates(), ship.is_hit(), ship.is_sunk()) for ship in battlefield._ships])
+    answers.append(battlefield.ships_not_placed)
+    return answers
+
+
+def replay_shots(seed):
+    rnd = random.Random(seed)
+    length = rnd.randint(10, 26)
+    ctrls = [_start(_controller(length, [0, 1, 1, 1, 1], [(0, 0, Orientation.EAST), (0, 3, Orientation.EAST),
+                                                           (0, 6, Orientation.EAST), (6, 6, Orientation.EAST)]))
+             for _ in range(2)]
+    ctrls[1].state = GameState.OPPONENTS_TURN
+    answers = []
+    for _ in range(600):
+        shooter, target = ctrls if ctrls[0].state == GameState.YOUR_TURN else reversed(ctrls)
+        if rnd.random() < 0.1:
+            # out of turn
+            shooter, target = target, shooter
+        turn_counter = shooter.turn_counter if rnd.random() < 0.95 else rnd.randint(0, 255)
+        result = _call(GameController.resolve_turn, shooter, target, turn_counter, Position(rnd.randint(0, length), rnd.randint(0, length)))
+        answers.append((result, [(ctrl.state, ctrl.turn_counter) for ctrl in ctrls]))
+        if isinstance(result, tuple) and result[2]:
+            break
+    return answers
+
+
+def test_replay_like_the_original(battlefield_class):
+    assert _digest([replay_game(seed) for seed in range(REPLAY_GAMES)]) == REPLAY_DIGEST
+
+
+def test_shots_like_the_original(battlefield_class):
+    assert _digest([replay_shots(seed) for seed in range(SHOTS_GAMES)]) == SHOTS_DIGEST
+
+
+def test_overlapping_ships(battlefield_class):
+    # only the surroundings of (0, 2) are checked, the second cruiser crosses the first one at (3, 2)
+    ctrl = _start(_controller(10, [0, 0, 2, 0, 0], [(3, 0, Orientation.NORTH), (0, 2, Orientation.EAST)]))
+    # the first ship in the list is at a shared cell
+    assert ctrl.get_ship_id_from_location(3, 2) == 0
+    # moving it away uncovers the other one
+    assert ctrl.move(0, Direction.EAST)
+    assert ctrl.get_ship_id_from_location(3, 2) == 1
+    assert ctrl.get_ship_id_from_location(4, 2) == 0
+    assert ctrl.strike(3, 2)
+    assert ctrl._battlefield.get_ship(1).is_hit()
+    assert not ctrl._battlefield.get_ship(0).is_hit()
+    assert not ctrl.ship_sunk_at_pos(3, 2)
+
+
+def test_ship_sticking_out_of_the_board(battlefield_class):
+    ctrl = _start(_controller(10, [1, 0, 0, 0, 0], [(8, 0, Orientation.EAST)]))
+    assert ctrl.get_ship_id_from_location(12, 1) == 0
+    assert _call(ctrl.get_ship_id_from_location, 13, 0) == ErrorCode.INTERN_NO_SHIP_AT_LOCATION
+    # only the first position has to stay on the board
+    assert ctrl.move(0, Direction.SOUTH)
+    assert ctrl.move(0, Direction.EAST)
+    assert ctrl.get_ship_id_from_location(13, 1) == 0
+    assert _call(ctrl.move, 0, Direction.EAST) == ErrorCode.PARAMETER_POSITION_OUT_OF_BOUNDS
+    assert _call(ctrl.strike, 10, 1) == ErrorCode.PARAMETER_POSITION_OUT_OF_BOUNDS
+    # the cells off the board can't be hit, so it never sinks
+    assert ctrl.strike(9, 1)
+    assert not ctrl.ship_sunk_at_pos(9, 1)
+    assert not ctrl.all_ships_sunk()
+    assert _call(ctrl.move, 0, Direction.WEST) == ErrorCode.PARAMETER_SHIP_IMMOVABLE
+
+
+def test_placing_a_ship_again(battlefield_class):
+    ctrl = _controller(10, [0, 0, 0, 0, 2], [(0, 0, Orientation.EAST)])
+    assert ctrl.place_ship(0, 5, 5, Orientation.EAST)
+    assert _call(ctrl.get_ship_id_from_location, 0, 0) == ErrorCode.INTERN_NO_SHIP_AT_LOCATION
+    assert ctrl.get_ship_id_from_location(6, 5) == 0
+    # the cells it left are free again
+    assert ctrl.place_ship(1, 1, 1, Orientation.EAST)
+    assert _call(ctrl.place_ship, 1, 5, 6, Orientation.EAST) == ErrorCode.PARAMETER_OVERLAPPING_SHIPS
+    # every placement counts, also the second one of the same ship
+    assert ctrl.ships_not_placed == [0, 0, 0, 0, -1]
+
+
+def test_moving_onto_missed_strikes(battlefield_class):
+    ctrl = _start(_controller(10, [0, 0, 0, 0, 1], [(0, 0, Orientation.EAST)]))
+    assert not ctrl.strike(2, 0)
+    assert not ctrl.strike(3, 0)
+    assert ctrl.move(0, Direction.EAST)
+    assert ctrl.get_moved_ship_hit_positions(0) == [(2, 0)]
+    assert ctrl.move(0, Direction.EAST)
+    assert ctrl.get_moved_ship_hit_positions(0) == [(2, 0), (3, 0)]
+    # a missed strike doesn't block the cell, the ship is there now
+    assert ctrl.strike(2, 0)
+    assert _call(ctrl.strike, 2, 0) == ErrorCode.PARAMETER_ALREADY_HIT_POSITION
+    assert ctrl.get_moved_ship_hit_positions(0) == [(3, 0)]
+    assert ctrl.strike(3, 0)
+    assert ctrl.ship_sunk_at_pos(3, 0)
+    assert ctrl.all_ships_sunk()
+
+
+def test_shots_at_the_enemy(battlefield_class):
+    ctrl = _start(_controller(10, [0, 0, 0, 0, 1], [(0, 0, Orientation.EAST)]))
+    assert ctrl.shoot(4, 4)
+    assert _call(ctrl.shoot, 4, 4) == ErrorCode.PARAMETER_ALREADY_HIT_POSITION
+    # the FAIL of the shot frees the cell again
+    ctrl._battlefield.shot_missed(4, 4)
+    assert ctrl.shoot(4, 4)
+
+
+def test_resolve_turn(battlefield_class):
+    shooter = _start(_controller(10, [0, 0, 0, 0, 1], [(0, 0, Orientation.EAST)]))
+    target = _start(_controller(10, [0, 0, 0, 0, 1], [(0, 0, Orientation.EAST)]), GameState.OPPONENTS_TURN)
+    assert _call(target.resolve_shot, 0, Position(0, 0)) == (True, False, False)
+    assert _call(GameController.resolve_turn, target, shooter, 0, Position(0, 1)) == ErrorCode.ILLEGAL_STATE_NOT_YOUR_TURN
+    assert _call(GameController.resolve_turn, shooter, target, 5, Position(0, 1)) == ErrorCode.PARAMETER_INVALID_TURN_COUNT
+    assert _call(GameController.resolve_turn, shooter, target, 0, Position(0, 0)) == ErrorCode.PARAMETER_ALREADY_HIT_POSITION
+    # a miss passes the turn
+    assert GameController.resolve_turn(shooter, target, 0, Position(5, 5)) == (False, False, False)
+    assert (shooter.state, target.state) == (GameState.OPPONENTS_TURN, GameState.YOUR_TURN)
+    assert GameController.resolve_turn(target, shooter, 1, Position(5, 5)) == (False, False, False)
+    # the last cell of the only ship ends the game, position is (vertical, horizontal)
+    assert GameController.resolve_turn(shooter, target, 2, Position(0, 1)) == (True, True, True)
+    assert (shooter.turn_counter, target.turn_counter) == (3, 3)
+    assert (shooter.state, target.state) == (GameState.YOUR_TURN, GameState.OPPONENTS_TURN)
+
+
+def test_resolve_turn_hits_and_errors(battlefield_class):
+    placements = [(0, 0, Orientation.EAST), (0, 5, Orientation.EAST)]
+    shooter = _start(_controller(10, [0, 0, 0, 0, 2], placements))
+    target = _start(_controller(10, [0, 0, 0, 0, 2], placements), GameState.OPPONENTS_TURN)
+
+    def states():
+        return [(ctrl.state, ctrl.turn_counter) for ctrl in (shooter, target)]
+
+    # a hit keeps the turn, but counts as one
+    assert GameController.resolve_turn(shooter, target, 0, Position(0, 0)) == (True, False, False)
+    assert states() == [(GameState.YOUR_TURN, 1), (GameState.OPPONENTS_TURN, 1)]
+    # sinking a ship with another one left is not the end of the game
+    assert GameController.resolve_turn(shooter, target, 1, Position(0, 1)) == (True, True, False)
+    assert states() == [(GameState.YOUR_TURN, 2), (GameState.OPPONENTS_TURN, 2)]
+
+    # an error changes neither of the controllers
+    for turn_counter, position, error_code in [
+            (2, Position(0, 0), ErrorCode.PARAMETER_ALREADY_HIT_POSITION),
+            (2, Position(10, 0), ErrorCode.PARAMETER_POSITION_OUT_OF_BOUNDS),
+            (2, Position(0, 10), ErrorCode.PARAMETER_POSITION_OUT_OF_BOUNDS),
+            (1, Position(5, 5), ErrorCode.PARAMETER_INVALID_TURN_COUNT)]:
+        assert _call(GameController.resolve_turn, shooter, target, turn_counter, position) == error_code
+        assert states() == [(GameState.YOUR_TURN, 2), (GameState.OPPONENTS_TURN, 2)]
+
+    # the second ship, (vertical, horizontal) again
+    assert GameController.resolve_turn(shooter, target, 2, Position(5, 0)) == (True, False, False)
+    assert GameController.resolve_turn(shooter, target, 3, Position(5, 1)) == (True, True, True)
+    assert states() == [(GameState.YOUR_TURN, 4), (GameState.OPPONENTS_TURN, 4)]
+
+
+def test_bitboard_occupancy():
+    GameController.battlefield_class = BitBattlefield
+    try:
+        ctrl = _start(_controller(10, [0, 0, 2, 0, 1], [(3, 0, Orientation.NORTH), (0, 2, Orientation.EAST), (6, 6, Orientation.EAST)]))
+    finally:
+        GameController.battlefield_class = BATTLEFIELD_CLASSES["lists"]
+    battlefield = ctrl._battlefield
+
+    def union():
+        occupied = 0
+        for footprint in battlefield._footprints:
+            occupied |= footprint
+        return occupied
+
+    assert battlefield._ships_overlap
+    # kept up to date when moving, also at the cell the two cruisers share
+    for ship_id, direction in [(0, Direction.EAST), (2, Direction.SOUTH), (0, Direction.WEST), (1, Direction.SOUTH), (0, Direction.EAST)]:
+        assert ctrl.move(ship_id, direction)
+        assert battlefield._occupied == union()
+    # the cells of the other ships are in the way, the moving ship's own are not
+    assert not battlefield.no_ship_at_place_but(1, 3, 0)
+    assert battlefield.no_ship_at_place_but(4, 1, 0)
+    # the Battlefield's matrix fields are not even created
+    assert not hasattr(battlefield, "_my_battlefield")
+    assert not hasattr(battlefield, "_enemy_battlefield")
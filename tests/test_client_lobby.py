@@ -0,0 +1,74 @@
+"""
+The synchronization of the game list of ClientLobbyController in client/lobby.py: a server without
+the extension of the RFC only ever gets the plain GET_GAMES.
+"""
+import asyncio
+from client.lobby import ClientLobbyController
+from common.constants import Constants
+from common.protocol import ProtocolMessage, ProtocolMessageType, NumShips
+
+
+def _games_msg(*game_ids):
+    return ProtocolMessage.create_repeating(ProtocolMessageType.GAMES, [{
+        "game_id": game_id, "username": "user{}".format(game_id), "board_size": 10,
+        "num_ships": NumShips([1, 2, 3, 4, 5]), "round_time": 25, "options": 0} for game_id in game_ids])
+
+
+class FakeServer:
+    """
+    Stands in for the BattleshipClient, answers GET_GAMES with the games, and with a LOBBY_VERSION
+    if the server knows lobby versions.
+    """
+
+    def __init__(self, knows_lobby_versions: bool) -> None:
+        self.knows_lobby_versions = knows_lobby_versions
+        self.lobby_controller = None
+        self.sent = []
+        self.answer_received = asyncio.Event()
+        self.last_msg_was_error = False
+
+    async def send(self, msg: ProtocolMessage):
+        self.sent.append(msg)
+        await self.lobby_controller.handle_games(_games_msg(1, 2))
+        if self.knows_lobby_versions and "lobby_version" in msg.parameters:
+            await self.lobby_controller.handle_lobby_version(
+                ProtocolMessage.create_single(ProtocolMessageType.LOBBY_VERSION, {"lobby_version": 7}))
+
+    async def send_and_wait_for_answer(self, msg: ProtocolMessage):
+        await self.send(msg)
+
+
+def _lobby_controller(loop, server):
+    server.lobby_controller = ClientLobbyController(server, None, loop)
+    return server.lobby_controller
+
+
+def test_plain_get_games_by_default(loop):
+    server = FakeServer(knows_lobby_versions=False)
+    lobby_controller = _lobby_controller(loop, server)
+    loop.run_until_complete(lobby_controller.send_get_games())
+    loop.run_until_complete(lobby_controller.send_get_games())
+    assert [msg.to_bytes() for msg in server.sent] == [ProtocolMessage.create_single(ProtocolMessageType.GET_GAMES).to_bytes()] * 2
+    assert sorted(lobby_controller.games) == [1, 2]
+    assert lobby_controller.lobby_version is None
+
+
+def test_lobby_version_once_the_server_sent_one(loop):
+    server = FakeServer(knows_lobby_versions=True)
+    lobby_controller = _lobby_controller(loop, server)
+    loop.run_until_complete(lobby_controller.send_get_games())
+    loop.run_until_complete(lobby_controller.handle_lobby_version(
+        ProtocolMessage.create_single(ProtocolMessageType.LOBBY_VERSION, {"lobby_version": 5})))
+    loop.run_until_complete(lobby_controller.send_get_games())
+    assert [msg.parameters for msg in server.sent] == [{}, {"lobby_version": 5}]
+    assert lobby_controller.lobby_version == 7
+
+
+def test_lobby_versions_from_the_start(loop, monkeypatch):
+    monkeypatch.setattr(Constants, "LOBBY_VERSIONS", True)
+    server = FakeServer(knows_lobby_versions=True)
+    lobby_controller = _lobby_controller(loop, server)
+    loop.run_until_complete(lobby_controller.send_get_games())
+    assert [msg.parameters for msg in server.sent] == [{"lobby_version": 0}]
+    assert sorted(lobby_controller.games) == [1, 2]
+    assert lobby_controller.lobby_version == 7
@@ -0,0 +1,69 @@
+"""
+The LobbyBroker of server/cluster.py: what it does with the frames a worker sends.
+"""
+import asyncio
+import pytest
+from server.cluster import LobbyBroker, ClusterConfig
+from server.handover import write_frame, read_frame
+
+
+class FakeWriter:
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _frames(*frames):
+    writer = FakeWriter()
+    for frame in frames:
+        write_frame(writer, *frame)
+    return bytes(writer.data)
+
+
+def _handle_worker(loop, broker, *frames):
+    # the worker sends the frames and disconnects, returns what the broker sent back
+    reader = asyncio.StreamReader(loop=loop)
+    reader.feed_data(_frames(*frames))
+    reader.feed_eof()
+    writer = FakeWriter()
+    loop.run_until_complete(broker.handle_worker(reader, writer))
+    replies = asyncio.StreamReader(loop=loop)
+    replies.feed_data(bytes(writer.data))
+    replies.feed_eof()
+    received = []
+    while not replies.at_eof():
+        received.append(loop.run_until_complete(read_frame(replies)))
+    return writer, received
+
+
+def test_frames_after_hello(loop):
+    broker = LobbyBroker(loop, ClusterConfig("/nonexistent", 2))
+    writer, received = _handle_worker(loop, broker, ("hello", 1), ("login", 7, "ann"), ("lobby_change", 2, b'entry', b'msg'))
+    assert received == [("reply", 7, True), ("lobby_change", 1, 2, b'entry', b'msg')]
+    assert not writer.closed
+    # forgotten when the worker disconnects
+    assert broker.users == {}
+    assert broker.lobby_games == {}
+    assert broker.lobby_version == 2
+
+
+@pytest.mark.parametrize("frame", [("login", 7, "ann"), ("lobby_change", 2, b'entry', b'msg'), ("move_user", "ann", 0),
+                                   ("chat_all", "ann", b'msg')])
+def test_frames_before_hello(loop, frame):
+    broker = LobbyBroker(loop, ClusterConfig("/nonexistent", 2))
+    broker.workers[0] = other_worker = FakeWriter()
+    writer, received = _handle_worker(loop, broker, frame, ("hello", 1), ("login", 8, "ben"))
+    # disconnected, without touching the shared state
+    assert writer.closed
+    assert received == []
+    assert broker.users == {}
+    assert broker.lobby_games == {}
+    assert broker.lobby_version == 0
+    assert other_worker.data == b''
@@ -0,0 +1,136 @@
+"""
+The Dispatcher of server/dispatch.py: the routes, the order of the middleware and the preconditions.
+"""
+import pytest
+from server.client import OutboundLane
+from server.dispatch import Dispatcher, Requires, HandlerTimes, check_preconditions
+from common.constants import ErrorCode
+from common.protocol import ProtocolMessage, ProtocolMessageType
+from common.states import ClientConnectionState
+
+
+class FakeClient:
+
+    def __init__(self, state: ClientConnectionState) -> None:
+        self.id = 0
+        self.state = state
+        self.sent = []
+
+    async def send(self, msg, lane=None):
+        self.sent.append((msg, lane))
+
+
+class Recorder:
+    """
+    Handlers and middleware that note when they are called.
+    """
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def handler(self, name: str):
+        async def handle(client, msg):
+            self.calls.append(name)
+        return handle
+
+    def middleware(self, name: str, call_next_too: bool = True):
+        async def middleware(route, client, msg, call_next):
+            self.calls.append("{} {}".format(name, route.msg_type.name))
+            if call_next_too:
+                await call_next(client, msg)
+        return middleware
+
+
+def test_middleware_order(loop):
+    recorder = Recorder()
+    dispatcher = Dispatcher()
+    dispatcher.use(recorder.middleware("first"))
+    dispatcher.register(ProtocolMessageType.LOGIN, recorder.handler("login"), Requires.NOTHING)
+    # also runs for the routes registered before it
+    dispatcher.use(recorder.middleware("second"))
+    dispatcher.register(ProtocolMessageType.LOGOUT, recorder.handler("logout"))
+    client = FakeClient(ClientConnectionState.NOT_CONNECTED)
+
+    loop.run_until_complete(dispatcher.dispatch(client, ProtocolMessage.create_single(ProtocolMessageType.LOGIN, {"username": "ann"})))
+    loop.run_until_complete(dispatcher.dispatch(client, ProtocolMessage.create_single(ProtocolMessageType.LOGOUT)))
+    assert recorder.calls == ["first LOGIN", "second LOGIN", "login", "first LOGOUT", "second LOGOUT", "logout"]
+
+
+def test_middleware_stops_the_chain(loop):
+    recorder = Recorder()
+    dispatcher = Dispatcher()
+    dispatcher.use(recorder.middleware("filter", call_next_too=False))
+    dispatcher.use(recorder.middleware("never"))
+    dispatcher.register(ProtocolMessageType.LOGOUT, recorder.handler("logout"))
+    loop.run_until_complete(dispatcher.dispatch(FakeClient(ClientConnectionState.GAME_SELECTION), ProtocolMessage.create_single(ProtocolMessageType.LOGOUT)))
+    assert recorder.calls == ["filter LOGOUT"]
+
+
+def test_unregistered_types_are_ignored(loop):
+    recorder = Recorder()
+    dispatcher = Dispatcher()
+    dispatcher.use(recorder.middleware("first"))
+    dispatcher.register(ProtocolMessageType.LOGOUT, recorder.handler("logout"))
+    client = FakeClient(ClientConnectionState.GAME_SELECTION)
+    loop.run_until_complete(dispatcher.dispatch(client, ProtocolMessage.create_error(ErrorCode.UNKNOWN)))
+    assert recorder.calls == []
+    assert client.sent == []
+
+
+@pytest.mark.parametrize("msg_type, requires, state, error_code, lane", [
+    (ProtocolMessageType.LOGIN, Requires.NOTHING, ClientConnectionState.NOT_CONNECTED, None, None),
+    (ProtocolMessageType.JOIN, Requires.LOGGED_IN, ClientConnectionState.NOT_CONNECTED,
+     ErrorCode.ILLEGAL_STATE_NOT_LOGGED_IN, OutboundLane.LOBBY),
+    (ProtocolMessageType.JOIN, Requires.LOGGED_IN, ClientConnectionState.GAME_SELECTION, None, None),
+    (ProtocolMessageType.JOIN, Requires.LOGGED_IN, ClientConnectionState.PLAYING, None, None),
+    (ProtocolMessageType.SHOOT, Requires.PLAYING, ClientConnectionState.NOT_CONNECTED,
+     ErrorCode.ILLEGAL_STATE_NOT_LOGGED_IN, OutboundLane.GAME),
+    (ProtocolMessageType.SHOOT, Requires.PLAYING, ClientConnectionState.GAME_CREATED,
+     ErrorCode.ILLEGAL_STATE_NOT_IN_GAME, OutboundLane.GAME),
+    (ProtocolMessageType.SHOOT, Requires.PLAYING, ClientConnectionState.PLAYING, None, None),
+])
+def test_preconditions(loop, msg_type, requires, state, error_code, lane):
+    recorder = Recorder()
+    dispatcher = Dispatcher()
+    dispatcher.use(check_preconditions)
+    dispatcher.register(msg_type, recorder.handler("handler"), requires)
+    client = FakeClient(state)
+    loop.run_until_complete(dispatcher.dispatch(client, ProtocolMessage.random_from_type(msg_type)))
+    if error_code is None:
+        assert recorder.calls == ["handler"]
+        assert client.sent == []
+    else:
+        # answered in the lane of the request
+        assert recorder.calls == []
+        assert [(msg.type, msg.parameters["error_code"], msg_lane) for msg, msg_lane in client.sent] == [(ProtocolMessageType.ERROR, error_code, lane)]
+
+
+def test_missing_parameter(loop):
+    recorder = Recorder()
+    dispatcher = Dispatcher()
+    dispatcher.use(check_preconditions)
+    dispatcher.register(ProtocolMessageType.CHAT_SEND, recorder.handler("handler"), Requires.NOTHING)
+    msg = ProtocolMessage(ProtocolMessageType.CHAT_SEND)
+    msg.append_parameters({"text": "no recipient"})
+    client = FakeClient(ClientConnectionState.GAME_SELECTION)
+    loop.run_until_complete(dispatcher.dispatch(client, msg))
+    assert recorder.calls == []
+    assert [msg.parameters["error_code"] for msg, _ in client.sent] == [ErrorCode.SYNTAX_MISSING_OR_UNKNOWN_PARAMETER]
+
+
+def test_handler_times(loop):
+    handler_times = HandlerTimes()
+    dispatcher = Dispatcher()
+    dispatcher.use(handler_times)
+
+    async def failing(client, msg):
+        raise RuntimeError("bug in a handler")
+
+    dispatcher.register(ProtocolMessageType.LOGOUT, failing)
+    client = FakeClient(ClientConnectionState.GAME_SELECTION)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            loop.run_until_complete(dispatcher.dispatch(client, ProtocolMessage.create_single(ProtocolMessageType.LOGOUT)))
+    # counted also when the handler raises
+    assert handler_times.num_calls == {ProtocolMessageType.LOGOUT: 3}
+    assert handler_times.seconds[ProtocolMessageType.LOGOUT] >= 0
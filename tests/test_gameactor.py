@@ -0,0 +1,130 @@
+"""
+The GameActor of server/gameactor.py: the events of a game are handled one after the other,
+in the order they were posted, and not at all once the game is over.
+"""
+import asyncio
+from server.gameactor import GameActor
+from common.constants import ServerConfig
+
+
+class Game:
+    """
+    A GameActor with callbacks that record what happened, the failed_callback ends the game.
+    """
+
+    def __init__(self, loop) -> None:
+        self.handled = []
+        self.num_over = 0
+        self.failed = []
+        self.actor = GameActor(loop, 1, self.over, self.fail)
+
+    def over(self, actor) -> None:
+        self.num_over += 1
+
+    async def fail(self, actor) -> None:
+        self.failed.append(actor)
+        actor.stop()
+
+    async def event(self, name) -> None:
+        self.handled.append(("start", name))
+        # another event must not start meanwhile
+        await asyncio.sleep(0)
+        self.handled.append(("end", name))
+
+    async def raising_event(self, name) -> None:
+        self.handled.append(("start", name))
+        raise RuntimeError("bug in a handler")
+
+
+def test_mailbox_order(loop):
+    async def play():
+        game = Game(loop)
+        # posted from different tasks, e.g. both players and a round timer, the tasks start in this order
+        done = await asyncio.gather(*[loop.create_task(game.actor.post(game.event, name)) for name in range(10)])
+        await asyncio.gather(*done)
+        assert game.handled == [(step, name) for name in range(10) for step in ["start", "end"]]
+        assert game.actor.num_events == 10
+        game.actor.stop()
+        await game.actor.task
+        assert game.num_over == 1
+        assert game.failed == []
+
+    loop.run_until_complete(play())
+
+
+def test_failing_handler_ends_the_game(loop):
+    async def play():
+        game = Game(loop)
+        done = [await game.actor.post(game.event, 0), await game.actor.post(game.raising_event, 1), await game.actor.post(game.event, 2)]
+        await asyncio.wait_for(game.actor.task, 1)
+        assert game.failed == [game.actor]
+        assert game.actor.is_over
+        # the event after the failing one is not handled, but nobody waits for it forever
+        assert game.handled == [("start", 0), ("end", 0), ("start", 1)]
+        assert all(future.done() for future in done)
+        assert game.num_over == 1
+
+    loop.run_until_complete(play())
+
+
+def test_stop_from_a_handler(loop):
+    async def play():
+        game = Game(loop)
+
+        async def abort(name):
+            game.handled.append(("start", name))
+            game.actor.stop()
+
+        done = [await game.actor.post(game.event, 0), await game.actor.post(abort, 1), await game.actor.post(game.event, 2)]
+        await asyncio.wait_for(game.actor.task, 1)
+        assert game.handled == [("start", 0), ("end", 0), ("start", 1)]
+        assert all(future.done() for future in done)
+        assert game.num_over == 1
+
+    loop.run_until_complete(play())
+
+
+def test_post_after_stop(loop):
+    async def play():
+        game = Game(loop)
+        game.actor.stop()
+        done = await game.actor.post(game.event, 0)
+        assert done.done()
+        await asyncio.wait_for(game.actor.task, 1)
+        done = await game.actor.post(game.event, 1)
+        assert done.done()
+        assert game.handled == []
+        assert game.num_over == 1
+
+    loop.run_until_complete(play())
+
+
+def test_post_waits_while_the_mailbox_is_full(loop, monkeypatch):
+    monkeypatch.setattr(ServerConfig, "GAME_MAILBOX_SIZE", 1)
+
+    async def play():
+        game = Game(loop)
+        handling = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow(name):
+            handling.set()
+            await release.wait()
+
+        await game.actor.post(slow, 0)
+        await handling.wait()
+        await game.actor.post(game.event, 1)
+        # the mailbox is full, the next post waits until the game ended
+        waiting = asyncio.ensure_future(game.actor.post(game.event, 2))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+
+        game.actor.stop()
+        release.set()
+        done = await asyncio.wait_for(waiting, 1)
+        assert done.done()
+        await asyncio.wait_for(game.actor.task, 1)
+        assert game.handled == []
+        assert game.num_over == 1
+
+    loop.run_until_complete(play())
@@ -0,0 +1,161 @@
+"""
+The open games of ServerLobbyController in server/lobby.py: the cached GAMES snapshot and
+the log of the lobby changes for the delta synchronization of GET_GAMES with a lobby version.
+"""
+import pytest
+from server.client import Client
+from server.lobby import ServerLobbyController
+from common.constants import ServerConfig
+from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolMessageDecoder, NumShips
+
+LOG_LENGTH = 4
+
+
+class FakeClient(Client):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.received = bytearray()
+
+    async def send_raw(self, data, lane=None):
+        self.received += data
+
+    def messages(self):
+        return ProtocolMessageDecoder().feed(bytes(self.received))
+
+
+class FakeGameController:
+
+    def __init__(self, game_id: int, client: FakeClient) -> None:
+        self.game_id = game_id
+        self.client = client
+
+    def to_game_msg(self):
+        return ProtocolMessage.create_single(ProtocolMessageType.GAME, {
+            "game_id": self.game_id, "username": "user{}".format(self.game_id), "board_size": 10,
+            "num_ships": NumShips([1, 2, 3, 4, 5]), "round_time": 25, "options": 0})
+
+
+@pytest.fixture
+def lobby(loop, monkeypatch):
+    monkeypatch.setattr(ServerConfig, "LOBBY_CHANGE_LOG_LENGTH", LOG_LENGTH)
+    lobby = ServerLobbyController(loop)
+    lobby.run = loop.run_until_complete
+    yield lobby
+    lobby.round_timers.close()
+
+
+def _add_games(lobby, game_ids):
+    for game_id in game_ids:
+        lobby.run(lobby.add_lobby_game(FakeGameController(game_id, FakeClient())))
+
+
+def _games_in(messages):
+    return [params["game_id"] for msg in messages if msg.type == ProtocolMessageType.GAMES
+            for params in msg.repeating_parameters if "game_id" in params]
+
+
+def _answer_to_get_games(lobby, parameters):
+    client = FakeClient()
+    lobby.run(lobby.handle_get_games(client, ProtocolMessage.create_single(ProtocolMessageType.GET_GAMES, parameters)))
+    return client.messages()
+
+
+def test_snapshot(lobby):
+    empty = lobby.games_snapshot()
+    assert [(msg.type, msg.repeating_parameters) for msg in ProtocolMessageDecoder().feed(empty)] == [(ProtocolMessageType.GAMES, [{}])]
+
+    _add_games(lobby, [1, 2, 3])
+    lobby.run(lobby.remove_lobby_game(2))
+    snapshot = lobby.games_snapshot()
+    assert _games_in(ProtocolMessageDecoder().feed(snapshot)) == [1, 3]
+    # encoded once until the lobby changes
+    assert lobby.games_snapshot() is snapshot
+    _add_games(lobby, [4])
+    assert _games_in(ProtocolMessageDecoder().feed(lobby.games_snapshot())) == [1, 3, 4]
+    # removing a game that is not in the lobby (anymore) changes nothing
+    version = lobby.lobby_version
+    snapshot = lobby.games_snapshot()
+    lobby.run(lobby.remove_lobby_game(2))
+    assert lobby.lobby_version == version
+    assert lobby.games_snapshot() is snapshot
+
+
+def test_snapshot_over_64k(lobby):
+    _add_games(lobby, range(1, 4001))
+    messages = ProtocolMessageDecoder().feed(lobby.games_snapshot())
+    assert len(messages) > 1
+    assert _games_in(messages) == list(range(1, 4001))
+
+
+def test_changes_before_the_log_is_full(lobby):
+    assert lobby.lobby_changes_since(0) == []
+    _add_games(lobby, [1, 2, 3])
+    # all changes since the empty lobby, num_changes == len(lobby_changes)
+    changes = lobby.lobby_changes_since(0)
+    assert [msg.parameters["game_id"] for msg in ProtocolMessageDecoder().feed(b''.join(changes))] == [1, 2, 3]
+    assert lobby.lobby_changes_since(2) == changes[2:]
+
+
+def test_changes_at_the_end_of_the_log(lobby):
+    _add_games(lobby, [1, 2, 3])
+    lobby.run(lobby.remove_lobby_game(1))
+    lobby.run(lobby.remove_lobby_game(2))
+    lobby.run(lobby.remove_lobby_game(3))
+    assert lobby.lobby_version == 6
+    assert lobby.lobby_changes_since(6) == []
+    # the oldest change still in the log
+    changes = lobby.lobby_changes_since(6 - LOG_LENGTH)
+    assert [msg.type for msg in ProtocolMessageDecoder().feed(b''.join(changes))] == \
+        [ProtocolMessageType.GAME] + [ProtocolMessageType.DELETE_GAME] * 3
+    # not known anymore
+    assert lobby.lobby_changes_since(6 - LOG_LENGTH - 1) is None
+    assert lobby.lobby_changes_since(0) is None
+    # a version from the future, e.g. of a server that was restarted since
+    assert lobby.lobby_changes_since(7) is None
+    assert lobby.lobby_changes_since(2**32 - 1) is None
+
+
+def test_get_games_without_lobby_version(lobby):
+    # answered as in the RFC, without a LOBBY_VERSION
+    _add_games(lobby, [1, 2])
+    messages = _answer_to_get_games(lobby, {})
+    assert [msg.type for msg in messages] == [ProtocolMessageType.GAMES]
+    assert _games_in(messages) == [1, 2]
+
+
+def test_login_and_get_games_as_in_the_rfc(lobby):
+    # a client that does not know lobby versions never gets a LOBBY_VERSION
+    _add_games(lobby, [1, 2])
+    client = FakeClient()
+    lobby.run(lobby.handle_login(client, ProtocolMessage.create_single(ProtocolMessageType.LOGIN, {"username": "alice"})))
+    lobby.run(lobby.handle_get_games(client, ProtocolMessage.create_single(ProtocolMessageType.GET_GAMES)))
+    messages = client.messages()
+    assert [msg.type for msg in messages] == [ProtocolMessageType.GAMES, ProtocolMessageType.GAMES]
+    assert bytes(client.received) == lobby.games_snapshot() * 2
+
+
+def test_get_games_with_lobby_version(lobby):
+    _add_games(lobby, [1, 2, 3, 4])
+    lobby.run(lobby.remove_lobby_game(4))
+
+    # the changes, then the version
+    messages = _answer_to_get_games(lobby, {"lobby_version": 4})
+    assert [msg.type for msg in messages] == [ProtocolMessageType.DELETE_GAME, ProtocolMessageType.LOBBY_VERSION]
+    assert messages[-1].parameters["lobby_version"] == 5
+
+    # up to date
+    messages = _answer_to_get_games(lobby, {"lobby_version": 5})
+    assert [msg.type for msg in messages] == [ProtocolMessageType.LOBBY_VERSION]
+
+    # as many changes as games
+    messages = _answer_to_get_games(lobby, {"lobby_version": 2})
+    assert [msg.type for msg in messages] == [ProtocolMessageType.GAME, ProtocolMessageType.GAME, ProtocolMessageType.DELETE_GAME,
+                                              ProtocolMessageType.LOBBY_VERSION]
+
+    # more changes than games, too old, or from the future: the snapshot
+    for lobby_version in [1, 0, 6]:
+        messages = _answer_to_get_games(lobby, {"lobby_version": lobby_version})
+        assert [msg.type for msg in messages] == [ProtocolMessageType.GAMES, ProtocolMessageType.LOBBY_VERSION]
+        assert _games_in(messages) == [1, 2, 3]
+        assert messages[-1].parameters["lobby_version"] == 5
@@ -0,0 +1,59 @@
+"""
+The outbound queue of Client in server/client.py: what happens to the messages for a client that doesn't read.
+"""
+import pytest
+from server.client import Client, OutboundLane
+from common.constants import ServerConfig, OutboundPolicy
+from common.protocol import ProtocolMessage, ProtocolMessageType
+
+
+class FakeTransport:
+
+    def __init__(self) -> None:
+        self.aborted = False
+
+    def get_write_buffer_size(self) -> int:
+        # nothing was written, everything is still queued
+        return 0
+
+    def abort(self) -> None:
+        self.aborted = True
+
+
+class FakeWriter:
+
+    def __init__(self) -> None:
+        self.transport = FakeTransport()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(ServerConfig, "OUTBOUND_POLICY", OutboundPolicy.DROP)
+    monkeypatch.setattr(ServerConfig, "OUTBOUND_HIGH_WATERMARK", 100)
+    monkeypatch.setattr(ServerConfig, "OUTBOUND_HARD_LIMIT", 400)
+    return Client(writer=FakeWriter())
+
+
+def test_drop_lobby_messages(client):
+    chat: bytes = ProtocolMessage.create_single(ProtocolMessageType.CHAT_RECV, {
+        "sender": "ann", "recipient": "", "text": "x" * 40}).to_bytes()
+    while not client.is_congested:
+        client.enqueue(chat)
+    # the one that didn't fit anymore was dropped already
+    assert client.num_dropped == 1
+    size: int = client.outbound_size
+    client.enqueue(chat)
+    assert client.outbound_size == size
+    assert client.num_dropped == 2
+    assert not client.is_closing
+
+
+def test_disconnect_above_the_hard_limit(client):
+    # the game messages are queued while congested, but not without end
+    timeout: bytes = ProtocolMessage.create_single(ProtocolMessageType.TIMEOUT).to_bytes()
+    while not client.is_closing:
+        client.enqueue(timeout, OutboundLane.GAME)
+        assert client.outbound_size <= ServerConfig.OUTBOUND_HARD_LIMIT
+    assert client.is_congested
+    assert client.writer.transport.aborted
+    assert client.outbound_size == 0
@@ -0,0 +1,293 @@
+"""
+The ProtocolMessageDecoder of common/protocol.py: whatever chunks the bytes arrive in,
+it must return the messages that were sent. And the precompiled codecs, which must send
+and parse the bytes the protocol module of 6a0ecb8 did.
+"""
+import random
+import pytest
+from common.constants import GameOptions, EndGameReason, ErrorCode, Direction, Orientation
+from common.protocol import ProtocolMessage, ProtocolMessageType, ProtocolMessageDecoder, ProtocolMessageCodecs, \
+    ProtocolConstantMessages, ProtocolConfig, NumShips, Position, Positions, ShipPosition, ShipPositions
+
+ALL_TYPES = [msg_type for msg_type in ProtocolMessageType if not msg_type == ProtocolMessageType.NONE]
+
+
+def _random_messages(num_messages: int):
+    return [ProtocolMessage.random_from_type(random.choice(ALL_TYPES)) for _ in range(num_messages)]
+
+
+def _feed_in_chunks(decoder: ProtocolMessageDecoder, data: bytes, chunk_lengths):
+    messages = []
+    offset = 0
+    for chunk_length in chunk_lengths:
+        messages.extend(decoder.feed(data[offset:offset + chunk_length]))
+        offset += chunk_length
+    messages.extend(decoder.feed(data[offset:]))
+    return messages
+
+
+def _game(game_id: int, username: str):
+    return {"game_id": game_id, "username": username, "board_size": 10, "num_ships": NumShips([1, 2, 3, 4, 5]),
+            "round_time": 25, "options": 0}
+
+
+@pytest.mark.parametrize("msg_type", ALL_TYPES)
+def test_every_type(msg_type):
+    random.seed(msg_type)
+    for _ in range(20):
+        msg = ProtocolMessage.random_from_type(msg_type)
+        data = msg.to_bytes()
+        assert ProtocolMessageDecoder().feed(data) == [msg]
+        # and byte by byte
+        decoder = ProtocolMessageDecoder()
+        assert _feed_in_chunks(decoder, data, [1] * len(data)) == [msg]
+        assert len(decoder) == 0
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_arbitrary_chunks(seed):
+    random.seed(seed)
+    messages = _random_messages(50)
+    data = b''.join(msg.to_bytes() for msg in messages)
+    chunk_lengths = [random.choice([1, 2, 3, random.randrange(1, 100)]) for _ in range(len(data) // 10)]
+
+    decoder = ProtocolMessageDecoder()
+    frames = []
+    received = []
+    offset = 0
+    for chunk_length in chunk_lengths:
+        received.extend(decoder.feed(data[offset:offset + chunk_length], frames))
+        offset += chunk_length
+    received.extend(decoder.feed(data[offset:], frames))
+
+    assert received == messages
+    # the bytes of every message as they were sent
+    assert frames == [msg.to_bytes() for msg in messages]
+    assert len(decoder) == 0
+
+
+def test_incomplete_message_stays_buffered():
+    data = ProtocolMessage.create_single(ProtocolMessageType.LOGIN, {"username": "ben"}).to_bytes()
+    decoder = ProtocolMessageDecoder()
+    assert decoder.feed(data[:-1]) == []
+    assert len(decoder) == len(data) - 1
+    assert decoder.take_buffer() == data[:-1]
+    assert len(decoder) == 0
+
+
+def test_games_over_64k():
+    # every game takes 26 bytes, so this needs three GAMES messages
+    games = [_game(game_id, "user{:011}".format(game_id)) for game_id in range(6000)]
+    msg = ProtocolMessage.create_repeating(ProtocolMessageType.GAMES, games)
+    with pytest.raises(OverflowError):
+        msg.to_bytes()
+
+    data = b''.join(msg.encode_frames())
+    decoder = ProtocolMessageDecoder()
+    frames = []
+    received = []
+    for offset in range(0, len(data), 1000):
+        received.extend(decoder.feed(data[offset:offset + 1000], frames))
+    assert [received_msg.type for received_msg in received] == [ProtocolMessageType.GAMES] * 3
+    assert all(len(frame) <= ProtocolMessageDecoder.HEADER_LENGTH + ProtocolConfig.PAYLOAD_MAX_LENGTH for frame in frames)
+    # every game exactly once, in order
+    assert [params for received_msg in received for params in received_msg.repeating_parameters] == games
+
+
+def test_empty_games():
+    data = ProtocolMessage.create_repeating(ProtocolMessageType.GAMES, []).to_bytes()
+    assert data == bytes([ProtocolMessageType.GAMES, 0, 0])
+    msg, = ProtocolMessageDecoder().feed(data)
+    assert msg.type == ProtocolMessageType.GAMES
+    assert msg.repeating_parameters == [{}]
+
+
+@pytest.mark.parametrize("msg_type, parameters", [
+    # a length field of 0
+    (ProtocolMessageType.CHAT_SEND, {"username": "", "text": "to everyone"}),
+    (ProtocolMessageType.CHAT_RECV, {"sender": "ben", "recipient": "", "text": "hi"}),
+    # implicit length fields, at the end and before fixed length fields
+    (ProtocolMessageType.LOGIN, {"username": "ben"}),
+    (ProtocolMessageType.GAME, _game(7, "ben")),
+    (ProtocolMessageType.STARTGAME, {"board_size": 10, "num_ships": NumShips([0, 0, 0, 0, 1]), "round_time": 30,
+                                     "opponent_name": "ann"}),
+    (ProtocolMessageType.MOVED, {"positions": Positions([Position(1, 2), Position(3, 4)])}),
+    # optional fields that are not there
+    (ProtocolMessageType.JOIN, {"game_id": 3}),
+    (ProtocolMessageType.JOIN, {"game_id": 3, "password": "secret"}),
+    (ProtocolMessageType.GET_GAMES, {}),
+    (ProtocolMessageType.GET_GAMES, {"lobby_version": 0}),
+    (ProtocolMessageType.MOVED, {}),
+])
+def test_empty_and_implicit_length_fields(msg_type, parameters):
+    msg = ProtocolMessage.create_single(msg_type, parameters)
+    received, = ProtocolMessageDecoder().feed(msg.to_bytes())
+    assert received == msg
+    assert not received.missing_or_unkown_param
+
+
+def test_unknown_type_is_skipped():
+    valid = ProtocolMessage.create_single(ProtocolMessageType.DELETE_GAME, {"game_id": 5})
+    # an unknown type and the NONE type with a payload, the payload is not parsed
+    data = bytes([200, 0, 4]) + b'junk' + bytes([ProtocolMessageType.NONE, 0, 2]) + b'\xff\xff' + valid.to_bytes()
+    decoder = ProtocolMessageDecoder()
+    received = _feed_in_chunks(decoder, data, [1] * 5)
+    assert [msg.type for msg in received] == [ProtocolMessageType.NONE, ProtocolMessageType.NONE, ProtocolMessageType.DELETE_GAME]
+    assert received[2] == valid
+    assert len(decoder) == 0
+
+
+@pytest.mark.parametrize("msg_type, payload", [
+    # too short for the fixed length fields
+    (ProtocolMessageType.DELETE_GAME, b'\x01'),
+    (ProtocolMessageType.GAME, b'\x00\x01'),
+    # a length field longer than the rest
+    (ProtocolMessageType.CHAT_SEND, b'\x09ab'),
+    # too long
+    (ProtocolMessageType.ENDGAME, b'\x01\x02'),
+    # a GET_GAMES with a lobby version that is too short
+    (ProtocolMessageType.GET_GAMES, b'\x00\x01'),
+])
+def test_garbage_payload(msg_type, payload):
+    # the message is handed on with what could be decoded, the ones after it are not affected
+    valid = ProtocolMessage.create_single(ProtocolMessageType.LOGIN, {"username": "ben"})
+    data = bytes([msg_type]) + len(payload).to_bytes(2, "big") + payload + valid.to_bytes()
+    received = ProtocolMessageDecoder().feed(data)
+    assert [msg.type for msg in received] == [msg_type, ProtocolMessageType.LOGIN]
+    assert received[1] == valid
+
+
+# the bytes the protocol module of 6a0ecb8 sent for these messages, before the precompiled codecs
+GOLDEN_MESSAGES = [
+    (ProtocolMessageType.CHAT_RECV, [{"sender": "ann", "recipient": "", "text": "hi all"}],
+     b'\x01\x00\x0b' b'\x03ann' b'\x00' b'hi all'),
+    (ProtocolMessageType.GAMES, [_game(1, "ann"), {"game_id": 258, "username": "ben", "board_size": 26, "num_ships": NumShips([0, 0, 1, 0, 2]),
+                                                   "round_time": 60, "options": GameOptions.PASSWORD}],
+     b'\x02\x00\x1c' b'\x00\x01\x03ann\x0a\x01\x02\x03\x04\x05\x19\x00' b'\x01\x02\x03ben\x1a\x00\x00\x01\x00\x02\x3c\x80'),
+    (ProtocolMessageType.GAME, [_game(7, "ben")],
+     b'\x03\x00\x0d' b'\x00\x07ben\x0a\x01\x02\x03\x04\x05\x19\x00'),
+    (ProtocolMessageType.DELETE_GAME, [{"game_id": 513}],
+     b'\x04\x00\x02' b'\x02\x01'),
+    (ProtocolMessageType.LOGIN, [{"username": "ben"}],
+     b'\x33\x00\x03' b'ben'),
+    (ProtocolMessageType.LOGOUT, [{}],
+     b'\x34\x00\x00'),
+    (ProtocolMessageType.CHAT_SEND, [{"username": "ann", "text": "hello"}],
+     b'\x35\x00\x09' b'\x03ann' b'hello'),
+    (ProtocolMessageType.CHAT_SEND, [{"username": "", "text": "to everyone"}],
+     b'\x35\x00\x0c' b'\x00' b'to everyone'),
+    (ProtocolMessageType.CREATE_GAME, [{"board_size": 12, "num_ships": NumShips([1, 0, 0, 0, 2]), "round_time": 40,
+                                        "options": GameOptions.PASSWORD, "password": "pw"}],
+     b'\x36\x00\x0a' b'\x0c\x01\x00\x00\x00\x02\x28\x80' b'pw'),
+    # the password is only allowed to be missing without the password option
+    (ProtocolMessageType.CREATE_GAME, [{"board_size": 12, "num_ships": NumShips([1, 0, 0, 0, 2]), "round_time": 40, "options": 0}],
+     b'\x36\x00\x08' b'\x0c\x01\x00\x00\x00\x02\x28\x00'),
+    (ProtocolMessageType.CANCEL, [{}],
+     b'\x37\x00\x00'),
+    (ProtocolMessageType.JOIN, [{"game_id": 513, "password": "secret"}],
+     b'\x38\x00\x08' b'\x02\x01' b'secret'),
+    (ProtocolMessageType.JOIN, [{"game_id": 513}],
+     b'\x38\x00\x02' b'\x02\x01'),
+    (ProtocolMessageType.GET_GAMES, [{}],
+     b'\x39\x00\x00'),
+    (ProtocolMessageType.STARTGAME, [{"board_size": 10, "num_ships": NumShips([0, 0, 0, 0, 1]), "round_time": 30, "opponent_name": "ann"}],
+     b'\x65\x00\x0a' b'\x0a\x00\x00\x00\x00\x01\x1e' b'ann'),
+    (ProtocolMessageType.PLACED, [{}],
+     b'\x66\x00\x00'),
+    (ProtocolMessageType.YOUSTART, [{}],
+     b'\x67\x00\x00'),
+    (ProtocolMessageType.WAIT, [{}],
+     b'\x68\x00\x00'),
+    (ProtocolMessageType.HIT, [{"sunk": 1, "position": Position(3, 4)}],
+     b'\x69\x00\x03' b'\x01\x03\x04'),
+    (ProtocolMessageType.FAIL, [{"position": Position(0, 9)}],
+     b'\x6a\x00\x02' b'\x00\x09'),
+    (ProtocolMessageType.MOVED, [{"positions": Positions([Position(1, 2), Position(3, 4)])}],
+     b'\x6b\x00\x04' b'\x01\x02\x03\x04'),
+    (ProtocolMessageType.TIMEOUT, [{}],
+     b'\x6c\x00\x00'),
+    (ProtocolMessageType.ENDGAME, [{"reason": EndGameReason.YOU_WON}],
+     b'\x6d\x00\x01' b'\x02'),
+    (ProtocolMessageType.PLACE, [{"ship_positions": ShipPositions([ShipPosition(Position(0, 1), Orientation.EAST),
+                                                                   ShipPosition(Position(5, 5), Orientation.NORTH)])}],
+     b'\x97\x00\x06' b'\x00\x01\x01\x05\x05\x00'),
+    (ProtocolMessageType.MOVE, [{"turn_counter": 7, "ship_id": 2, "direction": Direction.WEST}],
+     b'\x98\x00\x03' b'\x07\x02\x03'),
+    (ProtocolMessageType.SHOOT, [{"turn_counter": 7, "position": Position(3, 4)}],
+     b'\x99\x00\x03' b'\x07\x03\x04'),
+    (ProtocolMessageType.ABORT, [{}],
+     b'\x9a\x00\x00'),
+    (ProtocolMessageType.ERROR, [{"error_code": ErrorCode.PARAMETER_UNKNOWN_GAME_ID}],
+     b'\xff\x00\x01' b'\x68'),
+]
+
+
+class _Writer:
+
+    def __init__(self) -> None:
+        self.chunks = []
+        self.num_drains = 0
+
+    def write(self, data: bytes) -> None:
+        self.chunks.append(data)
+
+    async def drain(self) -> None:
+        self.num_drains += 1
+
+
+def _send(loop, msg: ProtocolMessage) -> bytes:
+    writer = _Writer()
+    loop.run_until_complete(msg.send(writer))
+    # the client's backpressure, every message is drained
+    assert writer.num_drains == 1
+    return b''.join(writer.chunks)
+
+
+def test_golden_messages_cover_every_type():
+    assert {msg_type for msg_type, _, _ in GOLDEN_MESSAGES} == set(ALL_TYPES) - {ProtocolMessageType.LOBBY_VERSION}
+
+
+@pytest.mark.parametrize("msg_type, repeating_parameters, data", GOLDEN_MESSAGES)
+def test_golden_messages(loop, msg_type, repeating_parameters, data):
+    msg = ProtocolMessage.create_repeating(msg_type, repeating_parameters)
+    assert msg.to_bytes() == data
+    assert _send(loop, msg) == data
+    assert b''.join(msg.encode_frames()) == data
+    # the payload alone
+    codec = ProtocolMessageCodecs[msg_type]
+    assert b''.join(codec.encode(parameters) for parameters in repeating_parameters) == data[3:]
+    assert ProtocolMessageDecoder().feed(data) == [msg]
+
+
+@pytest.mark.parametrize("msg", [ProtocolConstantMessages.get(ProtocolMessageType.TIMEOUT),
+                                 ProtocolConstantMessages.endgame(EndGameReason.YOU_WON),
+                                 ProtocolConstantMessages.error(ErrorCode.PARAMETER_UNKNOWN_GAME_ID)])
+def test_constant_messages(loop, msg):
+    # sent as they are, the same bytes as the message encoded anew
+    data = ProtocolMessage.create_repeating(msg.type, msg.repeating_parameters).to_bytes()
+    assert msg.to_bytes() == data
+    assert _send(loop, msg) == data
+
+
+def test_lobby_version():
+    # only in the extension of the RFC: GET_GAMES with a lobby version of 4 bytes, and LOBBY_VERSION
+    codec = ProtocolMessageCodecs[ProtocolMessageType.GET_GAMES]
+    assert codec.encode({}) == b''
+    assert codec.encode({"lobby_version": 2**32 - 1}) == b'\xff\xff\xff\xff'
+    assert codec.decode(b'\x00\x00\x01\x00') == [{"lobby_version": 256}]
+    assert ProtocolMessageCodecs[ProtocolMessageType.LOBBY_VERSION].decode(b'\x00\x00\x00\x07') == [{"lobby_version": 7}]
+
+
+def test_encode_errors():
+    with pytest.raises(AttributeError):
+        ProtocolMessageCodecs[ProtocolMessageType.CREATE_GAME].encode(
+            {"board_size": 12, "num_ships": NumShips([1, 0, 0, 0, 2]), "round_time": 40, "options": GameOptions.PASSWORD})
+    with pytest.raises(AttributeError):
+        ProtocolMessageCodecs[ProtocolMessageType.SHOOT].encode({"turn_counter": 1})
+    with pytest.raises(AttributeError):
+        ProtocolMessageCodecs[ProtocolMessageType.LOGIN].encode({})
+    # like int.to_bytes for values that don't fit into their field
+    with pytest.raises(OverflowError):
+        ProtocolMessageCodecs[ProtocolMessageType.DELETE_GAME].encode({"game_id": 65536})
+    with pytest.raises(OverflowError):
+        ProtocolMessageCodecs[ProtocolMessageType.GET_GAMES].encode({"lobby_version": 2**32})
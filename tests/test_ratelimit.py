@@ -0,0 +1,121 @@
+"""
+The token buckets and the rejection window of server/ratelimit.py, with a clock that only moves when told.
+"""
+import types
+import pytest
+from server import ratelimit
+from server.client import Client
+from server.ratelimit import TokenBucket, ClientLimits, RateLimiter
+from server.lobby import ServerLobbyController
+from common.constants import ErrorCode, MessageClass, ServerConfig
+from common.protocol import ProtocolMessage, ProtocolMessageType
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now: float = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", types.SimpleNamespace(monotonic=fake_clock))
+    return fake_clock
+
+
+class FakeClient(Client):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.sent = []
+
+    async def send(self, msg, lane=None):
+        self.sent.append(msg)
+
+    def close(self):
+        self.is_closing = True
+
+
+def test_burst(clock):
+    bucket = TokenBucket(2, 10)
+    assert [bucket.take(0.0) for _ in range(10)] == [0.0] * 10
+    assert bucket.take(0.0) == -1
+
+
+def test_refill(clock):
+    bucket = TokenBucket(2, 10)
+    for _ in range(10):
+        bucket.take(0.0)
+    clock.advance(0.5)
+    assert bucket.take(0.0) == 0.0
+    assert bucket.take(0.0) == -1
+    # never more than the burst size
+    clock.advance(60)
+    assert [bucket.take(0.0) for _ in range(10)] == [0.0] * 10
+    assert bucket.take(0.0) == -1
+
+
+def test_delay_up_to_the_max_delay(clock):
+    bucket = TokenBucket(10, 5)
+    for _ in range(5):
+        bucket.take(1.0)
+    # every waiting message waits for the ones before it
+    assert [bucket.take(1.0) for _ in range(10)] == pytest.approx([0.1 * n for n in range(1, 11)])
+    assert bucket.take(1.0) == -1
+    # a rejected message doesn't take a token
+    assert bucket.take(1.0) == -1
+    clock.advance(0.2)
+    assert bucket.take(1.0) == pytest.approx(0.9)
+
+
+def test_rejected_within_the_window(clock):
+    limits = ClientLimits()
+    assert [limits.rejected() for _ in range(5)] == [1, 2, 3, 4, 5]
+    clock.advance(ServerConfig.RATE_LIMIT_WINDOW)
+    assert limits.rejected() == 6
+    # a new window starts with the first rejection after it
+    clock.advance(0.1)
+    assert limits.rejected() == 1
+    assert limits.rejected() == 2
+
+
+def test_disconnect_after_too_many_rejections(loop, clock):
+    rate_limiter = RateLimiter()
+    client = FakeClient()
+    handled = []
+
+    async def handler(client, msg):
+        handled.append(msg)
+
+    async def chat(num_messages: int):
+        msg = ProtocolMessage.create_single(ProtocolMessageType.CHAT_SEND, {"username": "", "text": "spam"})
+        for _ in range(num_messages):
+            await rate_limiter(None, client, msg, handler)
+
+    burst = ServerConfig.RATE_LIMITS[MessageClass.CHAT][1]
+    loop.run_until_complete(chat(burst + ServerConfig.RATE_LIMIT_MAX_REJECTED - 1))
+    assert len(handled) == burst
+    assert [msg.parameters["error_code"] for msg in client.sent] == [ErrorCode.ILLEGAL_STATE_TOO_MANY_MESSAGES] * (ServerConfig.RATE_LIMIT_MAX_REJECTED - 1)
+    assert not client.is_closing
+
+    loop.run_until_complete(chat(1))
+    assert client.is_closing
+    assert rate_limiter.num_disconnected == 1
+    # the rest of what it sent is ignored
+    loop.run_until_complete(chat(5))
+    assert len(client.sent) == ServerConfig.RATE_LIMIT_MAX_REJECTED - 1
+    assert rate_limiter.num_disconnected == 1
+
+
+def test_off_by_default(loop):
+    # clients of the RFC don't know ILLEGAL_STATE_TOO_MANY_MESSAGES, the server must be started with --rate-limit
+    lobby = ServerLobbyController(loop)
+    assert lobby.rate_limiter is None
+    lobby.round_timers.close()
@@ -0,0 +1,114 @@
+"""
+The TimerWheel of server/timerwheel.py, ticked by hand instead of by the event loop.
+"""
+import math
+import pytest
+from server.timerwheel import TimerWheel
+
+
+class FakeHandle:
+
+    def __init__(self) -> None:
+        self.cancelled: bool = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class FakeLoop:
+
+    def call_later(self, delay, callback):
+        return FakeHandle()
+
+
+class Wheel:
+    """
+    A TimerWheel with a tick of one second and the expired keys with the tick they expired in.
+    """
+
+    def __init__(self) -> None:
+        self.expired = []
+        self.wheel = TimerWheel(FakeLoop(), self.expire)
+
+    def expire(self, keys) -> None:
+        self.expired.extend((key, self.wheel.current_tick) for key in keys)
+
+    def run(self, num_ticks: int) -> None:
+        for _ in range(num_ticks):
+            # the wheel only ticks while a timer is armed
+            if self.wheel.tick_handle is None:
+                return
+            self.wheel.tick()
+
+
+@pytest.mark.parametrize("delay", [0.5, 1, 25, 63, 64, 65, 100, 128, 129, 300.5])
+@pytest.mark.parametrize("start_tick", [0, 3, 63])
+def test_never_early(delay, start_tick):
+    w = Wheel()
+    w.wheel.current_tick = start_tick
+    w.wheel.arm("timer", delay)
+    w.run(1000)
+    assert len(w.expired) == 1
+    key, tick = w.expired[0]
+    ticks = tick - start_tick
+    # the first tick can come right after arming, the timer expires at the earliest after the other ticks
+    assert ticks - 1 >= delay
+    # and at most one tick after its time
+    assert ticks == max(1, math.ceil(delay)) + 1
+    assert len(w.wheel) == 0
+
+
+def test_beyond_one_turn_in_the_same_slot():
+    w = Wheel()
+    # both in the same slot, one and three turns of the wheel later
+    w.wheel.arm("soon", 10)
+    w.wheel.arm("later", 10 + 2 * 64)
+    w.run(11)
+    assert w.expired == [("soon", 11)]
+    w.run(1000)
+    assert w.expired == [("soon", 11), ("later", 11 + 2 * 64)]
+
+
+def test_cancel():
+    w = Wheel()
+    w.wheel.arm("timer", 5)
+    w.wheel.arm("other", 100)
+    w.run(2)
+    w.wheel.cancel("timer")
+    w.wheel.cancel("timer")
+    w.wheel.cancel("other")
+    assert len(w.wheel) == 0
+    w.run(1000)
+    assert w.expired == []
+    # no timer, no ticks
+    assert w.wheel.tick_handle is None
+    assert w.wheel.current_tick == 3
+
+
+def test_rearm():
+    w = Wheel()
+    w.wheel.arm("timer", 5)
+    w.run(4)
+    # replaces the timer, also with a time beyond one turn
+    w.wheel.arm("timer", 70)
+    assert len(w.wheel) == 1
+    w.run(1000)
+    assert w.expired == [("timer", 4 + 71)]
+
+
+def test_expire_together():
+    w = Wheel()
+    for key in range(5):
+        w.wheel.arm(key, 3)
+    w.wheel.arm("before", 2)
+    w.run(1000)
+    assert w.expired == [("before", 3)] + [(key, 4) for key in range(5)]
+
+
+def test_close():
+    w = Wheel()
+    w.wheel.arm("timer", 5)
+    handle = w.wheel.tick_handle
+    w.wheel.close()
+    assert handle.cancelled
+    assert w.wheel.tick_handle is None